@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.endpoints import portfolio, trading, strategies, market_data
+from app.api.endpoints import portfolio, trading, strategies, market_data, system
 
 api_router = APIRouter()
 
@@ -7,3 +7,4 @@ api_router.include_router(portfolio.router, prefix="/portfolio", tags=["portfoli
 api_router.include_router(trading.router, prefix="/trading", tags=["trading"])
 api_router.include_router(strategies.router, prefix="/strategies", tags=["strategies"])
 api_router.include_router(market_data.router, prefix="/market-data", tags=["market-data"])
+api_router.include_router(system.router, prefix="/system", tags=["system"])
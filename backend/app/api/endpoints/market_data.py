@@ -1,48 +1,268 @@
 """Market data endpoints."""
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime, timedelta
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from pydantic import BaseModel
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+from typing import Dict, List, Optional
+import uuid
+
+import numpy as np
 
 from app.models.trading import MarketData
-from app.core.database import get_db
+from app.core.database import get_async_db
+from app.core.config import settings
+from app.services.aggregation import TIMEFRAME_MINUTES, read_resampled
+from app.services.bar_store import Bars, bar_store
+from app.services.cache import response_cache
+from app.services.gateway import GatewayError, gateway_client
+from app.services.ingestion import ingestion_service
+from app.services.jobs import job_store
 
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Smallest step of the stored timestamps, used to turn exclusive cursors into inclusive bounds
+_TICK = timedelta(microseconds=1)
+
+# Fields of a bar in a response, in order
+BAR_COLUMNS = ("timestamp", "open", "high", "low", "close", "volume")
+
+
+def _isoformat(timestamp) -> str:
+    if isinstance(timestamp, np.datetime64):
+        timestamp = timestamp.item()
+    return timestamp.isoformat()
+
+
+def _in_store(symbol: str, timeframe: str, exchange: Optional[str]) -> bool:
+    """Whether the bar store's series may answer for ``exchange``, as the database filter would."""
+    stored = bar_store.exchange(symbol, timeframe)
+    return not exchange or stored is None or stored == exchange
+
+
+async def _partial_bar(symbol: str, timeframe: str) -> Optional[Dict]:
+    """The bar still forming in the gateway's aggregator, if any."""
+    try:
+        partial = await gateway_client.call("aggregation.partial", symbol, timeframe)
+    except GatewayError as e:
+        logger.warning(f"No in-progress {timeframe} bar for {symbol}: {e}")
+        return None
+    if partial and isinstance(partial["timestamp"], str):
+        # Timestamps arrive as ISO strings from the gateway
+        partial["timestamp"] = datetime.fromisoformat(partial["timestamp"])
+    return partial
+
+
+def _session_exchange(symbol: str) -> Optional[str]:
+    """Exchange whose session hours bucket ``symbol``: as ingested, else from ``TRADING_UNIVERSE``."""
+    exchange = bar_store.exchange(symbol, settings.BASE_TIMEFRAME)
+    if exchange:
+        return exchange
+    for exchange, symbols in settings.TRADING_UNIVERSE.items():
+        if symbol in symbols:
+            return exchange
+    return None
+
+
+class BackfillRequest(BaseModel):
+    symbols: List[str]
+    exchange: str
+    timeframe: str = "1d"
+    start: datetime
+    end: Optional[datetime] = None
+    source: str = "yfinance"  # yfinance or ib
+
+
+async def _run_backfill(job: Dict, request: BackfillRequest):
+    job["status"] = "running"
+    await job_store.save("backfill", job)
+    job["counts"] = await ingestion_service.backfill(
+        request.symbols, request.exchange, request.timeframe, request.start, request.end, request.source
+    )
+    failed = [s for s, count in job["counts"].items() if count < 0]
+    job["status"] = "failed" if failed and len(failed) == len(request.symbols) else "completed"
+    job["failed"] = failed
+    await job_store.save("backfill", job)
+
+
+@router.post("/backfill")
+async def backfill_market_data(request: BackfillRequest, background_tasks: BackgroundTasks):
+    """Start a background historical backfill for a set of symbols."""
+
+    if request.source not in ("yfinance", "ib"):
+        raise HTTPException(status_code=400, detail="Unknown source")
+
+    job = {"id": uuid.uuid4().hex, "status": "pending", "symbols": len(request.symbols)}
+    # Stored before answering so a poll reaching another worker finds it
+    await job_store.save("backfill", job)
+    background_tasks.add_task(_run_backfill, job, request)
+    return {"job_id": job["id"], "status": "pending"}
+
+
+@router.get("/backfill/{job_id}")
+async def get_backfill(job_id: str):
+    """Return the status of a backfill job."""
+
+    job = await job_store.get("backfill", job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Backfill job not found")
+    return job
+
 
 @router.get("/{symbol}")
 async def get_market_data(
     symbol: str,
-    exchange: str,
+    exchange: Optional[str] = None,
     timeframe: str = "1h",
     limit: int = 100,
-    db: Session = Depends(get_db),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    before: Optional[datetime] = None,
+    after: Optional[datetime] = None,
+    format: str = "rows",
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Return recent market data for a symbol.
+    """Return market data for a symbol.
+
+    Data is returned in chronological order. By default the most recent
+    ``limit`` bars in ``[start, end]`` are returned. For keyset pagination
+    pass ``before`` (exclusive) to page back in time, or ``after``
+    (exclusive) to page forward; the cursor for the next page is returned
+    in the ``X-Next-Before`` / ``X-Next-After`` header when more bars may
+    follow.
+
+    Bars are served from the columnar bar store when it has the symbol
+    (ingested for ``exchange``, if one is given),
+    otherwise from the database. Timeframes above the base 1m series that
+    are not stored are aggregated from 1m bars on the fly, with the live
+    in-progress bar appended. Buckets follow the session hours of
+    ``exchange``; without one, the exchange the bars were ingested for or
+    the symbol's ``TRADING_UNIVERSE`` entry is used.
+
+    With ``format=columns`` the bars come back as one array per field,
+    ``{"symbol": ..., "timestamp": [...], "open": [...], ...}``, which is
+    smaller and cheaper to encode for charting clients.
 
-    Data is returned in chronological order.
+    Responses are cached until bars for the symbol are next ingested, or
+    for ``CACHE_LIVE_TTL`` when they include the in-progress bar.
     """
 
-    query = (
-        db.query(MarketData)
-        .filter(MarketData.symbol == symbol, MarketData.timeframe == timeframe)
-        .order_by(MarketData.timestamp.desc())
-        .limit(limit)
+    namespace = f"market_data:{symbol}"
+    key = response_cache.key(
+        namespace, exchange=exchange, timeframe=timeframe, limit=limit,
+        start=start, end=end, before=before, after=after, format=format,
     )
+    cached = await response_cache.get(namespace, key)
+    if cached is not None:
+        return cached
 
-    rows: List[MarketData] = query.all()
-    # Reverse to chronological order
-    rows.reverse()
-    return [
-        {
-            "symbol": row.symbol,
-            "timestamp": row.timestamp,
-            "open": row.open_price,
-            "high": row.high_price,
-            "low": row.low_price,
-            "close": row.close_price,
-            "volume": row.volume,
+    if format not in ("rows", "columns"):
+        raise HTTPException(status_code=400, detail="format must be rows or columns")
+
+    forward = after is not None
+    if before is not None:
+        end = min(end, before - _TICK) if end else before - _TICK
+    if after is not None:
+        start = max(start, after + _TICK) if start else after + _TICK
+
+    if _in_store(symbol, timeframe, exchange):
+        bars = bar_store.read(symbol, timeframe, start, end, limit=limit, newest=not forward)
+    else:
+        bars = Bars.empty()
+    derived = (
+        not len(bars)
+        and timeframe in TIMEFRAME_MINUTES
+        and timeframe != settings.BASE_TIMEFRAME
+        and bar_store.last_timestamp(symbol, settings.BASE_TIMEFRAME) is not None
+        and _in_store(symbol, settings.BASE_TIMEFRAME, exchange)
+    )
+    if derived:
+        session = exchange or _session_exchange(symbol)
+        if not session:
+            raise HTTPException(
+                status_code=400, detail=f"exchange is required to aggregate {timeframe} bars for {symbol}"
+            )
+        bars = read_resampled(
+            bar_store, symbol, session, timeframe, start, end, limit=limit, newest=not forward
+        )
+        partial = await _partial_bar(symbol, timeframe) if not forward and end is None else None
+        if partial and not forward and end is None and (
+            not len(bars) or partial["timestamp"] > bars.index[-1].to_pydatetime()
+        ):
+            bars = bars[1:] if len(bars) >= limit else bars
+            extra = [(partial["timestamp"], partial["open"], partial["high"],
+                      partial["low"], partial["close"], partial["volume"])]
+        else:
+            extra = []
+    else:
+        extra = []
+
+    if len(bars) or extra:
+        # Arrays go to the encoder as they are; no per-row Python objects on this path
+        columns = {
+            "timestamp": np.asarray(bars.index.values.astype("datetime64[us]")),
+            **{name: np.asarray(getattr(bars, name)) for name in BAR_COLUMNS[1:]},
         }
-        for row in rows
-    ]
+        if extra:
+            timestamp, *values = extra[0]
+            columns["timestamp"] = np.append(columns["timestamp"], np.datetime64(timestamp, "us"))
+            for name, value in zip(BAR_COLUMNS[1:], values):
+                columns[name] = np.append(columns[name], value)
+    else:
+        query = select(
+            MarketData.timestamp,
+            MarketData.open_price,
+            MarketData.high_price,
+            MarketData.low_price,
+            MarketData.close_price,
+            MarketData.volume,
+        ).where(MarketData.symbol == symbol, MarketData.timeframe == timeframe)
+        if exchange:
+            # Bars stored before the exchange column existed have no exchange
+            query = query.where(or_(MarketData.exchange == exchange, MarketData.exchange.is_(None)))
+        if start is not None:
+            query = query.where(MarketData.timestamp >= start)
+        if end is not None:
+            query = query.where(MarketData.timestamp <= end)
+
+        if forward:
+            query = query.order_by(MarketData.timestamp.asc()).limit(limit)
+            rows = (await db.execute(query)).all()
+        else:
+            query = query.order_by(MarketData.timestamp.desc()).limit(limit)
+            rows = (await db.execute(query)).all()
+            # Reverse to chronological order
+            rows.reverse()
+        columns = dict(zip(BAR_COLUMNS, map(list, zip(*rows)))) if rows else {name: [] for name in BAR_COLUMNS}
+
+    headers = {}
+    timestamps = columns["timestamp"]
+    if len(timestamps) and len(timestamps) == limit:
+        if forward:
+            headers["X-Next-After"] = _isoformat(timestamps[-1])
+        else:
+            headers["X-Next-Before"] = _isoformat(timestamps[0])
+
+    if format == "columns":
+        data = {"symbol": symbol, **columns}
+    else:
+        values = [c.tolist() if isinstance(c, np.ndarray) else c for c in columns.values()]
+        data = [
+            {
+                "symbol": symbol,
+                "timestamp": ts,
+                "open": o,
+                "high": h,
+                "low": l,
+                "close": c,
+                "volume": v,
+            }
+            for ts, o, h, l, c, v in zip(*values)
+        ]
+    return await response_cache.put(
+        namespace, key, data, ttl=settings.CACHE_LIVE_TTL if extra else None, headers=headers
+    )
@@ -1,72 +1,58 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.models.trading import Portfolio, Position, Trade
-from app.core.database import get_db
-from typing import List
-import json
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.trading import Trade
+from app.core.database import get_async_db
+from app.core.serialization import json_response
+from app.services.cache import response_cache
+from app.services.gateway import gateway_client
 
 router = APIRouter()
 
+# Trade fields in a response, selected as plain column tuples
+TRADE_COLUMNS = {
+    "id": Trade.id,
+    "symbol": Trade.symbol,
+    "exchange": Trade.exchange,
+    "side": Trade.side,
+    "quantity": Trade.quantity,
+    "price": Trade.price,
+    "commission": Trade.commission,
+    "strategy": Trade.strategy,
+    "executed_at": Trade.executed_at,
+}
+
+async def _book(part: str):
+    result = await gateway_client.call(f"portfolio.{part}")
+    if result is None:
+        raise HTTPException(status_code=503, detail="Portfolio unavailable")
+    return result
+
 @router.get("/summary")
-async def get_portfolio_summary(db: Session = Depends(get_db)):
-    """Get portfolio summary with current positions and P&L"""
-    portfolio = db.query(Portfolio).first()
-    if not portfolio:
-        # Create default portfolio
-        portfolio = Portfolio(name="Main Portfolio", cash_balance=100000.0)
-        db.add(portfolio)
-        db.commit()
-        db.refresh(portfolio)
-    
-    positions = db.query(Position).filter(Position.portfolio_id == portfolio.id).all()
-    
-    total_market_value = sum(pos.market_value for pos in positions)
-    total_unrealized_pnl = sum(pos.unrealized_pnl for pos in positions)
-    
-    return {
-        "portfolio_id": portfolio.id,
-        "total_value": portfolio.cash_balance + total_market_value,
-        "cash_balance": portfolio.cash_balance,
-        "market_value": total_market_value,
-        "unrealized_pnl": total_unrealized_pnl,
-        "positions_count": len(positions),
-        "updated_at": portfolio.updated_at
-    }
+async def get_portfolio_summary():
+    """Get portfolio summary with current positions and P&L
+
+    Served from the live valuation, which is re-marked on every quote.
+    """
+    return await _book("summary")
 
 @router.get("/positions")
-async def get_positions(db: Session = Depends(get_db)):
+async def get_positions():
     """Get all current positions"""
-    positions = db.query(Position).all()
-    return [
-        {
-            "id": pos.id,
-            "symbol": pos.symbol,
-            "exchange": pos.exchange,
-            "quantity": pos.quantity,
-            "avg_price": pos.avg_price,
-            "current_price": pos.current_price,
-            "market_value": pos.market_value,
-            "unrealized_pnl": pos.unrealized_pnl,
-            "pnl_percentage": (pos.unrealized_pnl / (pos.avg_price * pos.quantity)) * 100 if pos.quantity > 0 else 0
-        }
-        for pos in positions
-    ]
+    return json_response(await _book("positions"))
 
 @router.get("/trades")
-async def get_trades(limit: int = 50, db: Session = Depends(get_db)):
-    """Get recent trades"""
-    trades = db.query(Trade).order_by(Trade.executed_at.desc()).limit(limit).all()
-    return [
-        {
-            "id": trade.id,
-            "symbol": trade.symbol,
-            "exchange": trade.exchange,
-            "side": trade.side,
-            "quantity": trade.quantity,
-            "price": trade.price,
-            "commission": trade.commission,
-            "strategy": trade.strategy,
-            "executed_at": trade.executed_at
-        }
-        for trade in trades
-    ]
+async def get_trades(limit: int = 50, db: AsyncSession = Depends(get_async_db)):
+    """Get recent trades
+
+    Cached until the next batch of fills is recorded.
+    """
+    key = response_cache.key("trades", limit=limit)
+    cached = await response_cache.get("trades", key)
+    if cached is not None:
+        return cached
+
+    query = select(*TRADE_COLUMNS.values()).order_by(Trade.executed_at.desc()).limit(limit)
+    rows = (await db.execute(query)).all()
+    names = tuple(TRADE_COLUMNS)
+    return await response_cache.put("trades", key, [dict(zip(names, row)) for row in rows])
@@ -1,32 +1,57 @@
 """Endpoints for managing trading strategies."""
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from datetime import datetime
+import json
+import logging
+from typing import Dict, List, Optional
+import uuid
 
-from app.core.database import get_db
+import anyio
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.backtest.engine import load_bars, run_backtest, save_results
+from app.backtest.optimizer import DEFAULT_SPACES, METHODS, OBJECTIVES, grid, optimize, random_sample
+from app.core.database import SessionLocal, get_async_db
 from app.models.trading import Strategy
+from app.services.bar_store import bar_store
+from app.services.cache import response_cache
+from app.services.gateway import gateway_client
+from app.services.jobs import job_store
+from app.strategies.registry import RUNTIME_PARAMETERS, build_strategy, strategy_type
+
+logger = logging.getLogger(__name__)
 
 
 router = APIRouter()
 
+# Strategy fields in the list response, selected as plain column tuples
+STRATEGY_COLUMNS = {
+    "id": Strategy.id,
+    "name": Strategy.name,
+    "description": Strategy.description,
+    "is_active": Strategy.is_active,
+    "parameters": Strategy.parameters,
+    "performance_metrics": Strategy.performance_metrics,
+    "created_at": Strategy.created_at,
+    "updated_at": Strategy.updated_at,
+}
+
 
 @router.get("/")
-async def list_strategies(db: Session = Depends(get_db)):
+async def list_strategies(db: AsyncSession = Depends(get_async_db)):
     """List all strategies."""
-    strategies = db.query(Strategy).all()
-    return [
-        {
-            "id": s.id,
-            "name": s.name,
-            "description": s.description,
-            "is_active": s.is_active,
-            "parameters": s.parameters,
-            "performance_metrics": s.performance_metrics,
-            "created_at": s.created_at,
-            "updated_at": s.updated_at,
-        }
-        for s in strategies
-    ]
+    key = response_cache.key("strategies")
+    cached = await response_cache.get("strategies", key)
+    if cached is not None:
+        return cached
+
+    rows = (await db.execute(select(*STRATEGY_COLUMNS.values()))).all()
+    names = tuple(STRATEGY_COLUMNS)
+    return await response_cache.put("strategies", key, [dict(zip(names, row)) for row in rows])
 
 
 @router.post("/")
@@ -34,7 +59,7 @@ async def create_strategy(
     name: str,
     description: str = "",
     parameters: str = "{}",
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Create a new strategy."""
 
@@ -44,22 +69,32 @@ async def create_strategy(
         parameters=parameters,
     )
     db.add(strategy)
-    db.commit()
-    db.refresh(strategy)
+    await db.commit()
+    await db.refresh(strategy)
+    await response_cache.invalidate("strategies")
+    await gateway_client.notify("strategies.reload")
     return {"id": strategy.id}
 
 
+@router.get("/live")
+async def live_status():
+    """Strategies running on live bars, with per-bar latency."""
+    return await gateway_client.call("strategies.live")
+
+
 @router.patch("/{strategy_id}")
-async def update_strategy(strategy_id: int, is_active: bool, db: Session = Depends(get_db)):
+async def update_strategy(strategy_id: int, is_active: bool, db: AsyncSession = Depends(get_async_db)):
     """Activate or deactivate a strategy."""
 
-    strategy = db.query(Strategy).get(strategy_id)
+    strategy = await db.get(Strategy, strategy_id)
     if not strategy:
         raise HTTPException(status_code=404, detail="Strategy not found")
 
     strategy.is_active = is_active
-    db.commit()
-    db.refresh(strategy)
+    await db.commit()
+    await db.refresh(strategy)
+    await response_cache.invalidate("strategies")
+    await gateway_client.notify("strategies.reload")
     return {"id": strategy.id, "is_active": strategy.is_active}
 
 
@@ -69,30 +104,177 @@ async def edit_strategy(
     name: str,
     description: str,
     parameters: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Update strategy details."""
 
-    strategy = db.query(Strategy).get(strategy_id)
+    strategy = await db.get(Strategy, strategy_id)
     if not strategy:
         raise HTTPException(status_code=404, detail="Strategy not found")
 
     strategy.name = name
     strategy.description = description
     strategy.parameters = parameters
-    db.commit()
-    db.refresh(strategy)
+    await db.commit()
+    await db.refresh(strategy)
+    await response_cache.invalidate("strategies")
+    await gateway_client.notify("strategies.reload")
     return {"id": strategy.id}
 
 
 @router.delete("/{strategy_id}")
-async def delete_strategy(strategy_id: int, db: Session = Depends(get_db)):
+async def delete_strategy(strategy_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a strategy."""
 
-    strategy = db.query(Strategy).get(strategy_id)
+    strategy = await db.get(Strategy, strategy_id)
     if not strategy:
         raise HTTPException(status_code=404, detail="Strategy not found")
 
-    db.delete(strategy)
-    db.commit()
+    await db.delete(strategy)
+    await db.commit()
+    await response_cache.invalidate("strategies")
+    await gateway_client.notify("strategies.reload")
     return {"status": "deleted"}
+
+
+@router.post("/{strategy_id}/backtest")
+async def backtest_strategy(
+    strategy_id: int,
+    symbols: List[str] = Query(...),
+    timeframe: str = "1d",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    commission: float = 0.001,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Backtest a strategy over stored market data and save its metrics."""
+
+    strategy = await db.get(Strategy, strategy_id)
+    if not strategy:
+        raise HTTPException(status_code=404, detail="Strategy not found")
+
+    try:
+        instance = build_strategy(strategy.name, strategy.parameters)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    result = await run_in_threadpool(
+        _run_backtest, strategy_id, instance, symbols, timeframe, start, end, commission
+    )
+    await response_cache.invalidate("strategies")
+    return {"id": strategy.id, "metrics": result.metrics}
+
+
+def _run_backtest(strategy_id: int, instance, symbols, timeframe, start, end, commission):
+    # The backtest is CPU and bulk-read bound; it runs on a worker thread with its own sync session
+    db = SessionLocal()
+    try:
+        result = run_backtest(db, instance, symbols, timeframe, start, end, commission, store=bar_store)
+        save_results(db, db.get(Strategy, strategy_id), result)
+        return result
+    finally:
+        db.close()
+
+
+class OptimizeRequest(BaseModel):
+    symbols: List[str]
+    timeframe: str = "1d"
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    method: str = "grid"  # one of METHODS
+    samples: int = 50
+    space: Optional[Dict[str, List]] = None
+    objective: str = "sharpe_ratio"  # one of OBJECTIVES
+    commission: float = 0.001
+    apply: bool = False  # store the best parameters on the strategy
+
+
+def _save_job(job: Dict):
+    # Background tasks run on a worker thread; the job store lives on the event loop
+    anyio.from_thread.run(job_store.save, "optimization", job)
+
+
+def _run_optimization(job: Dict, strategy_id: int, kind: str, request: OptimizeRequest):
+    job["status"] = "running"
+    _save_job(job)
+    db = SessionLocal()
+    try:
+        space = request.space or DEFAULT_SPACES[kind]
+        if request.method == "random":
+            combos = random_sample(space, request.samples)
+        else:
+            combos = grid(space)
+        job["combinations"] = len(combos)
+        _save_job(job)
+
+        if all(bar_store.last_timestamp(s, request.timeframe) is not None for s in request.symbols):
+            _, close, volume = bar_store.read_panel(
+                request.symbols, request.timeframe, request.start, request.end
+            )
+        else:
+            _, close, volume = load_bars(
+                db, request.symbols, request.timeframe, request.start, request.end
+            )
+        results = optimize(
+            kind, close, volume, combos, request.timeframe, request.commission, request.objective
+        )
+        job["results"] = results[:20]
+        job["best"] = results[0] if results else None
+
+        if request.apply and results:
+            strategy = db.get(Strategy, strategy_id)
+            current = json.loads(strategy.parameters or "{}")
+            live = {k: current[k] for k in RUNTIME_PARAMETERS if k in current}
+            strategy.parameters = json.dumps({"type": kind, **live, **results[0]["params"]})
+            db.commit()
+            # Background tasks run on a worker thread; the cache and gateway clients live on the event loop
+            anyio.from_thread.run(response_cache.invalidate, "strategies")
+            anyio.from_thread.run(gateway_client.notify, "strategies.reload")
+        job["status"] = "completed"
+    except Exception as e:
+        logger.error(f"Optimization job {job['id']} failed: {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        db.close()
+    _save_job(job)
+
+
+@router.post("/{strategy_id}/optimize")
+async def optimize_strategy(
+    strategy_id: int,
+    request: OptimizeRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Start a background parameter sweep for a strategy."""
+
+    if request.method not in METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(METHODS)}")
+    if request.objective not in OBJECTIVES:
+        raise HTTPException(status_code=400, detail=f"objective must be one of {', '.join(OBJECTIVES)}")
+
+    strategy = await db.get(Strategy, strategy_id)
+    if not strategy:
+        raise HTTPException(status_code=404, detail="Strategy not found")
+
+    try:
+        kind = strategy_type(strategy.name, json.loads(strategy.parameters or "{}"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job = {"id": uuid.uuid4().hex, "strategy_id": strategy_id, "status": "pending"}
+    # Stored before answering so a poll reaching another worker finds it
+    await job_store.save("optimization", job)
+    background_tasks.add_task(_run_optimization, job, strategy_id, kind, request)
+    return {"job_id": job["id"], "status": "pending"}
+
+
+@router.get("/{strategy_id}/optimize/{job_id}")
+async def get_optimization(strategy_id: int, job_id: str):
+    """Return the status and results of an optimization job."""
+
+    job = await job_store.get("optimization", job_id)
+    if not job or job["strategy_id"] != strategy_id:
+        raise HTTPException(status_code=404, detail="Optimization job not found")
+    return job
@@ -0,0 +1,78 @@
+"""Operational endpoints."""
+
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from app.services.cache import response_cache
+from app.services.gateway import gateway_client
+
+
+router = APIRouter()
+
+
+@router.get("/cache")
+async def cache_stats():
+    """Whether this worker is using the response cache.
+
+    Hit, miss and error counts across all workers are the ``response_cache_*``
+    series on ``/metrics``.
+    """
+    return response_cache.info()
+
+
+class ReplayRequest(BaseModel):
+    symbols: List[str]
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    speed: Optional[float] = None  # 1 is real time, 0 as fast as possible; REPLAY_SPEED if unset
+    timeframe: Optional[str] = None
+
+
+@router.post("/replay")
+async def start_replay(request: ReplayRequest):
+    """Replay stored bars through the simulated broker, replacing any running replay."""
+    replay = await gateway_client.call(
+        "replay.start", request.symbols, request.start, request.end, request.speed, request.timeframe
+    )
+    if replay["status"] == "failed":
+        raise HTTPException(status_code=400, detail=replay["error"])
+    return replay
+
+
+@router.get("/replay")
+async def get_replay():
+    """Progress of the current or last replay."""
+    return await gateway_client.call("replay.status")
+
+
+@router.delete("/replay")
+async def stop_replay():
+    """Stop the running replay."""
+    return await gateway_client.call("replay.stop")
+
+
+class ProfilerRequest(BaseModel):
+    interval: Optional[float] = None  # seconds between samples; PROFILER_INTERVAL if unset
+    duration: Optional[float] = None  # seconds until it stops itself; at most PROFILER_MAX_DURATION
+
+
+@router.post("/profiler")
+async def start_profiler(request: ProfilerRequest):
+    """Start sampling the stacks of the process running the live services."""
+    return await gateway_client.call("profiler.start", request.interval, request.duration)
+
+
+@router.delete("/profiler")
+async def stop_profiler():
+    """Stop sampling; the samples stay available until the next start."""
+    return await gateway_client.call("profiler.stop")
+
+
+@router.get("/profiler", response_class=PlainTextResponse)
+async def profiler_report(limit: Optional[int] = None):
+    """Sampled stacks in the folded format (one ``frame;frame count`` line per stack) for flame graph tools."""
+    return PlainTextResponse(await gateway_client.call("profiler.report", limit))
@@ -1,13 +1,11 @@
 """Trading-related endpoints."""
 
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, List
+
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
 
-from app.brokers.interactive_brokers import ib_client
-from app.core.database import get_db
-from app.models.trading import Trade
+from app.services.gateway import gateway_client
 
 
 router = APIRouter()
@@ -28,34 +26,76 @@ class OrderRequest(BaseModel):
     strategy: str | None = None
 
 
+def _order_args(order: OrderRequest) -> Dict:
+    return {
+        "symbol": order.symbol,
+        "exchange": order.exchange,
+        "action": order.side,
+        "quantity": order.quantity,
+        "order_type": order.order_type,
+        "limit_price": order.limit_price,
+        "strategy": order.strategy,
+    }
+
+
 @router.post("/order")
-async def place_order(order: OrderRequest, db: Session = Depends(get_db)):
-    """Place an order via Interactive Brokers and record it."""
-
-    order_id = await ib_client.place_order(
-        order.symbol,
-        order.exchange,
-        order.side,
-        order.quantity,
-        order.order_type,
-        order.limit_price,
-    )
-
-    if order_id is None:
+async def place_order(order: OrderRequest):
+    """Place an order via Interactive Brokers.
+
+    The order is recorded as a trade once IB reports its fills.
+    """
+
+    [result] = await gateway_client.call("orders.submit", [_order_args(order)])
+
+    if result["rejected"]:
+        raise HTTPException(status_code=403, detail=result["rejected"])
+    if result["order_id"] is None:
         raise HTTPException(status_code=400, detail="Order placement failed")
 
-    trade = Trade(
-        portfolio_id=1,  # default portfolio
-        symbol=order.symbol,
-        exchange=order.exchange,
-        side=order.side,
-        quantity=order.quantity,
-        price=order.limit_price or 0.0,
-        strategy=order.strategy or "",
-        executed_at=datetime.utcnow(),
-    )
-    db.add(trade)
-    db.commit()
-    db.refresh(trade)
-
-    return {"order_id": order_id, "trade_id": trade.id}
+    return {"order_id": result["order_id"], "status": "submitted"}
+
+
+@router.post("/orders")
+async def place_orders(orders: List[OrderRequest]):
+    """Place a batch of orders (e.g. a rebalance) in one request to IB."""
+
+    placed = await gateway_client.call("orders.submit", [_order_args(o) for o in orders])
+    results = []
+    for o, result in zip(orders, placed):
+        order_id = result["order_id"]
+        if result["rejected"]:
+            results.append({"symbol": o.symbol, "order_id": None, "status": "rejected", "reason": result["rejected"]})
+        else:
+            status = "submitted" if order_id is not None else "failed"
+            results.append({"symbol": o.symbol, "order_id": order_id, "status": status})
+    return results
+
+
+@router.get("/orders/{order_id}")
+async def get_order(order_id: int):
+    """Status and fill progress of an order placed through the API."""
+
+    order = await gateway_client.call("orders.get", order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+
+@router.get("/risk")
+async def get_risk_state():
+    """Live risk state: equity, intraday P&L, limits, positions and halt status."""
+    return await gateway_client.call("risk.state")
+
+
+@router.post("/risk/halt")
+async def halt_trading(reason: str = "manual"):
+    """Stop accepting orders, except ones that reduce a position."""
+    await gateway_client.call("risk.halt", reason)
+    return {"halted": True, "reason": reason}
+
+
+@router.post("/risk/resume")
+async def resume_trading():
+    """Accept orders again after a halt."""
+    await gateway_client.call("risk.resume")
+    return {"halted": False}
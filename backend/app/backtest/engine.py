@@ -0,0 +1,245 @@
+"""Vectorized backtesting over stored market data.
+
+Signals for the whole history are computed at once with the strategies'
+``signal_matrix`` and turned into long/flat positions without a per-bar
+Python loop. Symbols are processed in column chunks so long minute-bar
+histories for large universes stay within memory.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+import json
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.models.trading import MarketData, Strategy
+from app.strategies.base_strategy import BaseStrategy
+from app.strategies.vectorized import BUY
+
+logger = logging.getLogger(__name__)
+
+
+# Bars per trading year, used to annualize Sharpe ratios
+PERIODS_PER_YEAR = {
+    "1m": 252 * 390,
+    "5m": 252 * 78,
+    "1h": 252 * 7,
+    "1d": 252,
+}
+
+
+@dataclass
+class BacktestResult:
+    timestamps: np.ndarray
+    equity: np.ndarray
+    returns: np.ndarray
+    metrics: Dict
+    symbol_metrics: Dict[str, Dict] = field(default_factory=dict)
+
+    def equity_curve(self) -> pd.Series:
+        return pd.Series(self.equity, index=pd.DatetimeIndex(self.timestamps), name="equity")
+
+
+def load_bars(
+    db: Session,
+    symbols: List[str],
+    timeframe: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = 100000,
+):
+    """Load close/volume matrices for ``symbols`` aligned on timestamp.
+
+    Only the needed columns are selected, as tuples rather than ORM objects,
+    and rows are streamed ``batch_size`` at a time in timestamp order: each
+    batch is pivoted to the (timestamp x symbol) layout straight away and
+    covers its own run of timestamps, so only the matrices and one batch of
+    rows are ever held. Missing bars are forward filled so a
+    symbol that did not trade keeps its last price; bars before a symbol's
+    first trade take its first price.
+    """
+    query = db.query(
+        MarketData.timestamp, MarketData.symbol, MarketData.close_price, MarketData.volume
+    ).filter(MarketData.symbol.in_(symbols), MarketData.timeframe == timeframe)
+    if start is not None:
+        query = query.filter(MarketData.timestamp >= start)
+    if end is not None:
+        query = query.filter(MarketData.timestamp <= end)
+    # Rows come back in ingestion order otherwise, one symbol after another, and every
+    # batch would span the whole date range
+    query = query.order_by(MarketData.timestamp, MarketData.symbol)
+
+    closes, volumes = [], []
+    rows = []
+    for row in query.yield_per(batch_size):
+        rows.append(row)
+        if len(rows) >= batch_size:
+            _pivot_rows(rows, closes, volumes)
+            rows = []
+    if rows or not closes:
+        _pivot_rows(rows, closes, volumes)
+
+    # Only a timestamp straddling two batches appears twice; keep its last value per symbol
+    close = pd.concat(closes).groupby(level=0).last() if len(closes) > 1 else closes[0]
+    volume = pd.concat(volumes).groupby(level=0).last() if len(volumes) > 1 else volumes[0]
+    close = close.reindex(columns=symbols).sort_index().ffill().bfill()
+    volume = volume.reindex(index=close.index, columns=symbols).fillna(0)
+    return close.index.to_numpy(), close.to_numpy(dtype=np.float64), volume.to_numpy(dtype=np.float64)
+
+
+def _pivot_rows(rows, closes: List[pd.DataFrame], volumes: List[pd.DataFrame]):
+    df = pd.DataFrame(rows, columns=["timestamp", "symbol", "close", "volume"])
+    closes.append(df.pivot_table(index="timestamp", columns="symbol", values="close", aggfunc="last"))
+    volumes.append(df.pivot_table(index="timestamp", columns="symbol", values="volume", aggfunc="last"))
+
+
+def positions_from_signals(signal: np.ndarray) -> np.ndarray:
+    """Long after a BUY until the next SELL, flat otherwise."""
+    rows = np.arange(signal.shape[0])[:, None]
+    last_signal_row = np.where(signal != 0, rows, 0)
+    np.maximum.accumulate(last_signal_row, axis=0, out=last_signal_row)
+    last = np.take_along_axis(signal, last_signal_row, axis=0)
+    return (last == BUY).astype(np.float64)
+
+
+def simulate(close: np.ndarray, signal: np.ndarray, commission: float):
+    """Per-symbol strategy returns for a chunk of columns.
+
+    Positions are entered on the close of the signal bar and earn the next
+    bar's return. Commission is charged as a fraction of traded notional on
+    every position change.
+    """
+    position = positions_from_signals(signal)
+    held = np.zeros_like(position)
+    held[1:] = position[:-1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bar_returns = np.zeros_like(close)
+        bar_returns[1:] = close[1:] / close[:-1] - 1.0
+    bar_returns[~np.isfinite(bar_returns)] = 0.0
+
+    turnover = np.abs(np.diff(position, axis=0, prepend=0.0))
+    returns = held * bar_returns - turnover * commission
+    return returns, turnover
+
+
+def max_drawdown(equity: np.ndarray) -> float:
+    if len(equity) == 0:
+        return 0.0
+    peak = np.maximum.accumulate(equity)
+    return float(np.max((peak - equity) / peak))
+
+
+def sharpe_ratio(returns: np.ndarray, periods_per_year: int) -> float:
+    std = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    if not std:
+        return 0.0
+    return float(returns.mean() / std * np.sqrt(periods_per_year))
+
+
+def summarize(returns: np.ndarray, periods_per_year: int, initial_capital: float = 1.0) -> Dict:
+    equity = initial_capital * np.cumprod(1.0 + returns)
+    return {
+        "total_return": float(equity[-1] / initial_capital - 1.0) if len(equity) else 0.0,
+        "sharpe_ratio": sharpe_ratio(returns, periods_per_year),
+        "max_drawdown": max_drawdown(equity),
+    }
+
+
+def backtest_arrays(
+    strategy: BaseStrategy,
+    symbols: List[str],
+    timestamps: np.ndarray,
+    close: np.ndarray,
+    volume: np.ndarray,
+    timeframe: str = "1d",
+    commission: float = 0.001,
+    initial_capital: float = 100000.0,
+    chunk_size: int = 64,
+) -> BacktestResult:
+    """Backtest ``strategy`` over aligned (time x symbol) matrices.
+
+    Capital is split equally across symbols. The signal computation and
+    fill simulation run column chunk by column chunk.
+    """
+    periods = PERIODS_PER_YEAR.get(timeframe, 252)
+    portfolio_returns = np.zeros(close.shape[0])
+    symbol_metrics = {}
+
+    for lo in range(0, len(symbols), chunk_size):
+        hi = min(lo + chunk_size, len(symbols))
+        # Column-major chunks keep the axis-0 rolling sums on contiguous memory
+        chunk_close = np.asfortranarray(close[:, lo:hi])
+        chunk_volume = np.asfortranarray(volume[:, lo:hi])
+        signal, _ = strategy.signal_matrix(chunk_close, chunk_volume)
+        returns, turnover = simulate(chunk_close, signal, commission)
+        portfolio_returns += returns.sum(axis=1)
+
+        trades = (turnover > 0).sum(axis=0)
+        for j, symbol in enumerate(symbols[lo:hi]):
+            metrics = summarize(returns[:, j], periods)
+            metrics["trades"] = int(trades[j])
+            symbol_metrics[symbol] = metrics
+
+    portfolio_returns /= max(len(symbols), 1)
+    equity = initial_capital * np.cumprod(1.0 + portfolio_returns)
+    metrics = summarize(portfolio_returns, periods, initial_capital)
+    metrics.update(
+        {
+            "final_equity": float(equity[-1]) if len(equity) else initial_capital,
+            "trades": int(sum(m["trades"] for m in symbol_metrics.values())),
+            "bars": int(close.shape[0]),
+            "symbols": len(symbols),
+            "timeframe": timeframe,
+            "commission": commission,
+        }
+    )
+    return BacktestResult(timestamps, equity, portfolio_returns, metrics, symbol_metrics)
+
+
+def run_backtest(
+    db: Session,
+    strategy: BaseStrategy,
+    symbols: List[str],
+    timeframe: str = "1d",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    commission: float = 0.001,
+    initial_capital: float = 100000.0,
+    store=None,
+) -> BacktestResult:
+    """Load stored bars for ``symbols`` and backtest ``strategy`` over them.
+
+    Bars come from the columnar ``store`` when it holds every symbol,
+    otherwise from the ``MarketData`` table.
+    """
+    if store is not None and all(store.last_timestamp(s, timeframe) is not None for s in symbols):
+        timestamps, close, volume = store.read_panel(symbols, timeframe, start, end)
+    else:
+        timestamps, close, volume = load_bars(db, symbols, timeframe, start, end)
+    logger.info(f"Backtesting {strategy.name} on {len(symbols)} symbols, {len(timestamps)} bars")
+    return backtest_arrays(
+        strategy, symbols, timestamps, close, volume, timeframe, commission, initial_capital
+    )
+
+
+def save_results(db: Session, strategy_record: Strategy, result: BacktestResult):
+    """Store backtest metrics in ``Strategy.performance_metrics``."""
+    period = {}
+    if len(result.timestamps):
+        period = {
+            "start": pd.Timestamp(result.timestamps[0]).isoformat(),
+            "end": pd.Timestamp(result.timestamps[-1]).isoformat(),
+        }
+    strategy_record.performance_metrics = json.dumps(
+        {
+            "backtest": {**result.metrics, **period},
+            "symbols": result.symbol_metrics,
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+    )
+    db.commit()
@@ -0,0 +1,160 @@
+"""Parallel grid / random search over strategy parameters.
+
+The close and volume matrices are copied once into shared memory; worker
+processes attach to them at start-up, so tasks only carry parameter dicts.
+Combinations are sorted before batching so that those sharing indicator
+windows land in the same worker and reuse its ``IndicatorCache``, which
+holds at most ``INDICATOR_CACHE_BYTES`` of matrices per worker.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import random
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.backtest.engine import PERIODS_PER_YEAR, simulate, summarize
+from app.core.config import settings
+from app.strategies.registry import STRATEGY_TYPES
+from app.strategies.vectorized import IndicatorCache
+
+logger = logging.getLogger(__name__)
+
+
+# Metrics results can be ranked by; max_drawdown ranks lowest first
+OBJECTIVES = ("sharpe_ratio", "total_return", "max_drawdown")
+# How combinations are drawn from a space
+METHODS = ("grid", "random")
+
+DEFAULT_SPACES: Dict[str, Dict[str, List]] = {
+    "momentum": {
+        "short_window": [5, 10, 15, 20],
+        "long_window": [20, 30, 50, 100],
+        "rsi_period": [7, 14, 21],
+        "rsi_oversold": [20, 30],
+        "rsi_overbought": [70, 80],
+    },
+    "mean_reversion": {
+        "bb_period": [10, 20, 30, 50],
+        "bb_std": [1.5, 2.0, 2.5, 3.0],
+        "rsi_period": [7, 14, 21],
+    },
+}
+
+
+def is_valid(params: Dict[str, Any]) -> bool:
+    """Reject combinations that cannot produce meaningful signals."""
+    if params.get("short_window", 0) >= params.get("long_window", float("inf")):
+        return False
+    if params.get("rsi_oversold", 0) >= params.get("rsi_overbought", float("inf")):
+        return False
+    return True
+
+
+def grid(space: Dict[str, List]) -> List[Dict[str, Any]]:
+    names = list(space)
+    combos = (dict(zip(names, values)) for values in itertools.product(*space.values()))
+    return [c for c in combos if is_valid(c)]
+
+
+def random_sample(space: Dict[str, List], samples: int, seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Draw up to ``samples`` distinct valid combinations from ``space``."""
+    combos = grid(space)
+    rng = random.Random(seed)
+    return rng.sample(combos, min(samples, len(combos)))
+
+
+# Per-process state set up by the pool initializer
+_worker: Dict[str, Any] = {}
+
+
+def _attach(close_name: str, volume_name: str, shape, timeframe: str, commission: float):
+    close_shm = shared_memory.SharedMemory(name=close_name)
+    volume_shm = shared_memory.SharedMemory(name=volume_name)
+    _worker.update(
+        {
+            # Keep the handles referenced so the buffers stay mapped
+            "shm": (close_shm, volume_shm),
+            "close": np.ndarray(shape, dtype=np.float64, buffer=close_shm.buf, order="F"),
+            "volume": np.ndarray(shape, dtype=np.float64, buffer=volume_shm.buf, order="F"),
+            "periods": PERIODS_PER_YEAR.get(timeframe, 252),
+            "commission": commission,
+            "cache": IndicatorCache(max_bytes=settings.INDICATOR_CACHE_BYTES),
+        }
+    )
+
+
+def _evaluate(strategy_type: str, params: Dict[str, Any]) -> Dict:
+    close = _worker["close"]
+    strategy = STRATEGY_TYPES[strategy_type](**params)
+    signal, _ = strategy.signal_matrix(close, _worker["volume"], _worker["cache"])
+    returns, turnover = simulate(close, signal, _worker["commission"])
+    metrics = summarize(returns.mean(axis=1), _worker["periods"])
+    metrics["trades"] = int((turnover > 0).sum())
+    return {"params": params, "metrics": metrics}
+
+
+def _evaluate_batch(strategy_type: str, batch: List[Dict[str, Any]]) -> List[Dict]:
+    return [_evaluate(strategy_type, params) for params in batch]
+
+
+def _to_shared(array: np.ndarray) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=np.float64, buffer=shm.buf, order="F")
+    view[:] = array
+    return shm
+
+
+def optimize(
+    strategy_type: str,
+    close: np.ndarray,
+    volume: np.ndarray,
+    combos: List[Dict[str, Any]],
+    timeframe: str = "1d",
+    commission: float = 0.001,
+    objective: str = "sharpe_ratio",
+    workers: Optional[int] = None,
+    batch_size: int = 8,
+) -> List[Dict]:
+    """Evaluate every combination and return results best-first by ``objective``."""
+    if strategy_type not in STRATEGY_TYPES:
+        raise ValueError(f"Unknown strategy type '{strategy_type}'")
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective '{objective}'")
+    if not combos:
+        return []
+
+    # Neighbouring combos share windows, so batches hit the worker cache
+    combos = sorted(combos, key=lambda c: tuple(sorted(c.items())))
+    batches = [combos[i:i + batch_size] for i in range(0, len(combos), batch_size)]
+    workers = min(workers or os.cpu_count() or 1, len(batches))
+
+    close_shm = _to_shared(close)
+    volume_shm = _to_shared(volume)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_attach,
+            initargs=(close_shm.name, volume_shm.name, close.shape, timeframe, commission),
+        ) as pool:
+            results = [
+                result
+                for batch in pool.map(_evaluate_batch, itertools.repeat(strategy_type), batches)
+                for result in batch
+            ]
+    finally:
+        for shm in (close_shm, volume_shm):
+            shm.close()
+            shm.unlink()
+
+    logger.info(f"Evaluated {len(results)} {strategy_type} parameter sets on {workers} workers")
+    # Drawdown is minimized, every other metric maximized
+    return sorted(
+        results, key=lambda r: r["metrics"][objective], reverse=objective != "max_drawdown"
+    )
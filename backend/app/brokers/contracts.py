@@ -0,0 +1,134 @@
+"""Cache of qualified IB contracts keyed by (symbol, exchange).
+
+Qualification is a round trip to TWS, so each contract is qualified once
+and kept (with its conId, primary exchange and currency) until it expires
+or is evicted as least recently used. Concurrent lookups for the same
+contract share one in-flight request, and the configured universe can be
+qualified in bulk at startup.
+"""
+
+import asyncio
+from collections import OrderedDict
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ib_insync import Stock
+
+from app.brokers.scheduler import RequestScheduler
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def make_stock(symbol: str, exchange: str) -> Stock:
+    """Unqualified stock contract: TASE in ILS, everything else SMART-routed in USD."""
+    if exchange == "TASE":
+        return Stock(symbol, "TASE", "ILS")
+    return Stock(symbol, "SMART", "USD")
+
+
+class ContractCache:
+    def __init__(self, ib, max_size: Optional[int] = None, ttl: Optional[float] = None,
+                 scheduler: Optional[RequestScheduler] = None):
+        self.ib = ib
+        self.scheduler = scheduler or RequestScheduler(limits={}, message_rate=0)
+        self.max_size = max_size or settings.CONTRACT_CACHE_SIZE
+        self.ttl = settings.CONTRACT_CACHE_TTL if ttl is None else ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Stock]]" = OrderedDict()
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[Stock]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, contract = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return contract
+
+    def put(self, symbol: str, exchange: str, contract: Stock):
+        key = (symbol, exchange)
+        self._entries[key] = (time.monotonic(), contract)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, symbol: Optional[str] = None, exchange: Optional[str] = None):
+        if symbol is None:
+            self._entries.clear()
+        else:
+            self._entries.pop((symbol, exchange), None)
+
+    async def get(self, symbol: str, exchange: str) -> Stock:
+        """Qualified contract for ``symbol``; only a cache miss goes to TWS."""
+        key = (symbol, exchange)
+        contract = self._lookup(key)
+        if contract is not None:
+            self.hits += 1
+            return contract
+
+        self.misses += 1
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_event_loop().create_future()
+        self._pending[key] = future
+        try:
+            contract = make_stock(symbol, exchange)
+            qualified = await self.scheduler.run("qualify_contracts", self.ib.qualifyContractsAsync, contract)
+            if not qualified:
+                raise ValueError(f"Could not qualify contract for {symbol} on {exchange}")
+            self.put(symbol, exchange, qualified[0])
+            future.set_result(qualified[0])
+            return qualified[0]
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure nobody else awaited is not reported as unhandled
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    async def qualify_many(self, pairs: Iterable[Tuple[str, str]]) -> int:
+        """Qualify every (symbol, exchange) not already cached in one request."""
+        missing = [(s, e) for s, e in pairs if self._lookup((s, e)) is None]
+        if not missing:
+            return 0
+        contracts = [make_stock(s, e) for s, e in missing]
+        await self.scheduler.run("qualify_contracts", self.ib.qualifyContractsAsync, *contracts)
+        count = 0
+        for (symbol, exchange), contract in zip(missing, contracts):
+            # qualifyContracts fills conId in place; unqualified ones keep 0
+            if contract.conId:
+                self.put(symbol, exchange, contract)
+                count += 1
+            else:
+                logger.warning(f"Could not qualify contract for {symbol} on {exchange}")
+        logger.info(f"Qualified {count} of {len(missing)} contracts")
+        return count
+
+    def info(self, symbol: str, exchange: str) -> Optional[Dict]:
+        contract = self._lookup((symbol, exchange))
+        if contract is None:
+            return None
+        return {
+            "symbol": contract.symbol,
+            "con_id": contract.conId,
+            "exchange": contract.exchange,
+            "primary_exchange": contract.primaryExchange,
+            "currency": contract.currency,
+        }
+
+
+def universe_pairs(universe: Dict[str, List[str]]) -> List[Tuple[str, str]]:
+    """(symbol, exchange) pairs for the configured universe."""
+    return [(symbol, exchange) for exchange, symbols in universe.items() for symbol in symbols]
@@ -1,16 +1,36 @@
-from ib_insync import IB, Stock, MarketOrder, LimitOrder, util
-import asyncio
-from typing import Optional, List, Dict
+from ib_insync import IB, MarketOrder, LimitOrder, util
+from typing import Callable, Optional, List, Dict
+import time
 from app.core.config import settings
+from app.core.metrics import ORDER_ACK_LATENCY, ORDER_FILL_LATENCY
+from app.brokers.contracts import ContractCache, universe_pairs
+from app.brokers.scheduler import RequestScheduler
+from app.brokers.subscriptions import SubscriptionManager
 import logging
 
 logger = logging.getLogger(__name__)
 
+# IB bar size settings by MarketData timeframe
+BAR_SIZES = {"1m": "1 min", "5m": "5 mins", "1h": "1 hour", "1d": "1 day"}
+
+# Order statuses after which no execution will follow
+DONE_STATUSES = {"Filled", "Cancelled", "ApiCancelled", "Inactive"}
+
 
 class InteractiveBrokersClient:
-    def __init__(self):
-        self.ib = IB()
+    def __init__(self, ib=None, scheduler: Optional[RequestScheduler] = None):
+        # Anything with IB's interface, e.g. the simulated broker
+        self.ib = ib if ib is not None else IB()
         self.connected = False
+        # Every request to IB goes through the scheduler, which keeps them within IB's pacing limits
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.scheduler.watch(self.ib)
+        self.subscriptions = SubscriptionManager(self.ib, scheduler=self.scheduler)
+        self.contracts = ContractCache(self.ib, scheduler=self.scheduler)
+        self._bar_streams = {}
+        self._order_listeners = []
+        # order id -> [placeOrder time, acknowledged], until the first execution or the end of the order
+        self._placed: Dict[int, list] = {}
 
     async def connect(self):
         """Connect to Interactive Brokers TWS/Gateway"""
@@ -26,6 +46,11 @@ class InteractiveBrokersClient:
             # Set up event handlers
             self.ib.orderStatusEvent += self.on_order_status
             self.ib.execDetailsEvent += self.on_execution
+            self.ib.commissionReportEvent += self.on_commission
+            self.subscriptions.start()
+
+            # Warm the contract cache so quotes and orders never wait on qualification
+            await self.contracts.qualify_many(universe_pairs(settings.TRADING_UNIVERSE))
 
         except Exception as e:
             logger.error(f"Failed to connect to IB: {e}")
@@ -34,6 +59,8 @@ class InteractiveBrokersClient:
     async def disconnect(self):
         """Disconnect from Interactive Brokers"""
         if self.connected:
+            self.subscriptions.stop()
+            self._bar_streams.clear()
             self.ib.disconnect()
             self.connected = False
 
@@ -58,13 +85,14 @@ class InteractiveBrokersClient:
         if not self.connected:
             await self.connect()
 
-        positions = self.ib.positions()
+        # Portfolio items carry the market value and P&L that plain positions lack
+        positions = self.ib.portfolio()
         return [
             {
                 'symbol': pos.contract.symbol,
                 'exchange': pos.contract.exchange,
                 'quantity': pos.position,
-                'avg_cost': pos.avgCost,
+                'avg_cost': pos.averageCost,
                 'market_value': pos.marketValue,
                 'unrealized_pnl': pos.unrealizedPNL
             }
@@ -79,22 +107,12 @@ class InteractiveBrokersClient:
             await self.connect()
 
         try:
-            # Create contract
-            if exchange == "TASE":
-                contract = Stock(symbol, "TASE", "ILS")
-            else:
-                contract = Stock(symbol, "SMART", "USD")
-
-            # Create order
-            if order_type == 'MKT':
-                order = MarketOrder(action, quantity)
-            elif order_type == 'LMT' and limit_price:
-                order = LimitOrder(action, quantity, limit_price)
-            else:
-                raise ValueError("Invalid order type or missing limit price")
+            contract = await self.contracts.get(symbol, exchange)
+            order = self._make_order(action, quantity, order_type, limit_price)
 
             # Place order
-            trade = self.ib.placeOrder(contract, order)
+            trade = await self.scheduler.run("order", self.ib.placeOrder, contract, order)
+            self._placed[trade.order.orderId] = [time.perf_counter(), False]
             logger.info(f"Placed order: {symbol} {action} {quantity}")
 
             return trade.order.orderId
@@ -103,22 +121,62 @@ class InteractiveBrokersClient:
             logger.error(f"Failed to place order: {e}")
             return None
 
-    async def get_market_data(self, symbol: str, exchange: str) -> Optional[Dict]:
-        """Get real-time market data for a symbol"""
+    async def place_orders(self, orders: List[Dict]) -> List[Optional[int]]:
+        """Place a batch of orders (dicts with ``place_order``'s arguments)
+
+        Contracts for the whole batch are qualified in a single request and
+        the orders are then sent without waiting on each other. Returns the
+        order id for each order, or None where it could not be placed.
+        """
         if not self.connected:
             await self.connect()
 
         try:
-            if exchange == "TASE":
-                contract = Stock(symbol, "TASE", "ILS")
-            else:
-                contract = Stock(symbol, "SMART", "USD")
+            await self.contracts.qualify_many((o['symbol'], o['exchange']) for o in orders)
+        except Exception as e:
+            logger.error(f"Failed to qualify contracts for order batch: {e}")
 
-            self.ib.qualifyContracts(contract)
-            ticker = self.ib.reqMktData(contract)
+        order_ids = []
+        for o in orders:
+            try:
+                contract = await self.contracts.get(o['symbol'], o['exchange'])
+                order = self._make_order(
+                    o['action'], o['quantity'], o.get('order_type', 'MKT'), o.get('limit_price')
+                )
+                trade = await self.scheduler.run("order", self.ib.placeOrder, contract, order)
+                self._placed[trade.order.orderId] = [time.perf_counter(), False]
+                order_ids.append(trade.order.orderId)
+            except Exception as e:
+                logger.error(f"Failed to place order for {o['symbol']}: {e}")
+                order_ids.append(None)
+
+        logger.info(f"Placed {sum(i is not None for i in order_ids)} of {len(orders)} orders")
+        return order_ids
+
+    @staticmethod
+    def _make_order(action: str, quantity: float, order_type: str = 'MKT',
+                    limit_price: Optional[float] = None):
+        if order_type == 'MKT':
+            return MarketOrder(action, quantity)
+        if order_type == 'LMT' and limit_price:
+            return LimitOrder(action, quantity, limit_price)
+        raise ValueError("Invalid order type or missing limit price")
+
+    async def get_market_data(self, symbol: str, exchange: str) -> Optional[Dict]:
+        """Get real-time market data for a symbol
+
+        Served from a persistent streaming subscription; only the first
+        request for a symbol waits for its initial tick.
+        """
+        if not self.connected:
+            await self.connect()
 
-            # Wait for data
-            await asyncio.sleep(1)
+        try:
+            key = (symbol, exchange)
+            ticker = self.subscriptions.latest(key)
+            if ticker is None:
+                contract = await self.contracts.get(symbol, exchange)
+                ticker = await self.subscriptions.ticker(key, contract)
 
             return {
                 'symbol': symbol,
@@ -126,23 +184,155 @@ class InteractiveBrokersClient:
                 'ask': ticker.ask,
                 'last': ticker.last,
                 'volume': ticker.volume,
-                'timestamp': util.df([ticker])['time'].iloc[0] if len(util.df([ticker])) > 0 else None
+                'timestamp': ticker.time
             }
 
         except Exception as e:
             logger.error(f"Failed to get market data for {symbol}: {e}")
             return None
 
+    async def stream_market_data(self, symbol: str, exchange: str) -> bool:
+        """Keep a symbol's market data subscription open until ``stop_market_data``"""
+        if not self.connected:
+            await self.connect()
+
+        try:
+            contract = await self.contracts.get(symbol, exchange)
+            await self.subscriptions.acquire((symbol, exchange), contract)
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to stream market data for {symbol}: {e}")
+            return False
+
+    def stop_market_data(self, symbol: str, exchange: str):
+        """Release a subscription held by ``stream_market_data``"""
+        self.subscriptions.release((symbol, exchange))
+
+    async def get_historical_bars(self, symbol: str, exchange: str, timeframe: str = "1d",
+                                  duration: str = "1 Y", end: str = ""):
+        """Get historical OHLCV bars ending at ``end`` (empty for now) as a DataFrame"""
+        if not self.connected:
+            await self.connect()
+
+        try:
+            contract = await self.contracts.get(symbol, exchange)
+
+            # Identical concurrent requests (e.g. the same /market-data page) share one
+            bars = await self.scheduler.run(
+                "historical_data",
+                self.ib.reqHistoricalDataAsync,
+                contract,
+                endDateTime=end,
+                durationStr=duration,
+                barSizeSetting=BAR_SIZES[timeframe],
+                whatToShow="TRADES",
+                useRTH=True,
+                formatDate=2,  # UTC
+                key=(symbol, exchange, timeframe, duration, end),
+            )
+            return util.df(bars)
+
+        except Exception as e:
+            logger.error(f"Failed to get historical data for {symbol}: {e}")
+            return None
+
+    async def stream_bars(self, symbol: str, exchange: str, on_bar: Callable) -> bool:
+        """Call ``on_bar(bar)`` with each completed 1 minute bar as it closes"""
+        if not self.connected:
+            await self.connect()
+
+        key = (symbol, exchange)
+        if key in self._bar_streams:
+            return True
+
+        try:
+            contract = await self.contracts.get(symbol, exchange)
+
+            bars = await self.scheduler.run(
+                "historical_data",
+                self.ib.reqHistoricalDataAsync,
+                contract,
+                endDateTime="",
+                durationStr="3600 S",
+                barSizeSetting=BAR_SIZES["1m"],
+                whatToShow="TRADES",
+                useRTH=False,
+                formatDate=2,  # UTC
+                keepUpToDate=True,
+                key=("stream", symbol, exchange),
+            )
+            if key in self._bar_streams:
+                # A concurrent call shared the request and already set it up
+                return True
+
+            def on_update(bars, has_new_bar):
+                # A new bar opening means the one before it just closed
+                if has_new_bar and len(bars) > 1:
+                    on_bar(bars[-2])
+
+            bars.updateEvent += on_update
+            self._bar_streams[key] = bars
+            logger.info(f"Streaming 1 min bars for {symbol}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to stream bars for {symbol}: {e}")
+            return False
+
+    def stop_bars(self, symbol: str, exchange: str):
+        """Cancel a bar stream started by ``stream_bars``"""
+        bars = self._bar_streams.pop((symbol, exchange), None)
+        if bars is not None:
+            try:
+                self.ib.cancelHistoricalData(bars)
+            except Exception as e:
+                logger.error(f"Failed to cancel bar stream for {symbol}: {e}")
+
+    def add_order_listener(self, listener):
+        """Forward order events to ``listener``'s ``on_order_status(trade)``,
+        ``on_execution(trade, fill)`` and ``on_commission(trade, fill, report)``"""
+        self._order_listeners.append(listener)
+
+    def _notify(self, method: str, *args):
+        for listener in self._order_listeners:
+            try:
+                getattr(listener, method)(*args)
+            except Exception as e:
+                logger.error(f"Order listener failed on {method}: {e}")
+
     def on_order_status(self, trade):
         """Handle order status updates"""
         logger.info(f"Order status update: {trade.order.orderId} - {trade.orderStatus.status}")
+        placed = self._placed.get(trade.order.orderId)
+        if placed is not None:
+            if not placed[1]:
+                placed[1] = True
+                ORDER_ACK_LATENCY.observe(time.perf_counter() - placed[0])
+            # A fill reported with Filled is timed when its execution arrives
+            if trade.orderStatus.status in DONE_STATUSES and trade.orderStatus.status != "Filled":
+                del self._placed[trade.order.orderId]
+        self._notify('on_order_status', trade)
 
     def on_execution(self, trade, fill):
         """Handle trade executions"""
         logger.info(
             f"Trade executed: {fill.contract.symbol} {fill.execution.side} {fill.execution.shares} @ {fill.execution.price}"
         )
+        placed = self._placed.pop(fill.execution.orderId, None)
+        if placed is not None:
+            ORDER_FILL_LATENCY.observe(time.perf_counter() - placed[0])
+        self._notify('on_execution', trade, fill)
+
+    def on_commission(self, trade, fill, report):
+        """Handle commission reports, which arrive after their execution"""
+        self._notify('on_commission', trade, fill, report)
 
 
 # Global IB client instance
-ib_client = InteractiveBrokersClient()
+if settings.BROKER == "simulated":
+    from app.brokers.simulated import SimulatedIB
+    # The matching engine has no pacing limits
+    ib_client = InteractiveBrokersClient(SimulatedIB(), RequestScheduler(limits={}, message_rate=0))
+else:
+    ib_client = InteractiveBrokersClient()
@@ -0,0 +1,297 @@
+"""Pacing-aware scheduling of requests to IB.
+
+Every request the client sends goes through one ``RequestScheduler``:
+
+* Token buckets hold request types to IB's pacing limits: all requests
+  share ``IB_MESSAGE_RATE`` (IB disconnects clients above 50 messages a
+  second), and historical data is also held to ``IB_HISTORICAL_RATE`` with
+  a burst of ``IB_HISTORICAL_BURST`` (IB allows 60 requests in any 10
+  minutes).
+* When requests have to wait, they are released by priority: orders, then
+  live quotes and contract lookups, then historical data. A backfill of
+  hundreds of pages therefore never delays an order, and within a type
+  requests keep their order.
+* Requests made with a ``key`` are coalesced: a caller asking for what is
+  already in flight shares that request's result.
+* A request that IB answers with a pacing violation is retried after
+  ``IB_PACING_BACKOFF`` seconds (doubling each time, up to
+  ``IB_PACING_RETRIES`` times), and its bucket is emptied so the requests
+  behind it back off as well. Violations are recognized from IB's error
+  events, which ib_insync reports apart from the (empty) result, or from a
+  raised ``RequestError``. An error is matched to its request by reqId,
+  which historical data results carry, so only the paced request is
+  resent. Results without one are retried only if they came back empty
+  after a violation of their type. Fire-and-forget messages such as orders
+  are only rate limited; their errors arrive after the call has returned.
+
+Market data lines are a separate limit, managed by ``SubscriptionManager``.
+Anything with IB's ``errorEvent`` can be watched, so the scheduler can be
+exercised against a stand-in for IB.
+"""
+
+import asyncio
+from collections import deque
+import inspect
+import logging
+import time
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import IB_REQUEST_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+# Priority classes, most urgent first
+ORDERS, QUOTES, HISTORICAL = 0, 1, 2
+
+# Request types (also the ``ib_request_duration_seconds`` labels) and their priority
+PRIORITIES = {
+    "order": ORDERS,
+    "market_data": QUOTES,
+    "qualify_contracts": QUOTES,
+    "historical_data": HISTORICAL,
+}
+
+# Error codes that mean "too many requests": 100 is the message rate, 162 and 420
+# are pacing violations of historical and real-time data (among other 162/420 errors)
+PACING_CODES = {100, 162, 420}
+# Request type a pacing error holds back; None is every type
+PACING_TYPES = {100: None, 162: "historical_data", 420: "market_data"}
+# Paced reqIds remembered until their request checks for them
+MAX_PACED_IDS = 1000
+
+
+def is_pacing_error(code: int, message: str) -> bool:
+    return code == 100 or (code in PACING_CODES and "pacing" in message.lower())
+
+
+class TokenBucket:
+    """``rate`` requests per second on average, at most ``burst`` at once."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated: Optional[float] = None
+
+    def _refill(self, now: float):
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is now)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def drain(self, now: float):
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class RequestScheduler:
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 message_rate: Optional[float] = None, retries: Optional[int] = None,
+                 backoff: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        """``limits`` maps request types to (rate per second, burst) on top of
+        the shared ``message_rate``; ``limits={}`` and ``message_rate=0`` leave
+        requests unpaced (e.g. for the simulated broker)."""
+        if limits is None:
+            limits = {"historical_data": (settings.IB_HISTORICAL_RATE, settings.IB_HISTORICAL_BURST)}
+        message_rate = settings.IB_MESSAGE_RATE if message_rate is None else message_rate
+        self.buckets: Dict[str, TokenBucket] = {kind: TokenBucket(*limit) for kind, limit in limits.items()}
+        self.messages = TokenBucket(message_rate, max(1.0, message_rate)) if message_rate else None
+        self.retries = settings.IB_PACING_RETRIES if retries is None else retries
+        self.backoff = settings.IB_PACING_BACKOFF if backoff is None else backoff
+        self.clock = clock
+        # Waiting requests per type, kinds in priority order
+        self._kinds = sorted(PRIORITIES, key=PRIORITIES.get)
+        self._waiting: Dict[str, Deque[asyncio.Future]] = {kind: deque() for kind in self._kinds}
+        self._queued = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        # Clock time of the latest pacing violation per request type (None for all types)
+        self._paced_at: Dict[Optional[str], float] = {}
+        # reqIds IB reported a pacing violation for, oldest first
+        self._paced_ids: Dict[int, None] = {}
+        self.sent = dict.fromkeys(PRIORITIES, 0)
+        self.coalesced = 0
+        self.violations = 0
+
+    def watch(self, ib):
+        """Recognize pacing violations from ``ib``'s error events."""
+        event = getattr(ib, "errorEvent", None)
+        if event is not None:
+            event += self.on_error
+
+    def on_error(self, req_id: int, code: int, message: str, contract=None):
+        if not is_pacing_error(code, message):
+            return
+        kind = PACING_TYPES[code]
+        now = self.clock()
+        self._paced_at[kind] = now
+        self._paced_ids[req_id] = None
+        if len(self._paced_ids) > MAX_PACED_IDS:
+            del self._paced_ids[next(iter(self._paced_ids))]
+        self.violations += 1
+        bucket = self.messages if kind is None else self.buckets.get(kind)
+        if bucket is not None:
+            bucket.drain(now)
+        logger.warning(f"IB pacing violation ({code}) on request {req_id}: {message}")
+
+    def _paced(self, kind: str, started: float, result: Any) -> bool:
+        """Whether IB rejected the request that returned ``result`` for pacing."""
+        req_id = getattr(result, "reqId", None)
+        if req_id is not None:
+            if req_id not in self._paced_ids:
+                return False
+            del self._paced_ids[req_id]
+            return True
+        # Without a reqId only an empty answer can be the one that was paced
+        return not result and max(self._paced_at.get(kind, -1.0), self._paced_at.get(None, -1.0)) >= started
+
+    async def run(self, kind: str, fn: Callable, *args, key: Optional[Hashable] = None, **kwargs) -> Any:
+        """``fn(*args, **kwargs)`` (awaited if it returns an awaitable) once pacing allows.
+
+        With ``key``, a request of the same type and key already in flight
+        is shared instead of sending another.
+        """
+        if key is None:
+            return await self._run(kind, fn, args, kwargs)
+
+        inflight = self._inflight.get((kind, key))
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[(kind, key)] = future
+        try:
+            result = await self._run(kind, fn, args, kwargs)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure nobody else awaited is not reported as unhandled
+            future.exception()
+            raise
+        finally:
+            del self._inflight[(kind, key)]
+
+    async def _run(self, kind: str, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        attempt = 0
+        while True:
+            await self._acquire(kind)
+            started = self.clock()
+            self.sent[kind] += 1
+            try:
+                result = fn(*args, **kwargs)
+                if not inspect.isawaitable(result):
+                    return result
+                result = await result
+                IB_REQUEST_LATENCY.labels(kind).observe(self.clock() - started)
+            except Exception as e:
+                if attempt >= self.retries or not is_pacing_error(getattr(e, "code", 0), str(e)):
+                    raise
+            else:
+                if not self._paced(kind, started, result) or attempt >= self.retries:
+                    return result
+            delay = self.backoff * 2 ** attempt
+            attempt += 1
+            logger.warning(f"Retrying paced {kind} request in {delay:g} s (attempt {attempt} of {self.retries})")
+            await asyncio.sleep(delay)
+
+    def _wait(self, kind: str, now: float) -> Tuple[float, float]:
+        """Seconds until the shared and the type's own bucket allow a request."""
+        bucket = self.buckets.get(kind)
+        return (
+            self.messages.wait(now) if self.messages is not None else 0.0,
+            bucket.wait(now) if bucket is not None else 0.0,
+        )
+
+    def _take(self, kind: str, now: float):
+        if self.messages is not None:
+            self.messages.take(now)
+        bucket = self.buckets.get(kind)
+        if bucket is not None:
+            bucket.take(now)
+
+    async def _acquire(self, kind: str):
+        priority = PRIORITIES[kind]
+        now = self.clock()
+        # Go straight through when allowed and nothing as urgent is already waiting
+        ahead = any(self._waiting[k] for k in self._kinds if PRIORITIES[k] <= priority)
+        if not ahead and not any(self._wait(kind, now)):
+            self._take(kind, now)
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        self._waiting[kind].append(future)
+        self._queued += 1
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_event_loop().create_task(self._dispatch_forever())
+        await future
+
+    def _dispatch(self) -> Optional[float]:
+        """Release every waiting request pacing allows; seconds until the next one could go."""
+        now = self.clock()
+        delay = None
+        for kind in self._kinds:
+            waiting = self._waiting[kind]
+            while waiting:
+                if waiting[0].done():
+                    # Cancelled while waiting
+                    waiting.popleft()
+                    self._queued -= 1
+                    continue
+                shared, own = self._wait(kind, now)
+                if shared > 0:
+                    # Everything shares this bucket: less urgent requests have to wait too
+                    return shared if delay is None else min(delay, shared)
+                if own > 0:
+                    delay = own if delay is None else min(delay, own)
+                    break
+                self._take(kind, now)
+                waiting.popleft().set_result(None)
+                self._queued -= 1
+        return delay
+
+    async def _dispatch_forever(self):
+        while self._queued:
+            self._wakeup.clear()
+            delay = self._dispatch()
+            if not self._queued:
+                break
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def info(self) -> Dict:
+        now = self.clock()
+        buckets = {"messages": self.messages, **self.buckets}
+        for bucket in buckets.values():
+            if bucket is not None:
+                bucket.wait(now)
+        return {
+            "queued": {kind: len(waiting) for kind, waiting in self._waiting.items()},
+            "in_flight": len(self._inflight),
+            "sent": dict(self.sent),
+            "coalesced": self.coalesced,
+            "pacing_violations": self.violations,
+            "tokens": {name: round(bucket.tokens, 2) for name, bucket in buckets.items() if bucket is not None},
+        }
@@ -0,0 +1,477 @@
+"""In-process simulated broker for paper trading and load tests.
+
+``SimulatedIB`` stands in for ``ib_insync.IB`` under the regular
+``InteractiveBrokersClient`` (``BROKER=simulated``), so orders, quotes,
+historical bars and order events take exactly the same path as with TWS.
+
+Each symbol has a price-time priority limit order book. An incoming order
+first trades against resting orders on the other side at their prices,
+then against the market at the quoted touch, and a limit order that is
+still not filled rests in the book. Market prices come from ``on_bar`` and
+``on_quote`` (fed by a replay, or anything else), seeded from the last
+stored close in the bar store; each update fills resting orders the market
+traded through. Quotes are the last price plus or minus half of
+``SIM_SPREAD_BPS``, with unlimited size at the touch.
+
+Like IB, order status, execution and commission events are delivered after
+``placeOrder`` returns, all events of one pass of the event loop together.
+"""
+
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import heapq
+import logging
+import math
+from typing import Deque, Dict, List, Optional, Tuple
+
+from eventkit import Event
+from ib_insync import (
+    AccountValue, BarData, BarDataList, CommissionReport, Contract, Execution, Fill, OrderStatus,
+    PortfolioItem, Position, Ticker, Trade,
+)
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+BUY, SELL = 0, 1
+
+# MarketData timeframe by IB bar size setting
+TIMEFRAMES = {"1 min": "1m", "5 mins": "5m", "1 hour": "1h", "1 day": "1d"}
+
+DURATION_UNITS = {"S": 1, "D": 86400, "W": 7 * 86400, "M": 30 * 86400, "Y": 365 * 86400}
+
+# Completed bars kept in a keepUpToDate bar stream
+STREAM_BARS = 500
+
+ACCOUNT = "SIM"
+
+
+class SimTrade(Trade):
+    """A ``Trade`` without its per-trade events, which the simulator never emits
+    and which cost more to create than matching the order."""
+
+    def __post_init__(self):
+        pass
+
+
+class _Resting:
+    __slots__ = ("trade", "side", "price", "remaining")
+
+    def __init__(self, trade: Trade, side: int, price: float, remaining: float):
+        self.trade = trade
+        self.side = side
+        self.price = price
+        self.remaining = remaining
+
+
+class OrderBook:
+    """Resting limit orders for one symbol, matched best price first, then oldest first."""
+
+    def __init__(self):
+        self._levels: Tuple[Dict[float, Deque[_Resting]], Dict[float, Deque[_Resting]]] = ({}, {})
+        # Heaps of level prices; bids are negated so the best is on top of both
+        self._prices: Tuple[List[float], List[float]] = ([], [])
+        self.resting = 0
+
+    def __len__(self) -> int:
+        return self.resting
+
+    def add(self, order: _Resting):
+        levels = self._levels[order.side]
+        level = levels.get(order.price)
+        if level is None:
+            level = levels[order.price] = deque()
+            heapq.heappush(self._prices[order.side], -order.price if order.side == BUY else order.price)
+        level.append(order)
+        self.resting += 1
+
+    def cancel(self, order: _Resting):
+        # Dropped lazily when it reaches the front of its level
+        if order.remaining > 0:
+            order.remaining = 0
+            self.resting -= 1
+
+    def best(self, side: int) -> Optional[float]:
+        prices, levels = self._prices[side], self._levels[side]
+        while prices:
+            price = -prices[0] if side == BUY else prices[0]
+            level = levels[price]
+            while level and level[0].remaining <= 0:
+                level.popleft()
+            if level:
+                return price
+            heapq.heappop(prices)
+            del levels[price]
+        return None
+
+    def match(self, side: int, quantity: float, limit: Optional[float]) -> List[Tuple[_Resting, float]]:
+        """Take up to ``quantity`` from resting ``side`` orders priced at or through ``limit``
+        (any price when None); returns (order, size) pairs, each filled at its own price."""
+        fills = []
+        while quantity > 0:
+            price = self.best(side)
+            if price is None or (limit is not None and (price < limit if side == BUY else price > limit)):
+                break
+            level = self._levels[side][price]
+            order = level[0]
+            size = min(quantity, order.remaining)
+            order.remaining -= size
+            quantity -= size
+            if order.remaining <= 0:
+                level.popleft()
+                self.resting -= 1
+            fills.append((order, size))
+        return fills
+
+
+class SimulatedIB:
+    """The subset of ``ib_insync.IB`` used by ``InteractiveBrokersClient``, backed by local order books."""
+
+    def __init__(self, store=None, cash: Optional[float] = None, spread_bps: Optional[float] = None):
+        self.orderStatusEvent = Event("orderStatusEvent")
+        self.execDetailsEvent = Event("execDetailsEvent")
+        self.commissionReportEvent = Event("commissionReportEvent")
+        self._store = store
+        self.cash = settings.SIM_STARTING_CASH if cash is None else cash
+        self.realized_pnl = 0.0
+        self.half_spread = (settings.SIM_SPREAD_BPS if spread_bps is None else spread_bps) / 20000
+        # Market clock: time of the latest bar or quote, wall time until one arrives
+        self.now: Optional[datetime] = None
+        self._connected = False
+        self._next_order_id = 1
+        self._next_exec_id = 1
+        self._con_ids: Dict[str, int] = {}
+        self._books: Dict[str, OrderBook] = {}
+        self._tickers: Dict[str, Ticker] = {}
+        self._seeded: set = set()
+        self._resting: Dict[int, Tuple[str, _Resting]] = {}
+        # symbol -> [quantity, average cost, contract]
+        self._positions: Dict[str, list] = {}
+        self._bar_streams: Dict[str, List[BarDataList]] = {}
+        self._events: List[tuple] = []
+        self.orders = 0
+        self.fills = 0
+
+    # Connection
+
+    async def connectAsync(self, host: str = "", port: int = 0, clientId: int = 0, **kwargs):
+        self._connected = True
+        logger.info("Connected to the simulated broker")
+        return self
+
+    def disconnect(self):
+        self._connected = False
+
+    def isConnected(self) -> bool:
+        return self._connected
+
+    async def qualifyContractsAsync(self, *contracts: Contract) -> List[Contract]:
+        for contract in contracts:
+            contract.conId = self._con_ids.setdefault(contract.symbol, len(self._con_ids) + 1)
+        return list(contracts)
+
+    # Market data
+
+    def _clock(self) -> datetime:
+        return self.now or datetime.now(timezone.utc)
+
+    def _ticker(self, contract: Contract) -> Ticker:
+        ticker = self._tickers.get(contract.symbol)
+        if ticker is None:
+            ticker = self._tickers[contract.symbol] = Ticker(contract=contract)
+        return ticker
+
+    def _seed(self, symbol: str):
+        """Quote a symbol nothing has priced yet at its last stored close."""
+        if symbol in self._seeded:
+            return
+        self._seeded.add(symbol)
+        store = self._store
+        if store is None:
+            from app.services.bar_store import bar_store as store
+        for timeframe in (settings.BASE_TIMEFRAME, "1d"):
+            bars = store.read(symbol, timeframe, limit=1)
+            if len(bars):
+                self._set_quote(symbol, float(bars.close[-1]))
+                return
+
+    def _set_quote(self, symbol: str, price: float, volume: float = 0.0, size: float = 0.0,
+                   timestamp: Optional[datetime] = None) -> Ticker:
+        ticker = self._tickers.get(symbol)
+        if ticker is None:
+            ticker = self._tickers[symbol] = Ticker(contract=Contract(symbol=symbol))
+        ticker.time = timestamp or self._clock()
+        ticker.last = price
+        ticker.lastSize = size
+        ticker.bid = price * (1 - self.half_spread)
+        ticker.ask = price * (1 + self.half_spread)
+        ticker.volume = (ticker.volume if not math.isnan(ticker.volume) else 0.0) + volume
+        return ticker
+
+    def reqMktData(self, contract: Contract, *args, **kwargs) -> Ticker:
+        ticker = self._ticker(contract)
+        self._seed(contract.symbol)
+        if not math.isnan(ticker.last):
+            # First tick, as TWS would send right after subscribing
+            asyncio.get_event_loop().call_soon(ticker.updateEvent.emit, ticker)
+        return ticker
+
+    def cancelMktData(self, contract: Contract):
+        pass
+
+    def on_quote(self, symbol: str, price: float, volume: float = 0.0, size: float = 0.0,
+                 timestamp: Optional[datetime] = None):
+        """A trade at ``price``: re-quote around it and fill resting orders it reaches."""
+        if timestamp is not None:
+            self.now = timestamp
+        self._seeded.add(symbol)
+        ticker = self._set_quote(symbol, price, volume, size, timestamp)
+        self._cross(symbol, ticker.ask, ticker.bid)
+        ticker.updateEvent.emit(ticker)
+
+    def on_bar(self, symbol: str, timestamp: datetime, open: float, high: float, low: float,
+               close: float, volume: float, stream: bool = True):
+        """A completed bar: fill resting orders inside its range, quote its close, and, for a
+        base bar (``stream``), hand it to keepUpToDate bar streams."""
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        self.now = timestamp
+        self._seeded.add(symbol)
+        self._cross(symbol, low, high)
+        ticker = self._set_quote(symbol, close, volume, timestamp=timestamp)
+        self._cross(symbol, ticker.ask, ticker.bid)
+        ticker.updateEvent.emit(ticker)
+
+        streams = self._bar_streams.get(symbol) if stream else None
+        if streams:
+            bar = BarData(date=timestamp, open=open, high=high, low=low, close=close, volume=volume)
+            for bars in streams:
+                if bars:
+                    bars[-1] = bar
+                else:
+                    bars.append(bar)
+                # The bar that just opened; its predecessor is the completed one
+                bars.append(BarData(date=timestamp, open=close, high=close, low=close, close=close))
+                if len(bars) > STREAM_BARS:
+                    del bars[:-STREAM_BARS]
+                bars.updateEvent.emit(bars, True)
+
+    # Orders
+
+    def _book(self, symbol: str) -> OrderBook:
+        book = self._books.get(symbol)
+        if book is None:
+            book = self._books[symbol] = OrderBook()
+        return book
+
+    def placeOrder(self, contract: Contract, order) -> Trade:
+        if not order.orderId:
+            order.orderId = self._next_order_id
+            self._next_order_id += 1
+        status = OrderStatus(orderId=order.orderId, status="Submitted", remaining=order.totalQuantity)
+        trade = SimTrade(contract, order, status)
+        self.orders += 1
+        symbol = contract.symbol
+        side = BUY if order.action == "BUY" else SELL
+        limit = order.lmtPrice if order.orderType == "LMT" else None
+        book = self._book(symbol)
+
+        remaining = order.totalQuantity
+        for resting, size in book.match(SELL if side == BUY else BUY, remaining, limit):
+            self._fill(resting.trade, size, resting.price)
+            self._fill(trade, size, resting.price)
+            remaining -= size
+
+        if remaining > 0:
+            self._seed(symbol)
+            ticker = self._tickers.get(symbol)
+            touch = (ticker.ask if side == BUY else ticker.bid) if ticker is not None else math.nan
+            if not math.isnan(touch) and (limit is None or (touch <= limit if side == BUY else touch >= limit)):
+                self._fill(trade, remaining, touch)
+                remaining = 0
+
+        if remaining > 0:
+            if limit is None:
+                # Nothing to price a market order against
+                trade.orderStatus.status = "Inactive"
+                logger.warning(f"Simulated broker has no price for {symbol}; order {order.orderId} rejected")
+            else:
+                resting = _Resting(trade, side, limit, remaining)
+                book.add(resting)
+                self._resting[order.orderId] = (symbol, resting)
+            self._emit(("status", trade))
+        return trade
+
+    def cancelOrder(self, order):
+        entry = self._resting.pop(order.orderId, None)
+        if entry is None:
+            return
+        symbol, resting = entry
+        self._books[symbol].cancel(resting)
+        resting.trade.orderStatus.status = "Cancelled"
+        self._emit(("status", resting.trade))
+
+    def _cross(self, symbol: str, buy_through: float, sell_through: float):
+        """Fill resting bids at or above ``buy_through`` and asks at or below ``sell_through``."""
+        book = self._books.get(symbol)
+        if not book:
+            return
+        for side, price in ((BUY, buy_through), (SELL, sell_through)):
+            for resting, size in book.match(side, math.inf, price):
+                self._fill(resting.trade, size, resting.price)
+
+    def _fill(self, trade: Trade, size: float, price: float):
+        order, status, contract = trade.order, trade.orderStatus, trade.contract
+        filled = status.filled + size
+        status.avgFillPrice = (status.avgFillPrice * status.filled + price * size) / filled
+        status.lastFillPrice = price
+        status.filled = filled
+        status.remaining = order.totalQuantity - filled
+        if status.remaining <= 0:
+            status.status = "Filled"
+            self._resting.pop(order.orderId, None)
+
+        exec_id = f"sim.{self._next_exec_id}"
+        self._next_exec_id += 1
+        now = self._clock()
+        commission = max(size * settings.SIM_COMMISSION_PER_SHARE, settings.SIM_MIN_COMMISSION)
+        execution = Execution(
+            execId=exec_id, time=now, acctNumber=ACCOUNT, exchange=contract.exchange,
+            side="BOT" if order.action == "BUY" else "SLD", shares=size, price=price,
+            orderId=order.orderId, cumQty=filled, avgPrice=status.avgFillPrice,
+        )
+        report = CommissionReport(execId=exec_id, commission=commission, currency=contract.currency or "USD")
+        fill = Fill(contract, execution, report, now)
+        trade.fills.append(fill)
+        self._book_fill(contract, size if order.action == "BUY" else -size, price, commission)
+        self.fills += 1
+        self._emit(("status", trade), ("execution", trade, fill), ("commission", trade, fill, report))
+
+    def _book_fill(self, contract: Contract, delta: float, price: float, commission: float):
+        position = self._positions.get(contract.symbol)
+        if position is None:
+            position = self._positions[contract.symbol] = [0.0, 0.0, contract]
+        quantity, cost = position[0], position[1]
+        new = quantity + delta
+        if quantity * delta < 0:
+            closed = min(abs(delta), abs(quantity))
+            self.realized_pnl += closed * (price - cost) * (1 if quantity > 0 else -1)
+        if new == 0:
+            cost = 0.0
+        elif quantity * new <= 0:
+            cost = price
+        elif abs(new) > abs(quantity):
+            cost = (quantity * cost + delta * price) / new
+        position[0], position[1] = new, cost
+        self.cash -= delta * price + commission
+        self.realized_pnl -= commission
+        if new == 0:
+            del self._positions[contract.symbol]
+
+    def _emit(self, *events: tuple):
+        if not self._events:
+            asyncio.get_event_loop().call_soon(self._deliver)
+        self._events.extend(events)
+
+    def _deliver(self):
+        events, self._events = self._events, []
+        for kind, *args in events:
+            if kind == "status":
+                self.orderStatusEvent.emit(*args)
+            elif kind == "execution":
+                self.execDetailsEvent.emit(*args)
+            else:
+                self.commissionReportEvent.emit(*args)
+
+    # Account
+
+    def _mark(self, symbol: str, fallback: float) -> float:
+        ticker = self._tickers.get(symbol)
+        price = ticker.marketPrice() if ticker is not None else math.nan
+        return fallback if math.isnan(price) else price
+
+    def portfolio(self) -> List[PortfolioItem]:
+        items = []
+        for symbol, (quantity, cost, contract) in self._positions.items():
+            price = self._mark(symbol, cost)
+            items.append(PortfolioItem(
+                contract, quantity, price, quantity * price, cost,
+                quantity * (price - cost), 0.0, ACCOUNT,
+            ))
+        return items
+
+    def positions(self) -> List[Position]:
+        return [Position(ACCOUNT, contract, quantity, cost)
+                for quantity, cost, contract in self._positions.values()]
+
+    def accountSummary(self, account: str = "") -> List[AccountValue]:
+        items = self.portfolio()
+        market_value = sum(item.marketValue for item in items)
+        values = {
+            "NetLiquidation": self.cash + market_value,
+            "TotalCashValue": self.cash,
+            "GrossPositionValue": sum(abs(item.marketValue) for item in items),
+            "UnrealizedPnL": sum(item.unrealizedPNL for item in items),
+            "RealizedPnL": self.realized_pnl,
+        }
+        return [AccountValue(ACCOUNT, tag, str(value), "USD", "") for tag, value in values.items()]
+
+    # Historical data
+
+    async def reqHistoricalDataAsync(self, contract: Contract, endDateTime="", durationStr: str = "1 D",
+                                     barSizeSetting: str = "1 day", whatToShow: str = "TRADES",
+                                     useRTH: bool = True, formatDate: int = 1, keepUpToDate: bool = False,
+                                     **kwargs) -> BarDataList:
+        """Bars from the bar store for the requested span."""
+        store = self._store
+        if store is None:
+            from app.services.bar_store import bar_store as store
+        # IB's UTC form of endDateTime
+        end = datetime.strptime(endDateTime, "%Y%m%d-%H:%M:%S").replace(tzinfo=timezone.utc) if endDateTime else None
+        number, unit = durationStr.split()
+        span = timedelta(seconds=int(number) * DURATION_UNITS[unit])
+        if end is None:
+            last = store.last_timestamp(contract.symbol, TIMEFRAMES[barSizeSetting])
+            end = datetime.fromtimestamp(last / 1e9, timezone.utc) if last is not None else datetime.now(timezone.utc)
+        frame = store.read_frame(contract.symbol, TIMEFRAMES[barSizeSetting], start=end - span, end=end)
+
+        bars = BarDataList()
+        bars.contract = contract
+        bars.endDateTime = endDateTime
+        bars.durationStr = durationStr
+        bars.barSizeSetting = barSizeSetting
+        bars.whatToShow = whatToShow
+        bars.useRTH = useRTH
+        bars.formatDate = formatDate
+        bars.keepUpToDate = keepUpToDate
+        bars.chartOptions = []
+        for timestamp, o, h, l, c, v in zip(frame.index.to_pydatetime(), frame.open.tolist(), frame.high.tolist(),
+                                            frame.low.tolist(), frame.close.tolist(), frame.volume.tolist()):
+            bars.append(BarData(date=timestamp.replace(tzinfo=timezone.utc), open=o, high=h, low=l, close=c, volume=v))
+        if keepUpToDate:
+            if barSizeSetting != "1 min":
+                raise ValueError("The simulated broker only streams 1 min bars")
+            if bars:
+                # Stand-in for the bar in progress
+                last = bars[-1]
+                bars.append(BarData(date=last.date, open=last.close, high=last.close, low=last.close, close=last.close))
+            self._bar_streams.setdefault(contract.symbol, []).append(bars)
+        return bars
+
+    def cancelHistoricalData(self, bars: BarDataList):
+        streams = self._bar_streams.get(bars.contract.symbol, [])
+        if bars in streams:
+            streams.remove(bars)
+
+    def info(self) -> Dict:
+        return {
+            "orders": self.orders,
+            "fills": self.fills,
+            "resting": sum(len(book) for book in self._books.values()),
+            "cash": self.cash,
+            "realized_pnl": self.realized_pnl,
+            "positions": len(self._positions),
+        }
@@ -0,0 +1,174 @@
+"""Persistent, ref-counted IB market data subscriptions.
+
+One streaming ``reqMktData`` subscription is kept per contract and its
+``Ticker`` is updated in place by ib_insync, so quote reads return the
+latest values immediately. Long-lived consumers hold a reference with
+``acquire``/``release``; one-off reads just touch the subscription. Idle
+subscriptions are cancelled after ``MARKET_DATA_IDLE_TTL`` seconds, and the
+least recently used idle one is evicted when the line limit is reached.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+
+from app.brokers.scheduler import RequestScheduler
+from app.core.config import settings
+from app.core.metrics import IB_REQUEST_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class _Subscription:
+    __slots__ = ("contract", "ticker", "handler", "refs", "last_used", "first_tick")
+
+    def __init__(self, contract, ticker, handler):
+        self.contract = contract
+        self.ticker = ticker
+        self.handler = handler
+        self.refs = 0
+        self.last_used = time.monotonic()
+        self.first_tick: Optional[asyncio.Future] = None
+
+
+class SubscriptionManager:
+    def __init__(self, ib, idle_ttl: Optional[float] = None, max_lines: Optional[int] = None,
+                 scheduler: Optional[RequestScheduler] = None):
+        self.ib = ib
+        self.scheduler = scheduler or RequestScheduler(limits={}, message_rate=0)
+        self.idle_ttl = settings.MARKET_DATA_IDLE_TTL if idle_ttl is None else idle_ttl
+        self.max_lines = max_lines or settings.MARKET_DATA_MAX_LINES
+        self._subscriptions: Dict[Hashable, _Subscription] = {}
+        self._listeners: List[Callable] = []
+        self._reaper: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def add_listener(self, callback: Callable):
+        """Call ``callback(key, ticker)`` on every update of a subscribed ticker."""
+        self._listeners.append(callback)
+
+    def _on_update(self, key: Hashable, ticker):
+        sub = self._subscriptions.get(key)
+        if sub is not None and sub.first_tick is not None and not sub.first_tick.done():
+            sub.first_tick.set_result(True)
+        for callback in self._listeners:
+            try:
+                callback(key, ticker)
+            except Exception as e:
+                logger.error(f"Ticker listener failed for {key}: {e}")
+
+    def _evict_idle(self) -> bool:
+        idle = [(sub.last_used, key) for key, sub in self._subscriptions.items() if sub.refs == 0]
+        if not idle:
+            return False
+        _, key = min(idle)
+        self._cancel(key)
+        return True
+
+    def _cancel(self, key: Hashable):
+        sub = self._subscriptions.pop(key, None)
+        if sub is None:
+            return
+        sub.ticker.updateEvent -= sub.handler
+        try:
+            self.ib.cancelMktData(sub.contract)
+        except Exception as e:
+            logger.error(f"Failed to cancel market data for {key}: {e}")
+        logger.info(f"Cancelled market data subscription for {key}")
+
+    async def _subscribe(self, key: Hashable, contract) -> _Subscription:
+        sub = self._subscriptions.get(key)
+        if sub is not None:
+            sub.last_used = time.monotonic()
+            return sub
+
+        if len(self._subscriptions) >= self.max_lines and not self._evict_idle():
+            raise RuntimeError("Market data line limit reached")
+
+        ticker = await self.scheduler.run("market_data", self.ib.reqMktData, contract, key=key)
+        sub = self._subscriptions.get(key)
+        if sub is not None:
+            # A concurrent caller shared the request and already set it up
+            return sub
+        if len(self._subscriptions) >= self.max_lines and not self._evict_idle():
+            # Other subscriptions took the free lines while this request waited its turn
+            self.ib.cancelMktData(contract)
+            raise RuntimeError("Market data line limit reached")
+        sub = _Subscription(contract, ticker, lambda t, key=key: self._on_update(key, t))
+        sub.first_tick = asyncio.get_event_loop().create_future()
+        ticker.updateEvent += sub.handler
+        self._subscriptions[key] = sub
+        logger.info(f"Subscribed to market data for {key}")
+        return sub
+
+    async def ticker(self, key: Hashable, contract, wait: bool = True):
+        """Latest ticker for ``contract``, subscribing on first use.
+
+        Only a brand-new subscription waits (up to
+        ``MARKET_DATA_FIRST_TICK_TIMEOUT``) for its first update.
+        """
+        sub = await self._subscribe(key, contract)
+        if wait and sub.first_tick is not None and not sub.first_tick.done():
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(
+                    asyncio.shield(sub.first_tick), settings.MARKET_DATA_FIRST_TICK_TIMEOUT
+                )
+                IB_REQUEST_LATENCY.labels("market_data_first_tick").observe(time.perf_counter() - started)
+            except asyncio.TimeoutError:
+                logger.warning(f"No market data yet for {key}")
+        return sub.ticker
+
+    def latest(self, key: Hashable):
+        """Cached ticker without subscribing, or None."""
+        sub = self._subscriptions.get(key)
+        if sub is None:
+            return None
+        sub.last_used = time.monotonic()
+        return sub.ticker
+
+    async def acquire(self, key: Hashable, contract):
+        """Hold a subscription open until the matching ``release``."""
+        ticker = await self.ticker(key, contract, wait=False)
+        self._subscriptions[key].refs += 1
+        return ticker
+
+    def release(self, key: Hashable):
+        sub = self._subscriptions.get(key)
+        if sub is not None and sub.refs > 0:
+            sub.refs -= 1
+            sub.last_used = time.monotonic()
+
+    def reap(self, now: Optional[float] = None) -> int:
+        """Cancel unreferenced subscriptions idle for longer than the TTL."""
+        now = time.monotonic() if now is None else now
+        expired = [
+            key
+            for key, sub in self._subscriptions.items()
+            if sub.refs == 0 and now - sub.last_used > self.idle_ttl
+        ]
+        for key in expired:
+            self._cancel(key)
+        return len(expired)
+
+    async def _reap_forever(self):
+        interval = max(1.0, self.idle_ttl / 4)
+        while True:
+            await asyncio.sleep(interval)
+            self.reap()
+
+    def start(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_event_loop().create_task(self._reap_forever())
+
+    def stop(self):
+        """Stop the reaper and forget every subscription (e.g. on disconnect)."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for sub in self._subscriptions.values():
+            sub.ticker.updateEvent -= sub.handler
+        self._subscriptions.clear()
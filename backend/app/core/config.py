@@ -18,9 +18,46 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "password")
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "trading_bot")
     DATABASE_URL: str = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}/{POSTGRES_DB}"
+    ASYNC_DATABASE_URL: str = os.getenv("ASYNC_DATABASE_URL", "")  # DATABASE_URL with asyncpg when empty
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "5"))  # seconds to wait for a connection
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
+    
+    # Columnar bar store (memory-mapped OHLCV files)
+    BAR_STORE_PATH: str = os.getenv("BAR_STORE_PATH", "data/bars")
+    
+    # Historical bar ingestion
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "50000"))
+    INGEST_CONCURRENCY: int = int(os.getenv("INGEST_CONCURRENCY", "4"))
+    
+    # WebSocket fan-out
+    WS_QUEUE_SIZE: int = int(os.getenv("WS_QUEUE_SIZE", "256"))  # pending messages per client
+    WS_SEND_TIMEOUT: float = 5.0  # seconds before a stalled client is dropped
+    QUOTE_PUSH_INTERVAL: float = float(os.getenv("QUOTE_PUSH_INTERVAL", "0.1"))  # seconds between quote frames per symbol
+    QUOTE_SNAPSHOT_INTERVAL: float = 5.0  # seconds between full quote frames
     
     # Redis
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "true").lower() == "true"  # response cache for read endpoints
+    CACHE_TTL: float = float(os.getenv("CACHE_TTL", "60"))  # seconds; upper bound on staleness
+    CACHE_LIVE_TTL: float = 1.0  # seconds for responses that include the live in-progress bar
+    CACHE_MAX_CONNECTIONS: int = int(os.getenv("CACHE_MAX_CONNECTIONS", "20"))
+    CACHE_TIMEOUT: float = 0.25  # seconds to wait for a connection or reply
+    CACHE_RETRY_INTERVAL: float = 5.0  # seconds the cache is bypassed after a Redis error
+    JOB_TTL: float = 24 * 60 * 60  # seconds background job state (backfills, optimizations) is kept
+    
+    # Instrumentation
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # Prometheus /metrics
+    GATEWAY_METRICS_PORT: int = int(os.getenv("GATEWAY_METRICS_PORT", "9100"))  # the gateway's own /metrics
+    PROFILER_INTERVAL: float = 0.005  # seconds between stack samples while the profiler runs
+    PROFILER_MAX_DURATION: float = 600.0  # seconds after which a forgotten profiler stops itself
+    
+    # Process layout: "standalone" runs the IB session in the API process; "api" workers
+    # leave it to the broker gateway (python -m app.gateway) and reach it over Redis
+    PROCESS_ROLE: str = os.getenv("PROCESS_ROLE", "standalone")
+    GATEWAY_RPC_TIMEOUT: float = 10.0  # seconds an API worker waits for the gateway to answer
+    GATEWAY_HEARTBEAT: float = 2.0  # seconds between workers announcing their subscriptions
     
     # Trading settings (Israeli market specific)
     TRADING_ENABLED: bool = False  # Start with paper trading
@@ -28,11 +65,45 @@ class Settings(BaseSettings):
     MAX_POSITION_SIZE: float = 0.15  # 15%
     TASE_TRADING_HOURS: Dict[str, str] = {"start": "10:00", "end": "17:25"}
     US_TRADING_HOURS: Dict[str, str] = {"start": "16:30", "end": "23:00"}  # Israel time
+    SESSION_TIMEZONE: str = "Asia/Jerusalem"  # Time zone of the trading hours above
+    BASE_TIMEFRAME: str = "1m"  # Stored timeframe higher ones are aggregated from
+    
+    # Live trading pipeline
+    ORDER_BATCH_SIZE: int = 100  # orders handed to IB per batch
+    FILL_FLUSH_INTERVAL: float = 1.0  # seconds between bulk writes of fills
+    FILL_COMMISSION_WAIT: float = 5.0  # seconds a fill waits for its commission report
+    VALUATION_FLUSH_INTERVAL: float = 5.0  # seconds between portfolio snapshots to the database
+    PORTFOLIO_PUSH_INTERVAL: float = 0.5  # seconds between portfolio totals pushed over /ws
+    STRATEGY_WORKERS: int = int(os.getenv("STRATEGY_WORKERS", "4"))  # live strategy evaluation threads
+    # Indicator matrices each optimizer worker keeps for reuse across parameter combinations
+    INDICATOR_CACHE_BYTES: int = int(os.getenv("INDICATOR_CACHE_BYTES", str(512 * 1024 * 1024)))
     
     # Broker settings
     IB_HOST: str = os.getenv("IB_HOST", "127.0.0.1")
     IB_PORT: int = int(os.getenv("IB_PORT", "7497"))  # Paper trading port
     IB_CLIENT_ID: int = int(os.getenv("IB_CLIENT_ID", "1"))
+    MARKET_DATA_MAX_LINES: int = int(os.getenv("MARKET_DATA_MAX_LINES", "100"))  # IB market data line limit
+    MARKET_DATA_IDLE_TTL: float = float(os.getenv("MARKET_DATA_IDLE_TTL", "300"))  # seconds
+    MARKET_DATA_FIRST_TICK_TIMEOUT: float = 2.0  # seconds to wait for a new subscription's first tick
+    IB_MESSAGE_RATE: float = 40.0  # requests per second across all types; IB's limit is 50
+    # Historical data: IB allows 60 requests in any 10 minutes, and a burst of 6 plus 0.09/s stays within it
+    IB_HISTORICAL_RATE: float = 0.09
+    IB_HISTORICAL_BURST: int = 6
+    IB_PACING_RETRIES: int = 3  # retries of a request IB rejected for pacing
+    IB_PACING_BACKOFF: float = 15.0  # seconds before the first retry, doubling after each
+    CONTRACT_CACHE_SIZE: int = 5000
+    CONTRACT_CACHE_TTL: float = 24 * 60 * 60  # seconds
+    # Symbols to qualify at startup, by exchange (TASE or US)
+    TRADING_UNIVERSE: Dict[str, List[str]] = {"TASE": [], "US": []}
+    
+    # Simulated broker
+    BROKER: str = os.getenv("BROKER", "ib")  # "ib" or "simulated" (in-process matching engine)
+    SIM_STARTING_CASH: float = 100000.0
+    SIM_SPREAD_BPS: float = 2.0  # quoted bid/ask spread around the last price
+    SIM_COMMISSION_PER_SHARE: float = 0.005
+    SIM_MIN_COMMISSION: float = 1.0
+    REPLAY_SPEED: float = 1.0  # market time per wall time for replays; 0 replays as fast as possible
+    REPLAY_YIELD_EVERY: int = 1000  # bars published before giving the event loop a turn when not paced
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,175 @@
+"""Prometheus metrics.
+
+Latencies are histograms observed inline (a lock and a bucket search, about
+a microsecond each):
+
+* ``http_request_duration_seconds``: per route template, from the ASGI
+  ``MetricsMiddleware``.
+* ``db_query_duration_seconds``: per statement type, from SQLAlchemy cursor
+  events on the sync and async engines.
+* ``ib_request_duration_seconds``: IB round trips (contract qualification,
+  historical data, first market data tick).
+* ``order_ack_duration_seconds`` / ``order_fill_duration_seconds``: from
+  ``placeOrder`` to IB's first status and first execution of the order.
+* ``strategy_evaluation_duration_seconds``: per symbol, live strategy
+  evaluation on the worker threads.
+* ``ws_send_duration_seconds``: WebSocket frame sends.
+
+Response cache activity is counted: ``response_cache_lookups_total`` per
+namespace and outcome (``hit``/``miss``), ``response_cache_writes_total``
+per outcome (``stored``, or ``stale`` when an invalidation raced the
+response being built), ``response_cache_errors_total`` per action and
+``response_cache_invalidations_total``.
+
+Values that are cheaper to read than to track, such as WebSocket queue
+depth, are gauges computed when scraped (``gauge_callback``).
+
+The API serves ``/metrics``. With several uvicorn workers, set
+``PROMETHEUS_MULTIPROC_DIR`` to a shared, emptied-at-start directory so
+every worker reports the totals (docker-compose does both); workers mark
+themselves dead there on shutdown. The broker gateway serves its own
+``/metrics`` on ``GATEWAY_METRICS_PORT``.
+"""
+
+import logging
+import os
+import time
+from typing import Callable, List, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds; from sub-millisecond handlers and queries up to slow IB requests
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FILL_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Database statement latency", ["operation"], buckets=LATENCY_BUCKETS,
+)
+IB_REQUEST_LATENCY = Histogram(
+    "ib_request_duration_seconds", "IB request round trip", ["request"], buckets=LATENCY_BUCKETS,
+)
+ORDER_ACK_LATENCY = Histogram(
+    "order_ack_duration_seconds", "placeOrder to the first status from IB", buckets=LATENCY_BUCKETS,
+)
+ORDER_FILL_LATENCY = Histogram(
+    "order_fill_duration_seconds", "placeOrder to the first execution", buckets=FILL_BUCKETS,
+)
+STRATEGY_EVALUATION = Histogram(
+    "strategy_evaluation_duration_seconds", "Live strategy evaluation of one bar", ["symbol"],
+    buckets=LATENCY_BUCKETS,
+)
+WS_SEND_LATENCY = Histogram(
+    "ws_send_duration_seconds", "WebSocket frame send", buckets=LATENCY_BUCKETS,
+)
+
+CACHE_LOOKUPS = Counter("response_cache_lookups", "Response cache lookups", ["namespace", "outcome"])
+CACHE_WRITES = Counter("response_cache_writes", "Response cache writes", ["outcome"])
+CACHE_ERRORS = Counter("response_cache_errors", "Response cache Redis failures", ["action"])
+CACHE_INVALIDATIONS = Counter("response_cache_invalidations", "Response cache namespace invalidations")
+
+
+class _CallbackCollector:
+    def __init__(self):
+        self.gauges: List[Tuple[str, str, Callable[[], float]]] = []
+
+    def collect(self):
+        for name, documentation, fn in self.gauges:
+            try:
+                value = fn()
+            except Exception as e:
+                logger.error(f"Metric {name} failed: {e}")
+                continue
+            yield GaugeMetricFamily(name, documentation, value=value)
+
+
+_callbacks = _CallbackCollector()
+REGISTRY.register(_callbacks)
+
+
+def gauge_callback(name: str, documentation: str, fn: Callable[[], float]):
+    """Report ``fn()`` as a gauge, computed on every scrape."""
+    _callbacks.gauges.append((name, documentation, fn))
+
+
+def render() -> Tuple[bytes, str]:
+    """Body and content type of a scrape."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # Callback gauges describe this worker only
+        registry.register(_callbacks)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """Let the other workers drop this one's live series (multiprocess mode only)."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricsMiddleware:
+    """Times every HTTP request, labelled by route template rather than raw path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            REQUEST_LATENCY.labels(scope["method"], route_template(scope), str(status)).observe(
+                time.perf_counter() - started
+            )
+
+
+def route_template(scope) -> str:
+    """The matched route's path template, e.g. ``/api/v1/market-data/{symbol}``.
+
+    Routes added through ``include_router`` carry their full prefixed path.
+    Requests no route matched share one label, so scanners cannot blow up
+    the series.
+    """
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def instrument_engine(engine):
+    """Time every statement ``engine`` (a sync ``Engine``) executes."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip()[:6].upper()
+        DB_QUERY_LATENCY.labels(operation if operation in SQL_OPERATIONS else "OTHER").observe(
+            time.perf_counter() - context._query_started
+        )
@@ -0,0 +1,24 @@
+"""JSON encoding for API responses.
+
+orjson encodes datetimes, numpy arrays and numpy scalars natively, so
+responses built from selected column tuples or bar store arrays skip
+FastAPI's ``jsonable_encoder`` pass and the stdlib encoder entirely.
+Datetimes come out in the same ISO 8601 form as before.
+"""
+
+from typing import Any, Dict, Optional
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+import orjson
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(data: Any) -> bytes:
+    """Encode ``data`` as JSON; types orjson does not know go through ``jsonable_encoder``."""
+    return orjson.dumps(data, default=jsonable_encoder, option=OPTIONS)
+
+
+def json_response(data: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(content=dumps(data), media_type="application/json", headers=headers)
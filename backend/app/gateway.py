@@ -0,0 +1,35 @@
+"""Broker gateway process: ``python -m app.gateway``.
+
+Owns the IB session and the live services for API workers started with
+``PROCESS_ROLE=api`` (see ``app.services.gateway``).
+"""
+
+import asyncio
+import logging
+import signal
+
+from prometheus_client import start_http_server
+
+from app.core.config import settings
+from app.services.cache import response_cache
+from app.services.gateway import gateway, start_live_services, stop_live_services
+
+
+async def main():
+    if settings.METRICS_ENABLED:
+        start_http_server(settings.GATEWAY_METRICS_PORT)
+    gateway.start()
+    await start_live_services()
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    await stopping.wait()
+    await stop_live_services()
+    await gateway.stop()
+    await response_cache.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -1,11 +1,14 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from app.core.config import settings
 from app.api import api_router
-import json
-import asyncio
-from typing import List
+from app.core.metrics import MetricsMiddleware, mark_process_dead, render
+from app.services.broadcaster import broadcaster
+from app.services.cache import response_cache
+from app.services.gateway import GatewayError, gateway_client, start_live_services, stop_live_services
+from app.services.jobs import job_store
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -22,43 +25,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include API routes
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
-# WebSocket connection manager for real-time updates
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+@app.exception_handler(GatewayError)
+async def gateway_unavailable(request: Request, exc: GatewayError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+@app.on_event("startup")
+async def startup():
+    if settings.PROCESS_ROLE == "api":
+        # The broker gateway owns the IB session; this worker only relays to it
+        await gateway_client.start()
+    else:
+        await start_live_services()
 
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(json.dumps(message))
-            except:
-                pass
-
-manager = ConnectionManager()
+@app.on_event("shutdown")
+async def shutdown():
+    if settings.PROCESS_ROLE == "api":
+        await gateway_client.stop()
+    else:
+        await stop_live_services()
+    await response_cache.close()
+    await job_store.close()
+    mark_process_dead()
 
+# Real-time updates are fanned out to subscribed clients by the broadcaster
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    topics = [t for t in websocket.query_params.get("topics", "").split(",") if t]
+    await broadcaster.connect(websocket, topics)
     try:
         while True:
             data = await websocket.receive_text()
-            # Handle incoming messages from frontend
-            await manager.send_personal_message(f"Message received: {data}", websocket)
+            # Handle subscription commands from frontend
+            broadcaster.handle(websocket, data)
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        broadcaster.disconnect(websocket)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render()
+    return Response(body, media_type=content_type)
 
 # Serve React build files in production
 app.mount("/", StaticFiles(directory="../frontend/build", html=True), name="static")
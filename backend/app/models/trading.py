@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -59,9 +59,14 @@ class Strategy(Base):
 
 class MarketData(Base):
     __tablename__ = "market_data"
+    __table_args__ = (
+        # Backs the symbol + timeframe lookups ordered by timestamp (in either direction)
+        UniqueConstraint("symbol", "timeframe", "timestamp", name="uq_market_data_symbol_timeframe_timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    symbol = Column(String, index=True)
+    symbol = Column(String)
+    exchange = Column(String, nullable=True)  # TASE, NASDAQ, NYSE
     timestamp = Column(DateTime, index=True)
     open_price = Column(Float)
     high_price = Column(Float)
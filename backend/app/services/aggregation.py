@@ -0,0 +1,238 @@
+"""Derive higher-timeframe bars from the base 1m series.
+
+Buckets are anchored to the exchange session open (``TASE_TRADING_HOURS`` /
+``US_TRADING_HOURS`` in ``SESSION_TIMEZONE``), so 1h bars on the US session
+run 16:30-17:30, ... and the last bucket is cut at the session close. Bars
+outside the session are ignored. A bar is labelled with its bucket start.
+
+``resample`` aggregates stored bars with vectorized segment reductions;
+``AggregationService`` keeps the in-progress bar per (symbol, timeframe) up
+to date one base bar at a time and reports buckets as they close. Live base
+bars are written to the bar store as they arrive, and closed derived bars
+for every timeframe the store already keeps for the symbol, so reads cover
+everything up to the in-progress bar. Writes run on one background thread,
+in arrival order.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.services.bar_store import COLUMNS, Bars, bar_store, to_nanos
+
+logger = logging.getLogger(__name__)
+
+
+TIMEFRAME_MINUTES = {"1m": 1, "5m": 5, "1h": 60, "1d": 1440}
+
+NS_PER_MINUTE = 60 * 10**9
+NS_PER_DAY = 1440 * NS_PER_MINUTE
+
+
+def _minutes(hhmm: str) -> int:
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def session_hours(exchange: str) -> Tuple[int, int]:
+    """Session (open, close) in minutes after local midnight."""
+    hours = settings.TASE_TRADING_HOURS if exchange == "TASE" else settings.US_TRADING_HOURS
+    return _minutes(hours["start"]), _minutes(hours["end"])
+
+
+def _to_local_wall(ts: np.ndarray) -> np.ndarray:
+    """UTC nanoseconds to wall-clock nanoseconds in the session time zone."""
+    index = pd.DatetimeIndex(ts.view("datetime64[ns]"), tz="UTC")
+    return index.tz_convert(settings.SESSION_TIMEZONE).tz_localize(None).asi8
+
+
+def _to_utc(wall: np.ndarray) -> np.ndarray:
+    index = pd.DatetimeIndex(wall.view("datetime64[ns]"))
+    # Only labels outside the session can land on DST gaps; those are discarded anyway
+    index = index.tz_localize(settings.SESSION_TIMEZONE, ambiguous="NaT", nonexistent="shift_forward")
+    return index.tz_convert("UTC").tz_localize(None).asi8
+
+
+def bucket_keys(ts: np.ndarray, timeframe: str, exchange: str):
+    """Bucket id and start label (UTC ns) for each base bar; id is -1 outside the session."""
+    step = TIMEFRAME_MINUTES[timeframe]
+    open_minute, close_minute = session_hours(exchange)
+    wall = _to_local_wall(np.asarray(ts, dtype=np.int64))
+    day = wall // NS_PER_DAY
+    minute = (wall % NS_PER_DAY) // NS_PER_MINUTE
+    since_open = minute - open_minute
+    slot = since_open // step
+    inside = (since_open >= 0) & (minute < close_minute)
+
+    keys = np.where(inside, day * 10000 + slot, -1)
+    labels = _to_utc(day * NS_PER_DAY + (open_minute + slot * step) * NS_PER_MINUTE)
+    return keys, labels
+
+
+def resample(bars: Bars, timeframe: str, exchange: str) -> Bars:
+    """Aggregate base bars (sorted by time) into ``timeframe`` bars."""
+    if len(bars) == 0 or timeframe == settings.BASE_TIMEFRAME:
+        return bars
+    keys, labels = bucket_keys(bars.timestamp, timeframe, exchange)
+    inside = keys >= 0
+    if not inside.any():
+        return Bars.empty()
+    keys = keys[inside]
+    labels = labels[inside]
+    bars = Bars(**{name: np.asarray(getattr(bars, name))[inside] for name in COLUMNS})
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    return Bars(
+        timestamp=labels[starts],
+        open=bars.open[starts],
+        high=np.maximum.reduceat(bars.high, starts),
+        low=np.minimum.reduceat(bars.low, starts),
+        close=bars.close[ends],
+        volume=np.add.reduceat(bars.volume, starts),
+    )
+
+
+def read_resampled(store, symbol: str, exchange: str, timeframe: str,
+                   start=None, end=None, limit: Optional[int] = None, newest: bool = True) -> Bars:
+    """Read base bars from ``store`` and aggregate them to ``timeframe``.
+
+    With ``limit`` base bars are read from the newest (or oldest) end of the
+    range, doubling the read until it holds ``limit`` buckets plus one more
+    or the range is exhausted, so gaps and short sessions still fill the
+    page. The bucket at the far end of a partial read is dropped in case it
+    was cut short.
+    """
+    if limit is None:
+        return resample(store.read(symbol, settings.BASE_TIMEFRAME, start, end), timeframe, exchange)
+    if limit == 0:
+        return Bars.empty()
+    base_limit = (limit + 1) * TIMEFRAME_MINUTES[timeframe]
+    while True:
+        base = store.read(symbol, settings.BASE_TIMEFRAME, start, end, limit=base_limit, newest=newest)
+        out = resample(base, timeframe, exchange)
+        if len(base) < base_limit:
+            break
+        if len(out) > limit:
+            out = out[1:] if newest else out[:-1]
+            break
+        base_limit *= 2
+    return out[-limit:] if newest else out[:limit]
+
+
+class _PartialBar:
+    __slots__ = ("key", "timestamp", "open", "high", "low", "close", "volume")
+
+    def __init__(self, key: int, timestamp: int, open_price: float, high: float, low: float,
+                 close: float, volume: int):
+        self.key = key
+        self.timestamp = timestamp
+        self.open = open_price
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    def as_dict(self, symbol: str, timeframe: str) -> Dict:
+        return {
+            "symbol": symbol,
+            "timeframe": timeframe,
+            "timestamp": pd.Timestamp(self.timestamp).to_pydatetime(),
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "volume": self.volume,
+        }
+
+
+class AggregationService:
+    """Incrementally maintained partial bars for derived timeframes."""
+
+    def __init__(self, timeframes=("5m", "1h", "1d"), store=bar_store):
+        self.timeframes = list(timeframes)
+        self.store = store
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bar-writer")
+        self._partials: Dict[Tuple[str, str], _PartialBar] = {}
+        self._listeners: List[Callable[[Dict], None]] = []
+
+    def subscribe(self, callback: Callable[[Dict], None]):
+        """Call ``callback(bar)`` whenever a derived bar closes."""
+        self._listeners.append(callback)
+
+    def partial(self, symbol: str, timeframe: str) -> Optional[Dict]:
+        bar = self._partials.get((symbol, timeframe))
+        return bar.as_dict(symbol, timeframe) if bar else None
+
+    def _persist(self, symbol: str, exchange: str, timeframe: str, bars: List[Tuple]):
+        try:
+            if timeframe != settings.BASE_TIMEFRAME and self.store.last_timestamp(symbol, timeframe) is None:
+                # Not kept for this symbol; reads derive it from the base bars
+                return
+            # The exchange recorded at ingestion stands
+            exchange = self.store.exchange(symbol, timeframe) or exchange
+            self.store.append(symbol, timeframe, *zip(*bars), exchange=exchange)
+        except Exception as e:
+            logger.error(f"Failed to store live {timeframe} bars for {symbol}: {e}")
+
+    def on_bar(self, symbol: str, exchange: str, timestamp, open_price: float, high: float,
+               low: float, close: float, volume: int) -> List[Dict]:
+        """Fold one base bar (labelled with its start) into every derived timeframe.
+
+        Returns the derived bars that closed with it. A bucket closes as soon
+        as its last base bar arrives, or when a bar from a later bucket shows up.
+        """
+        ts = np.array([pd.Timestamp(timestamp).value], dtype=np.int64)
+        self._writer.submit(
+            self._persist, symbol, exchange, settings.BASE_TIMEFRAME,
+            [(int(ts[0]), open_price, high, low, close, volume)],
+        )
+        open_minute, close_minute = session_hours(exchange)
+        wall_minute = int((_to_local_wall(ts)[0] % NS_PER_DAY) // NS_PER_MINUTE)
+
+        closed = []
+        for timeframe in self.timeframes:
+            keys, labels = bucket_keys(ts, timeframe, exchange)
+            key = int(keys[0])
+            if key < 0:
+                continue
+            slot_key = (symbol, timeframe)
+            bar = self._partials.get(slot_key)
+            if bar is not None and bar.key != key:
+                closed.append(bar.as_dict(symbol, timeframe))
+                bar = None
+            if bar is None:
+                bar = self._partials[slot_key] = _PartialBar(
+                    key, int(labels[0]), open_price, high, low, close, volume
+                )
+            else:
+                bar.high = max(bar.high, high)
+                bar.low = min(bar.low, low)
+                bar.close = close
+                bar.volume += volume
+
+            step = TIMEFRAME_MINUTES[timeframe]
+            next_minute = wall_minute + 1
+            if next_minute >= close_minute or (next_minute - open_minute) % step == 0:
+                closed.append(bar.as_dict(symbol, timeframe))
+                del self._partials[slot_key]
+
+        for bar in closed:
+            self._writer.submit(
+                self._persist, symbol, exchange, bar["timeframe"],
+                [(to_nanos(bar["timestamp"]), bar["open"], bar["high"], bar["low"], bar["close"], bar["volume"])],
+            )
+            for callback in self._listeners:
+                try:
+                    callback(bar)
+                except Exception as e:
+                    logger.error(f"Bar close listener failed: {e}")
+        return closed
+
+
+# Global aggregation service instance
+aggregation_service = AggregationService()
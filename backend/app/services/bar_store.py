@@ -0,0 +1,362 @@
+"""Columnar, memory-mapped OHLCV bar store.
+
+Bars for each (symbol, timeframe) live in one directory with a flat binary
+file per column: int64 nanosecond timestamps, float64 prices and int64
+volume. Reads memory-map the files and hand out NumPy views, so loading a
+year of minute bars costs a few page faults instead of one ORM object per
+row. New bars are appended to the end of each column file, under an
+exclusive ``fcntl`` lock on the directory's ``.lock`` file so API workers,
+the gateway and ingest jobs in other processes never interleave writes.
+Older or corrected bars are merged in by rewriting the column files, which
+readers notice by the timestamp file's inode.
+The exchange the bars were ingested for, when known, is kept next to them
+in an ``exchange`` file.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+import fcntl
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.trading import MarketData
+
+logger = logging.getLogger(__name__)
+
+
+COLUMNS: Dict[str, np.dtype] = {
+    "timestamp": np.dtype("<i8"),
+    "open": np.dtype("<f8"),
+    "high": np.dtype("<f8"),
+    "low": np.dtype("<f8"),
+    "close": np.dtype("<f8"),
+    "volume": np.dtype("<i8"),
+}
+
+
+@dataclass
+class Bars:
+    """Column views for a run of bars, oldest first."""
+
+    timestamp: np.ndarray  # int64 nanoseconds since epoch (UTC)
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    def __getitem__(self, key: slice) -> "Bars":
+        return Bars(**{name: getattr(self, name)[key] for name in COLUMNS})
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self.timestamp.view("datetime64[ns]"), name="timestamp")
+
+    def to_frame(self) -> pd.DataFrame:
+        """OHLCV frame indexed by timestamp, backed by the column views where pandas allows."""
+        return pd.DataFrame(
+            {name: getattr(self, name) for name in COLUMNS if name != "timestamp"},
+            index=self.index,
+            copy=False,
+        )
+
+    @classmethod
+    def empty(cls) -> "Bars":
+        return cls(**{name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()})
+
+
+def to_nanos(value) -> int:
+    return int(pd.Timestamp(value).value)
+
+
+class BarStore:
+    def __init__(self, root: str):
+        self.root = root
+        self._maps: Dict[Tuple[str, str], Tuple[Tuple[int, int], Bars]] = {}
+
+    def _dir(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, timeframe, symbol)
+
+    def _path(self, symbol: str, timeframe: str, column: str) -> str:
+        return os.path.join(self._dir(symbol, timeframe), f"{column}.bin")
+
+    @contextmanager
+    def _locked(self, symbol: str, timeframe: str, shared: bool = False):
+        """Hold the lock of one (symbol, timeframe), across threads and processes.
+
+        Writers take it exclusively; readers take it shared while mapping, so
+        they never see a rewrite half done.
+        """
+        directory = self._dir(symbol, timeframe)
+        os.makedirs(directory, exist_ok=True)
+        # flock locks belong to the open file, so threads of one process exclude each other too
+        with open(os.path.join(directory, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _length(self, symbol: str, timeframe: str) -> int:
+        """Complete rows on disk; a torn append leaves some columns longer."""
+        lengths = []
+        for column, dtype in COLUMNS.items():
+            try:
+                lengths.append(os.path.getsize(self._path(symbol, timeframe, column)) // dtype.itemsize)
+            except FileNotFoundError:
+                return 0
+        return min(lengths)
+
+    def _version(self, symbol: str, timeframe: str) -> Tuple[int, int]:
+        """Changes on every append (length) and every rewrite (the timestamp file is replaced)."""
+        try:
+            inode = os.stat(self._path(symbol, timeframe, "timestamp")).st_ino
+        except FileNotFoundError:
+            return 0, 0
+        return inode, self._length(symbol, timeframe)
+
+    def _map(self, symbol: str, timeframe: str) -> Bars:
+        cached = self._maps.get((symbol, timeframe))
+        version = self._version(symbol, timeframe)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if version[1] == 0:
+            return Bars.empty()
+        with self._locked(symbol, timeframe, shared=True):
+            return self._load(symbol, timeframe)
+
+    def _load(self, symbol: str, timeframe: str) -> Bars:
+        """Map the columns as they are on disk; the caller holds the lock."""
+        version = self._version(symbol, timeframe)
+        if version[1] == 0:
+            return Bars.empty()
+        bars = Bars(
+            **{
+                column: np.memmap(
+                    self._path(symbol, timeframe, column), dtype=dtype, mode="r", shape=(version[1],)
+                )
+                for column, dtype in COLUMNS.items()
+            }
+        )
+        self._maps[(symbol, timeframe)] = (version, bars)
+        return bars
+
+    def read(
+        self,
+        symbol: str,
+        timeframe: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        newest: bool = True,
+    ) -> Bars:
+        """Return zero-copy views of the bars in ``[start, end]``.
+
+        With ``limit`` only the most recent ``limit`` bars of the range are
+        returned, or the oldest ones when ``newest`` is False.
+        """
+        bars = self._map(symbol, timeframe)
+        lo, hi = 0, len(bars)
+        if start is not None:
+            lo = int(np.searchsorted(bars.timestamp, to_nanos(start), side="left"))
+        if end is not None:
+            hi = int(np.searchsorted(bars.timestamp, to_nanos(end), side="right"))
+        if limit is not None:
+            if newest:
+                lo = max(lo, hi - limit)
+            else:
+                hi = min(hi, lo + limit)
+        return bars[lo:hi]
+
+    def read_frame(self, symbol: str, timeframe: str, **kwargs) -> pd.DataFrame:
+        return self.read(symbol, timeframe, **kwargs).to_frame()
+
+    def read_panel(
+        self,
+        symbols: List[str],
+        timeframe: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ):
+        """Close/volume matrices for ``symbols`` aligned on the union of timestamps.
+
+        Same shape and fill rules as ``backtest.engine.load_bars``.
+        """
+        closes, volumes = {}, {}
+        for symbol in symbols:
+            bars = self.read(symbol, timeframe, start, end)
+            closes[symbol] = pd.Series(bars.close, index=bars.timestamp)
+            volumes[symbol] = pd.Series(bars.volume, index=bars.timestamp)
+        close = pd.DataFrame(closes).reindex(columns=symbols).sort_index().ffill().bfill()
+        volume = pd.DataFrame(volumes).reindex(index=close.index, columns=symbols).fillna(0)
+        timestamps = close.index.to_numpy(dtype=np.int64).view("datetime64[ns]")
+        return timestamps, close.to_numpy(dtype=np.float64), volume.to_numpy(dtype=np.float64)
+
+    def exchange(self, symbol: str, timeframe: str) -> Optional[str]:
+        """Exchange the stored bars were ingested for, None if unknown."""
+        try:
+            with open(os.path.join(self._dir(symbol, timeframe), "exchange")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def last_timestamp(self, symbol: str, timeframe: str) -> Optional[int]:
+        bars = self._map(symbol, timeframe)
+        return int(bars.timestamp[-1]) if len(bars) else None
+
+    def symbols(self, timeframe: str) -> List[str]:
+        path = os.path.join(self.root, timeframe)
+        if not os.path.isdir(path):
+            return []
+        return sorted(os.listdir(path))
+
+    def append(
+        self,
+        symbol: str,
+        timeframe: str,
+        timestamps,
+        opens,
+        highs,
+        lows,
+        closes,
+        volumes,
+        exchange: Optional[str] = None,
+    ) -> int:
+        """Write bars into the store; returns how many were added or changed.
+
+        Input must be sorted by timestamp. Bars after the stored tail are
+        appended. Earlier ones (an older backfill, or corrected values) are
+        merged in by rewriting the columns, the incoming bar winning on equal
+        timestamps; bars already stored unchanged are skipped, so re-running a
+        backfill is harmless. ``exchange``, when given, is recorded for the
+        symbol.
+        """
+        timestamps = np.asarray(timestamps)
+        if timestamps.dtype.kind == "M":
+            timestamps = timestamps.astype("datetime64[ns]").view(np.int64)
+        columns = {
+            "timestamp": timestamps,
+            "open": opens,
+            "high": highs,
+            "low": lows,
+            "close": closes,
+            "volume": volumes,
+        }
+        columns = {column: np.asarray(columns[column], dtype=dtype) for column, dtype in COLUMNS.items()}
+        if not len(timestamps):
+            return 0
+
+        with self._locked(symbol, timeframe):
+            self._truncate_torn(symbol, timeframe)
+            if exchange and exchange != self.exchange(symbol, timeframe):
+                with open(os.path.join(self._dir(symbol, timeframe), "exchange"), "w") as f:
+                    f.write(exchange)
+
+            stored = self._load(symbol, timeframe)
+            start = int(np.searchsorted(timestamps, stored.timestamp[-1], side="right")) if len(stored) else 0
+            written = self._merge(symbol, timeframe, stored, {c: v[:start] for c, v in columns.items()})
+            for column in COLUMNS:
+                data = np.ascontiguousarray(columns[column][start:])
+                with open(self._path(symbol, timeframe, column), "ab") as f:
+                    f.write(data.tobytes())
+            return written + len(timestamps) - start
+
+    def _merge(self, symbol: str, timeframe: str, stored: Bars, incoming: Dict[str, np.ndarray]) -> int:
+        """Fold bars at or before the stored tail into the columns; returns how many were new or changed."""
+        if not len(incoming["timestamp"]):
+            return 0
+        positions = np.minimum(np.searchsorted(stored.timestamp, incoming["timestamp"]), len(stored) - 1)
+        present = stored.timestamp[positions] == incoming["timestamp"]
+        changed = ~present
+        for column in COLUMNS:
+            if column != "timestamp":
+                old = np.asarray(getattr(stored, column)[positions[present]])
+                new = incoming[column][present]
+                same = old == new
+                if old.dtype.kind == "f":
+                    # NaN != NaN, but a stored NaN is not a change
+                    same |= np.isnan(old) & np.isnan(new)
+                changed[present] |= ~same
+        if not changed.any():
+            return 0
+
+        keep = ~np.isin(stored.timestamp, incoming["timestamp"])
+        order = np.argsort(np.concatenate([stored.timestamp[keep], incoming["timestamp"]]), kind="stable")
+        # Readers check the timestamp file's inode, so it is replaced last
+        for column in [c for c in COLUMNS if c != "timestamp"] + ["timestamp"]:
+            merged = np.concatenate([getattr(stored, column)[keep], incoming[column]])[order]
+            path = self._path(symbol, timeframe, column)
+            with open(path + ".tmp", "wb") as f:
+                f.write(merged.tobytes())
+            os.replace(path + ".tmp", path)
+        logger.info(f"Merged {int(changed.sum())} earlier or corrected {timeframe} bars into {symbol}")
+        return int(changed.sum())
+
+    def append_frame(self, symbol: str, timeframe: str, df: pd.DataFrame, exchange: Optional[str] = None) -> int:
+        """Append an OHLCV frame indexed (or with a ``timestamp`` column) by time."""
+        timestamps = df["timestamp"] if "timestamp" in df.columns else df.index
+        return self.append(
+            symbol,
+            timeframe,
+            pd.DatetimeIndex(timestamps).as_unit("ns").asi8,
+            df["open"].to_numpy(),
+            df["high"].to_numpy(),
+            df["low"].to_numpy(),
+            df["close"].to_numpy(),
+            df["volume"].to_numpy(),
+            exchange,
+        )
+
+    def _truncate_torn(self, symbol: str, timeframe: str):
+        """Cut every column back to the common length after an interrupted append."""
+        length = self._length(symbol, timeframe)
+        for column, dtype in COLUMNS.items():
+            path = self._path(symbol, timeframe, column)
+            if os.path.exists(path) and os.path.getsize(path) != length * dtype.itemsize:
+                os.truncate(path, length * dtype.itemsize)
+
+    def sync_from_db(self, db: Session, symbol: str, timeframe: str, batch_size: int = 100000) -> int:
+        """Copy ``MarketData`` rows newer than the stored tail into the store."""
+        last = self.last_timestamp(symbol, timeframe)
+        query = db.query(
+            MarketData.timestamp,
+            MarketData.open_price,
+            MarketData.high_price,
+            MarketData.low_price,
+            MarketData.close_price,
+            MarketData.volume,
+        ).filter(MarketData.symbol == symbol, MarketData.timeframe == timeframe)
+        if last is not None:
+            query = query.filter(MarketData.timestamp > pd.Timestamp(last).to_pydatetime())
+        query = query.order_by(MarketData.timestamp)
+
+        written = 0
+        rows = []
+        for row in query.yield_per(batch_size):
+            rows.append(row)
+            if len(rows) >= batch_size:
+                written += self._append_rows(symbol, timeframe, rows)
+                rows = []
+        if rows:
+            written += self._append_rows(symbol, timeframe, rows)
+        logger.info(f"Synced {written} {timeframe} bars for {symbol} into bar store")
+        return written
+
+    def _append_rows(self, symbol: str, timeframe: str, rows) -> int:
+        df = pd.DataFrame(rows, columns=["timestamp", "open", "high", "low", "close", "volume"])
+        df["volume"] = df["volume"].fillna(0)
+        return self.append_frame(symbol, timeframe, df)
+
+
+# Global bar store instance
+bar_store = BarStore(settings.BAR_STORE_PATH)
@@ -0,0 +1,289 @@
+"""WebSocket fan-out with per-client queues.
+
+Each message is serialized once per publish and handed to the queue of
+every client subscribed to its topic; publishing never awaits a socket.
+Every client has its own writer task, so a slow connection only delays
+itself. When a client's queue is full the oldest pending message is
+dropped, and messages published with a ``key`` (e.g. a symbol's quote)
+replace the pending message with the same key instead of queueing behind
+it. Clients that error or stall past ``WS_SEND_TIMEOUT`` are disconnected.
+
+Topics are plain strings such as ``quotes:TASE:TEVA``, ``portfolio`` or
+``orders``; clients manage them by sending
+``{"action": "subscribe" | "unsubscribe", "topics": [...]}``. Producers can
+listen for topics gaining their first or losing their last subscriber, and
+for each new subscription (e.g. to send an initial snapshot).
+
+In a broker gateway the subscribers live in other processes: the topics
+they want are set with ``set_remote_topics`` and count as subscribed, and
+messages on them are handed to the relay given to ``set_relay``.
+"""
+
+import asyncio
+from collections import deque
+import json
+import logging
+import time
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Set
+
+from fastapi import WebSocket
+
+from app.core.config import settings
+from app.core.metrics import WS_SEND_LATENCY, gauge_callback
+
+logger = logging.getLogger(__name__)
+
+
+def serialize(topic: str, data: Any) -> str:
+    return json.dumps({"topic": topic, "data": data}, default=str)
+
+
+class _Client:
+    __slots__ = ("websocket", "topics", "queue", "pending", "ready", "writer", "dropped", "max_size")
+
+    def __init__(self, websocket: WebSocket, max_size: int):
+        self.websocket = websocket
+        self.topics: Set[str] = set()
+        # Entries are [payload, key] lists so a keyed message can be replaced in place
+        self.queue: Deque[list] = deque()
+        self.pending: Dict[Hashable, list] = {}
+        self.ready = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.max_size = max_size
+
+    def offer(self, payload, key: Optional[Hashable] = None):
+        if key is not None:
+            entry = self.pending.get(key)
+            if entry is not None:
+                entry[0] = payload
+                return
+        if len(self.queue) >= self.max_size:
+            self._discard(self.queue.popleft())
+            self.dropped += 1
+        entry = [payload, key]
+        self.queue.append(entry)
+        if key is not None:
+            self.pending[key] = entry
+        self.ready.set()
+
+    def _discard(self, entry: list):
+        key = entry[1]
+        if key is not None and self.pending.get(key) is entry:
+            del self.pending[key]
+
+    def take(self):
+        entry = self.queue.popleft()
+        self._discard(entry)
+        if not self.queue:
+            self.ready.clear()
+        return entry[0]
+
+
+class Broadcaster:
+    def __init__(self, queue_size: Optional[int] = None, send_timeout: Optional[float] = None):
+        self.queue_size = queue_size or settings.WS_QUEUE_SIZE
+        self.send_timeout = settings.WS_SEND_TIMEOUT if send_timeout is None else send_timeout
+        self._clients: Dict[WebSocket, _Client] = {}
+        self._subscribers: Dict[str, Set[_Client]] = {}
+        self._topic_listeners: List[Callable[[str, bool], None]] = []
+        self._subscribe_listeners: List[Callable[[WebSocket, str], None]] = []
+        self._remote: Set[str] = set()
+        self._relay: Optional[Callable[[str, Any, Optional[Hashable]], None]] = None
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def add_topic_listener(self, callback: Callable[[str, bool], None]):
+        """Call ``callback(topic, active)`` when a topic gains its first or loses its last subscriber."""
+        self._topic_listeners.append(callback)
+
+    def add_subscribe_listener(self, callback: Callable[[WebSocket, str], None]):
+        """Call ``callback(websocket, topic)`` whenever a client subscribes to a topic."""
+        self._subscribe_listeners.append(callback)
+
+    def set_relay(self, relay: Callable[[str, Any, Optional[Hashable]], None]):
+        """Hand every message on a remote topic to ``relay(topic, payload, key)``."""
+        self._relay = relay
+
+    def set_remote_topics(self, topics: Iterable[str]):
+        """Replace the set of topics subscribed to by other processes."""
+        topics = set(topics)
+        added, removed = topics - self._remote, self._remote - topics
+        self._remote = topics
+        for topic in added:
+            if topic not in self._subscribers:
+                self._notify(self._topic_listeners, topic, True)
+        for topic in removed:
+            if topic not in self._subscribers:
+                self._notify(self._topic_listeners, topic, False)
+
+    def _notify(self, listeners: List[Callable], *args):
+        for callback in listeners:
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.error(f"Broadcaster listener failed for {args[-1]}: {e}")
+
+    def _add(self, client: _Client, topic: str):
+        if topic in client.topics:
+            return
+        client.topics.add(topic)
+        subscribers = self._subscribers.setdefault(topic, set())
+        subscribers.add(client)
+        if len(subscribers) == 1 and topic not in self._remote:
+            self._notify(self._topic_listeners, topic, True)
+        self._notify(self._subscribe_listeners, client.websocket, topic)
+
+    def _remove(self, client: _Client, topic: str):
+        client.topics.discard(topic)
+        subscribers = self._subscribers.get(topic)
+        if subscribers is None or client not in subscribers:
+            return
+        subscribers.discard(client)
+        if not subscribers:
+            del self._subscribers[topic]
+            if topic not in self._remote:
+                self._notify(self._topic_listeners, topic, False)
+
+    def has_subscribers(self, topic: str) -> bool:
+        return topic in self._subscribers or topic in self._remote
+
+    def topics(self) -> List[str]:
+        """Topics with at least one subscriber connected to this process."""
+        return list(self._subscribers)
+
+    async def connect(self, websocket: WebSocket, topics: Iterable[str] = ()):
+        await websocket.accept()
+        client = _Client(websocket, self.queue_size)
+        self._clients[websocket] = client
+        self.subscribe(websocket, topics)
+        client.writer = asyncio.get_event_loop().create_task(self._write(client))
+
+    def disconnect(self, websocket: WebSocket):
+        client = self._clients.pop(websocket, None)
+        if client is None:
+            return
+        for topic in list(client.topics):
+            self._remove(client, topic)
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]):
+        client = self._clients.get(websocket)
+        if client is None:
+            return
+        for topic in topics:
+            self._add(client, topic)
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]):
+        client = self._clients.get(websocket)
+        if client is None:
+            return
+        for topic in topics:
+            self._remove(client, topic)
+
+    def publish(self, topic: str, data: Any, key: Optional[Hashable] = None) -> int:
+        """Queue ``data`` for every subscriber of ``topic``; returns how many.
+
+        With ``key`` a message still waiting in a client's queue under the
+        same key is replaced, so slow clients only get the latest value.
+        """
+        if not self.has_subscribers(topic):
+            return 0
+        return self.publish_payload(topic, serialize(topic, data), key)
+
+    def publish_payload(self, topic: str, payload, key: Optional[Hashable] = None) -> int:
+        """Like ``publish`` for an already encoded text (str) or binary (bytes) frame."""
+        if self._relay is not None and topic in self._remote:
+            self._relay(topic, payload, key)
+        subscribers = self._subscribers.get(topic)
+        if not subscribers:
+            return 0
+        for client in subscribers:
+            client.offer(payload, key)
+        return len(subscribers)
+
+    def broadcast(self, topic: str, data: Any) -> int:
+        """Queue ``data`` for every connected client regardless of subscriptions."""
+        payload = serialize(topic, data)
+        for client in self._clients.values():
+            client.offer(payload)
+        return len(self._clients)
+
+    def send(self, websocket: WebSocket, topic: str, data: Any):
+        self.send_payload(websocket, serialize(topic, data))
+
+    def send_payload(self, websocket: WebSocket, payload):
+        client = self._clients.get(websocket)
+        if client is not None:
+            client.offer(payload)
+
+    def handle(self, websocket: WebSocket, text: str):
+        """Apply a subscribe/unsubscribe command sent by the client."""
+        try:
+            message = json.loads(text)
+            action = message["action"]
+            topics = [str(t) for t in message.get("topics", [])]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.send(websocket, "error", {"message": "Expected {\"action\": ..., \"topics\": [...]}"})
+            return
+        if action == "subscribe":
+            self.subscribe(websocket, topics)
+        elif action == "unsubscribe":
+            self.unsubscribe(websocket, topics)
+        else:
+            self.send(websocket, "error", {"message": f"Unknown action '{action}'"})
+            return
+        client = self._clients.get(websocket)
+        self.send(websocket, "subscriptions", sorted(client.topics) if client else [])
+
+    async def _write(self, client: _Client):
+        websocket = client.websocket
+        try:
+            while True:
+                await client.ready.wait()
+                payload = client.take()
+                if isinstance(payload, bytes):
+                    send = websocket.send_bytes(payload)
+                else:
+                    send = websocket.send_text(payload)
+                started = time.perf_counter()
+                await asyncio.wait_for(send, self.send_timeout)
+                WS_SEND_LATENCY.observe(time.perf_counter() - started)
+                if self._clients.get(websocket) is not client:
+                    # Disconnected mid-send: wait_for can swallow the cancellation
+                    return
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.warning("Dropping WebSocket client that stopped reading")
+        except Exception as e:
+            logger.info(f"Dropping WebSocket client: {e}")
+        self.disconnect(websocket)
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    def info(self) -> Dict:
+        depths: List[int] = [len(c.queue) for c in self._clients.values()]
+        return {
+            "clients": len(self._clients),
+            "topics": {topic: len(subs) for topic, subs in self._subscribers.items()},
+            "remote_topics": len(self._remote),
+            "max_queue_depth": max(depths, default=0),
+            "queued": sum(depths),
+            "dropped": sum(c.dropped for c in self._clients.values()),
+        }
+
+
+# Global broadcaster instance
+broadcaster = Broadcaster()
+
+gauge_callback("ws_clients", "Connected WebSocket clients", lambda: len(broadcaster))
+gauge_callback("ws_queued_messages", "Messages waiting in WebSocket client queues",
+               lambda: broadcaster.info()["queued"])
+gauge_callback("ws_max_queue_depth", "Longest WebSocket client queue", lambda: broadcaster.info()["max_queue_depth"])
+gauge_callback("ws_dropped_messages", "Messages dropped from full queues of connected clients",
+               lambda: broadcaster.info()["dropped"])
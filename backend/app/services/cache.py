@@ -0,0 +1,179 @@
+"""Redis response cache for read-heavy endpoints.
+
+Responses are stored already serialized, so a hit is one Redis round trip
+and the bytes go straight into the ``Response`` without touching the
+database or the JSON encoder. Entries are grouped by namespace
+(``trades``, ``strategies``, ``market_data:<symbol>``); every key written
+is recorded in its namespace's key set, and ``invalidate`` deletes the
+whole group when the underlying rows change. ``CACHE_TTL`` bounds how long
+anything can be served stale if an invalidation is missed.
+
+Each namespace also has a generation, bumped by every invalidation. A miss
+remembers the generation it saw, and ``put`` only stores the response if
+it is unchanged, so a response built from rows read before an
+invalidation is not written back after it.
+
+Hits, misses and failures are Prometheus counters (see ``app.core.metrics``),
+so ``/metrics`` reports them summed over every worker.
+
+Connections come from a bounded pool. Redis being slow or down never fails
+a request: the error is counted, the cache is bypassed for
+``CACHE_RETRY_INTERVAL`` seconds and responses are built as usual.
+"""
+
+from contextvars import ContextVar
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Response
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.core.metrics import CACHE_ERRORS, CACHE_INVALIDATIONS, CACHE_LOOKUPS, CACHE_WRITES
+from app.core.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+
+# Deletes every key recorded in a namespace's key set, then the set itself
+_INVALIDATE = """
+local keys = redis.call('SMEMBERS', KEYS[1])
+for i = 1, #keys, 1000 do
+    redis.call('DEL', unpack(keys, i, math.min(i + 999, #keys)))
+end
+redis.call('DEL', KEYS[1])
+redis.call('INCR', KEYS[2])
+return #keys
+"""
+
+# Stores an entry and records it in its key set, unless the namespace generation moved on
+_PUT = """
+if ARGV[1] ~= '*' and (redis.call('GET', KEYS[3]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'b', ARGV[4])
+if ARGV[5] ~= '' then
+    redis.call('HSET', KEYS[1], 'h', ARGV[5])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('SADD', KEYS[2], KEYS[1])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+# (key, namespace generation) of the last miss in this request's context
+_missed: ContextVar[Optional[Tuple[str, str]]] = ContextVar("response_cache_missed", default=None)
+
+
+class ResponseCache:
+    def __init__(self, url: Optional[str] = None, enabled: Optional[bool] = None,
+                 ttl: Optional[float] = None, prefix: str = "cache"):
+        self.enabled = settings.CACHE_ENABLED if enabled is None else enabled
+        self.ttl = ttl or settings.CACHE_TTL
+        self.prefix = prefix
+        pool = redis.BlockingConnectionPool.from_url(
+            url or settings.REDIS_URL,
+            max_connections=settings.CACHE_MAX_CONNECTIONS,
+            timeout=settings.CACHE_TIMEOUT,
+            socket_timeout=settings.CACHE_TIMEOUT,
+            socket_connect_timeout=settings.CACHE_TIMEOUT,
+        )
+        self.redis = redis.Redis(connection_pool=pool)
+        self._invalidate = self.redis.register_script(_INVALIDATE)
+        self._put = self.redis.register_script(_PUT)
+        self._retry_at = 0.0
+
+    def key(self, namespace: str, **params) -> str:
+        """Cache key for a namespace and the request parameters that shape the response."""
+        query = "&".join(f"{name}={params[name]}" for name in sorted(params) if params[name] is not None)
+        return f"{self.prefix}:{namespace}:{query}"
+
+    def _members(self, namespace: str) -> str:
+        return f"{self.prefix}:{namespace}:keys"
+
+    def _generation(self, namespace: str) -> str:
+        return f"{self.prefix}:{namespace}:gen"
+
+    def _available(self) -> bool:
+        return self.enabled and time.monotonic() >= self._retry_at
+
+    def _failed(self, action: str, e: Exception):
+        CACHE_ERRORS.labels(action).inc()
+        self._retry_at = time.monotonic() + settings.CACHE_RETRY_INTERVAL
+        logger.warning(f"Response cache {action} failed, bypassing for {settings.CACHE_RETRY_INTERVAL}s: {e}")
+
+    def _count(self, namespace: str, outcome: str):
+        # Per-symbol namespaces are counted together
+        CACHE_LOOKUPS.labels(namespace.split(":")[0], outcome).inc()
+
+    async def get(self, namespace: str, key: str) -> Optional[Response]:
+        """The cached response for ``key``, or None on a miss."""
+        if not self._available():
+            return None
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hgetall(key)
+                pipe.get(self._generation(namespace))
+                entry, generation = await pipe.execute()
+        except Exception as e:
+            self._failed("read", e)
+            return None
+        if not entry:
+            _missed.set((key, (generation or b"").decode()))
+            self._count(namespace, "miss")
+            return None
+        self._count(namespace, "hit")
+        headers = json.loads(entry[b"h"]) if b"h" in entry else None
+        return Response(content=entry[b"b"], media_type="application/json", headers=headers)
+
+    async def put(self, namespace: str, key: str, data: Any, ttl: Optional[float] = None,
+                  headers: Optional[Dict[str, str]] = None) -> Response:
+        """Serialize ``data``, store it under ``key`` and return it as a response.
+
+        Nothing is stored if the namespace was invalidated since this
+        request's miss on ``key``.
+        """
+        body = dumps(data)
+        if self._available():
+            ttl = int(max(ttl or self.ttl, 1))
+            missed = _missed.get()
+            generation = missed[1] if missed is not None and missed[0] == key else "*"
+            try:
+                stored = await self._put(
+                    keys=[key, self._members(namespace), self._generation(namespace)],
+                    args=[generation, ttl, max(ttl, int(self.ttl)), body, json.dumps(headers) if headers else ""],
+                )
+                CACHE_WRITES.labels("stored" if stored else "stale").inc()
+            except Exception as e:
+                self._failed("write", e)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def invalidate(self, *namespaces: str) -> int:
+        """Drop every cached response in ``namespaces``; returns the number of keys deleted."""
+        if not self._available():
+            return 0
+        deleted = 0
+        try:
+            for namespace in namespaces:
+                deleted += await self._invalidate(keys=[self._members(namespace), self._generation(namespace)])
+                CACHE_INVALIDATIONS.inc()
+        except Exception as e:
+            self._failed("invalidation", e)
+        return deleted
+
+    def info(self) -> Dict:
+        """State of the cache as seen from this worker; counts are on ``/metrics``."""
+        return {
+            "enabled": self.enabled,
+            "available": self._available(),
+            "retry_in": max(self._retry_at - time.monotonic(), 0.0),
+        }
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+# Global response cache instance
+response_cache = ResponseCache()
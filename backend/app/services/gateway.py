@@ -0,0 +1,457 @@
+"""Broker gateway: one process owns the IB session, API workers reach it over Redis.
+
+With ``PROCESS_ROLE=standalone`` (the default) the API process runs the IB
+connection and every live service itself, which only works with a single
+uvicorn worker. To spread HTTP and WebSocket load over several workers, run
+one gateway (``python -m app.gateway``) and start the workers with
+``PROCESS_ROLE=api``:
+
+* The gateway runs the IB connection, quote stream, valuation, risk engine,
+  order pipeline and strategy runner. Whatever they publish on a topic that
+  some worker's clients subscribe to (quotes, ``portfolio``, ``orders``) is
+  relayed on ``gateway:events``, batched into one msgpack message per pass
+  of the event loop; workers fan it out to their own clients.
+* Each worker announces the topics its clients hold on ``gateway:control``
+  whenever they change and every ``GATEWAY_HEARTBEAT`` seconds. The gateway
+  holds market data for the union and forgets workers that go quiet. A new
+  subscription asks for a full quote frame.
+* Endpoints reach live state through ``gateway_client.call``: a request on
+  ``gateway:rpc`` answered on the worker's own reply channel. In standalone
+  mode the same calls run in process.
+"""
+
+import asyncio
+from datetime import datetime
+from functools import partial
+import itertools
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+import uuid
+
+import msgpack
+import redis.asyncio as redis
+
+from app.brokers.interactive_brokers import ib_client
+from app.core.config import settings
+from app.core.serialization import dumps
+from app.services.aggregation import aggregation_service
+from app.services.broadcaster import broadcaster
+from app.services.orders import order_service
+from app.services.profiler import profiler
+from app.services.quotes import quote_stream
+from app.services.replay import replay_engine
+from app.services.risk import risk_engine
+from app.services.strategy_runner import strategy_runner
+from app.services.valuation import valuation_service
+
+logger = logging.getLogger(__name__)
+
+
+EVENTS = "gateway:events"
+CONTROL = "gateway:control"
+RPC = "gateway:rpc"
+
+
+def reply_channel(worker: str) -> str:
+    return f"gateway:reply:{worker}"
+
+
+class GatewayError(Exception):
+    """The gateway is not running, did not answer in time, or the call failed there."""
+
+
+async def start_live_services():
+    """Start everything that runs on the IB session (standalone API process or gateway)."""
+    quote_stream.start()
+    await valuation_service.load()
+    valuation_service.start()
+    risk_engine.start()
+    order_service.start()
+    # Connecting to IB and warming up strategies must not hold up startup
+    asyncio.get_event_loop().create_task(strategy_runner.start())
+
+
+async def stop_live_services():
+    await replay_engine.stop()
+    quote_stream.stop()
+    await strategy_runner.stop()
+    await order_service.stop()
+    await valuation_service.stop()
+
+
+async def _book():
+    if not valuation_service.loaded and not await valuation_service.load():
+        return None
+    return valuation_service
+
+
+async def _portfolio_summary() -> Optional[Dict]:
+    book = await _book()
+    return book.summary() if book else None
+
+
+async def _portfolio_positions() -> Optional[List[Dict]]:
+    book = await _book()
+    return book.positions() if book else None
+
+
+async def _submit_orders(orders: List[Dict]) -> List[Dict]:
+    order_ids = await order_service.submit(orders)
+    return [{"order_id": order_id, "rejected": order.get("rejected")} for order, order_id in zip(orders, order_ids)]
+
+
+async def _get_order(order_id: int) -> Optional[Dict]:
+    return order_service.get(order_id)
+
+
+async def _risk_state() -> Dict:
+    return risk_engine.state()
+
+
+async def _halt(reason: str):
+    risk_engine.halt(reason)
+
+
+async def _resume():
+    risk_engine.resume()
+
+
+async def _live_strategies() -> Dict:
+    return strategy_runner.info()
+
+
+async def _reload_strategies():
+    await strategy_runner.reload()
+
+
+async def _historical_bars(symbol: str, exchange: str, timeframe: str, duration: str, end: str) -> Optional[Dict]:
+    df = await ib_client.get_historical_bars(symbol, exchange, timeframe, duration=duration, end=end)
+    return None if df is None else df.to_dict("list")
+
+
+async def _partial_bar(symbol: str, timeframe: str) -> Optional[Dict]:
+    return aggregation_service.partial(symbol, timeframe)
+
+
+async def _start_replay(symbols: List[str], start: Optional[str], end: Optional[str],
+                        speed: Optional[float], timeframe: Optional[str]) -> Dict:
+    # Timestamps arrive as ISO strings from remote callers
+    start, end = (datetime.fromisoformat(t) if isinstance(t, str) else t for t in (start, end))
+    return await replay_engine.start(symbols, start, end, speed, timeframe)
+
+
+async def _stop_replay() -> Dict:
+    await replay_engine.stop()
+    return replay_engine.info()
+
+
+async def _replay_status() -> Dict:
+    return replay_engine.info()
+
+
+async def _start_profiler(interval: Optional[float], duration: Optional[float]) -> Dict:
+    # Stops a running profile first, which joins its sampling thread
+    return await asyncio.get_running_loop().run_in_executor(None, profiler.start, interval, duration)
+
+
+async def _stop_profiler() -> Dict:
+    # Joining the sampling thread takes up to one interval
+    return await asyncio.get_running_loop().run_in_executor(None, profiler.stop)
+
+
+async def _profiler_report(limit: Optional[int]) -> str:
+    return profiler.report(limit)
+
+
+# Calls served by the gateway, by name
+HANDLERS: Dict[str, Callable[..., Awaitable[Any]]] = {
+    "portfolio.summary": _portfolio_summary,
+    "portfolio.positions": _portfolio_positions,
+    "orders.submit": _submit_orders,
+    "orders.get": _get_order,
+    "risk.state": _risk_state,
+    "risk.halt": _halt,
+    "risk.resume": _resume,
+    "strategies.live": _live_strategies,
+    "strategies.reload": _reload_strategies,
+    "ib.historical_bars": _historical_bars,
+    "aggregation.partial": _partial_bar,
+    "replay.start": _start_replay,
+    "replay.stop": _stop_replay,
+    "replay.status": _replay_status,
+    "profiler.start": _start_profiler,
+    "profiler.stop": _stop_profiler,
+    "profiler.report": _profiler_report,
+}
+
+
+class Gateway:
+    """Relays live events to API workers and serves their calls (runs in the gateway process)."""
+
+    def __init__(self, hub=broadcaster, quotes=quote_stream, url: Optional[str] = None):
+        self.hub = hub
+        self.quotes = quotes
+        self.url = url or settings.REDIS_URL
+        self.redis: Optional[redis.Redis] = None
+        # worker id -> (topics its clients hold, last announcement)
+        self.workers: Dict[str, Tuple[Set[str], float]] = {}
+        # Events waiting for the next relay message; keyed ones replace each other
+        self._outbox: Dict[Hashable, list] = {}
+        self._sequence = itertools.count()
+        self._ready = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.relayed = 0
+        self.calls = 0
+
+    def relay(self, topic: str, payload, key: Optional[Hashable] = None):
+        """Broadcaster relay: queue a published frame for the workers."""
+        slot = next(self._sequence) if key is None else (topic, key)
+        entry = self._outbox.get(slot)
+        if entry is not None:
+            entry[2] = payload
+        else:
+            self._outbox[slot] = [topic, None if key is None else str(key), payload]
+        self._ready.set()
+
+    async def _relay_forever(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            batch, self._outbox = list(self._outbox.values()), {}
+            try:
+                await self.redis.publish(EVENTS, msgpack.packb(batch))
+                self.relayed += len(batch)
+            except Exception as e:
+                # Live frames are not worth replaying; the next snapshot catches workers up
+                logger.error(f"Failed to relay {len(batch)} events: {e}")
+
+    def on_control(self, message: Dict):
+        self.workers[message["worker"]] = (set(message.get("topics", [])), time.monotonic())
+        self._update_topics()
+        for topic in message.get("snapshot", []):
+            frame = self.quotes.snapshot(topic)
+            if frame is not None:
+                self.relay(topic, frame)
+
+    def _update_topics(self):
+        cutoff = time.monotonic() - 3 * settings.GATEWAY_HEARTBEAT
+        for worker in [w for w, (_, seen) in self.workers.items() if seen < cutoff]:
+            logger.info(f"API worker {worker} went quiet; dropping its subscriptions")
+            del self.workers[worker]
+        self.hub.set_remote_topics(set().union(*(topics for topics, _ in self.workers.values())))
+
+    async def _expire_forever(self):
+        while True:
+            await asyncio.sleep(settings.GATEWAY_HEARTBEAT)
+            self._update_topics()
+
+    async def on_call(self, message: Dict):
+        request_id, method = message.get("id"), message.get("method")
+        handler = HANDLERS.get(method)
+        try:
+            if handler is None:
+                raise GatewayError(f"Unknown gateway call '{method}'")
+            reply = {"id": request_id, "result": await handler(*message.get("args", []))}
+        except Exception as e:
+            logger.error(f"Gateway call {method} failed: {e}")
+            reply = {"id": request_id, "error": str(e)}
+        self.calls += 1
+        if request_id is None:
+            # Notification; nobody is waiting
+            return
+        try:
+            await self.redis.publish(reply_channel(message["worker"]), dumps(reply))
+        except Exception as e:
+            logger.error(f"Failed to answer gateway call {method}: {e}")
+
+    async def _listen_forever(self):
+        control = CONTROL.encode()
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(CONTROL, RPC)
+                    logger.info("Broker gateway listening")
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        data = json.loads(message["data"])
+                        if message["channel"] == control:
+                            self.on_control(data)
+                        else:
+                            asyncio.get_event_loop().create_task(self.on_call(data))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Broker gateway lost Redis: {e}")
+                await asyncio.sleep(1)
+
+    def start(self):
+        if self._tasks:
+            return
+        self.redis = redis.Redis.from_url(self.url)
+        self.hub.set_relay(self.relay)
+        loop = asyncio.get_event_loop()
+        self._tasks = [
+            loop.create_task(self._listen_forever()),
+            loop.create_task(self._relay_forever()),
+            loop.create_task(self._expire_forever()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self.redis is not None:
+            await self.redis.aclose()
+            self.redis = None
+
+    def info(self) -> Dict:
+        return {
+            "workers": {worker: len(topics) for worker, (topics, _) in self.workers.items()},
+            "relayed": self.relayed,
+            "calls": self.calls,
+        }
+
+
+class GatewayClient:
+    """How endpoints reach live state: over Redis in an API worker, in process otherwise."""
+
+    def __init__(self, hub=broadcaster, url: Optional[str] = None, role: Optional[str] = None):
+        self.hub = hub
+        self.url = url or settings.REDIS_URL
+        self.remote = (role or settings.PROCESS_ROLE) == "api"
+        self.worker = uuid.uuid4().hex[:12]
+        self.redis: Optional[redis.Redis] = None
+        self._calls: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._changed = asyncio.Event()
+        self._snapshots: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        # In-process notifications still running
+        self._notified: Set[asyncio.Task] = set()
+        if self.remote:
+            hub.add_topic_listener(self.on_topic)
+            hub.add_subscribe_listener(self.on_subscribe)
+
+    def on_topic(self, topic: str, active: bool):
+        self._changed.set()
+
+    def on_subscribe(self, websocket, topic: str):
+        self._snapshots.add(topic)
+        self._changed.set()
+
+    async def _announce_forever(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), settings.GATEWAY_HEARTBEAT)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            snapshots, self._snapshots = list(self._snapshots), set()
+            message = {"worker": self.worker, "topics": self.hub.topics(), "snapshot": snapshots}
+            try:
+                await self.redis.publish(CONTROL, json.dumps(message))
+            except Exception as e:
+                logger.error(f"Failed to announce subscriptions to the gateway: {e}")
+
+    def on_events(self, batch: List):
+        for topic, key, payload in batch:
+            self.hub.publish_payload(topic, payload, key)
+
+    def on_reply(self, reply: Dict):
+        future = self._calls.get(reply.get("id"))
+        if future is not None and not future.done():
+            future.set_result(reply)
+
+    async def _listen_forever(self):
+        replies = reply_channel(self.worker).encode()
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(EVENTS, replies)
+                    # Announce straight away after (re)connecting
+                    self._changed.set()
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        if message["channel"] == replies:
+                            self.on_reply(json.loads(message["data"]))
+                        else:
+                            self.on_events(msgpack.unpackb(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lost the broker gateway event stream: {e}")
+                await asyncio.sleep(1)
+
+    async def call(self, method: str, *args, timeout: Optional[float] = None) -> Any:
+        """Run a gateway call (see ``HANDLERS``) and return its result.
+
+        Raises ``GatewayError`` if the gateway is down, too slow or the call failed.
+        """
+        if not self.remote:
+            return await HANDLERS[method](*args)
+        if self.redis is None:
+            raise GatewayError("Not connected to the broker gateway")
+
+        request_id = next(self._ids)
+        future = asyncio.get_event_loop().create_future()
+        self._calls[request_id] = future
+        request = {"id": request_id, "worker": self.worker, "method": method, "args": list(args)}
+        try:
+            if not await self.redis.publish(RPC, dumps(request)):
+                raise GatewayError("Broker gateway is not running")
+            reply = await asyncio.wait_for(future, timeout or settings.GATEWAY_RPC_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise GatewayError(f"Broker gateway did not answer {method}")
+        except redis.RedisError as e:
+            raise GatewayError(f"Cannot reach the broker gateway: {e}")
+        finally:
+            self._calls.pop(request_id, None)
+        if "error" in reply:
+            raise GatewayError(reply["error"])
+        return reply["result"]
+
+    async def notify(self, method: str, *args):
+        """Run a gateway call without waiting for it; failures are only logged."""
+        if not self.remote:
+            # E.g. a strategy reload may wait on IB; the caller must not
+            task = asyncio.get_event_loop().create_task(HANDLERS[method](*args))
+            self._notified.add(task)
+            task.add_done_callback(partial(self._notified_done, method))
+            return
+        request = {"id": None, "worker": self.worker, "method": method, "args": list(args)}
+        try:
+            if not await self.redis.publish(RPC, dumps(request)):
+                logger.warning(f"No broker gateway running for {method}")
+        except Exception as e:
+            logger.error(f"Failed to send {method} to the broker gateway: {e}")
+
+    def _notified_done(self, method: str, task: asyncio.Task):
+        self._notified.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"{method} failed: {task.exception()}")
+
+    async def start(self):
+        if not self.remote or self._tasks:
+            return
+        self.redis = redis.Redis.from_url(self.url)
+        loop = asyncio.get_event_loop()
+        self._tasks = [loop.create_task(self._listen_forever()), loop.create_task(self._announce_forever())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self.redis is not None:
+            await self.redis.aclose()
+            self.redis = None
+
+
+# Global gateway instance (used by the gateway process)
+gateway = Gateway()
+
+# Global gateway client instance
+gateway_client = GatewayClient()
@@ -0,0 +1,269 @@
+"""Bulk historical bar ingestion.
+
+Bars are pulled from Yahoo Finance or Interactive Brokers, normalized to
+one frame per symbol, and loaded in batches. On PostgreSQL each batch is
+streamed with ``COPY`` into a temporary staging table and merged with a
+single ``INSERT ... ON CONFLICT``; other databases get multi-row upserts.
+Symbols are processed concurrently up to ``settings.INGEST_CONCURRENCY``.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+import io
+import logging
+from typing import Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from app.brokers.interactive_brokers import ib_client
+from app.core.config import settings
+from app.core.database import engine as default_engine
+from app.models.trading import MarketData
+from app.services.bar_store import bar_store
+from app.services.cache import response_cache
+from app.services.gateway import gateway_client
+
+logger = logging.getLogger(__name__)
+
+
+FRAME_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+YF_INTERVALS = {"1m": "1m", "5m": "5m", "1h": "1h", "1d": "1d"}
+
+# Longest span IB serves per historical request for each bar size
+IB_REQUEST_SPAN = {
+    "1m": timedelta(days=7),
+    "5m": timedelta(days=30),
+    "1h": timedelta(days=30),
+    "1d": timedelta(days=365),
+}
+
+# Seconds to wait for one page of IB history fetched through the broker gateway
+IB_HISTORY_TIMEOUT = 120.0
+
+# Stay under bound-parameter limits (SQLite 32766, PostgreSQL 65535) on the INSERT path
+_INSERT_ROWS_PER_STATEMENT = 3000
+
+_UPSERT_COLUMNS = ["open_price", "high_price", "low_price", "close_price", "volume", "exchange"]
+
+
+def _utc_naive(value: Optional[datetime]) -> datetime:
+    """Naive UTC, like the stored timestamps; None is now."""
+    if value is None:
+        return datetime.utcnow()
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def yahoo_ticker(symbol: str, exchange: str) -> str:
+    return f"{symbol}.TA" if exchange == "TASE" else symbol
+
+
+def normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """Sorted, de-duplicated bars with naive UTC timestamps and integer volume."""
+    df = df.dropna(subset=["close"])
+    ts = pd.to_datetime(df["timestamp"], utc=True).dt.tz_localize(None)
+    df = df.assign(timestamp=ts, volume=df["volume"].fillna(0).astype("int64"))
+    return df[FRAME_COLUMNS].drop_duplicates("timestamp", keep="last").sort_values("timestamp")
+
+
+def fetch_yfinance(symbol: str, exchange: str, timeframe: str, start: datetime, end: datetime) -> pd.DataFrame:
+    """Download bars from Yahoo Finance (blocking).
+
+    Yahoo only keeps intraday history for a limited window (about 30 days of
+    1m bars); older ranges come back empty.
+    """
+    import yfinance as yf
+
+    raw = yf.Ticker(yahoo_ticker(symbol, exchange)).history(
+        start=start, end=end, interval=YF_INTERVALS[timeframe], auto_adjust=False
+    )
+    if raw.empty:
+        return pd.DataFrame(columns=FRAME_COLUMNS)
+    raw = raw.reset_index()
+    raw = raw.rename(columns={raw.columns[0]: "timestamp"})
+    raw.columns = [str(c).lower() for c in raw.columns]
+    return normalize(raw)
+
+
+async def _ib_bars(symbol: str, exchange: str, timeframe: str, duration: str, end: str) -> Optional[pd.DataFrame]:
+    if gateway_client.remote:
+        # API workers have no IB session of their own; the broker gateway fetches for them
+        columns = await gateway_client.call(
+            "ib.historical_bars", symbol, exchange, timeframe, duration, end, timeout=IB_HISTORY_TIMEOUT
+        )
+        return None if columns is None else pd.DataFrame(columns)
+    return await ib_client.get_historical_bars(symbol, exchange, timeframe, duration=duration, end=end)
+
+
+async def fetch_ib(symbol: str, exchange: str, timeframe: str, start: datetime, end: datetime) -> pd.DataFrame:
+    """Page backwards through IB historical data in the largest allowed spans."""
+    span = IB_REQUEST_SPAN[timeframe]
+    frames = []
+    cursor = end
+    while cursor > start:
+        days = max(1, min(span, cursor - start).days)
+        df = await _ib_bars(symbol, exchange, timeframe, f"{days} D", cursor.strftime("%Y%m%d-%H:%M:%S"))
+        if df is None or df.empty:
+            break
+        frames.append(df.rename(columns={"date": "timestamp"}))
+        earliest = pd.to_datetime(df["date"].min(), utc=True).tz_localize(None).to_pydatetime()
+        if earliest >= cursor:
+            break
+        cursor = earliest
+    if not frames:
+        return pd.DataFrame(columns=FRAME_COLUMNS)
+    df = normalize(pd.concat(frames, ignore_index=True))
+    return df[(df["timestamp"] >= start) & (df["timestamp"] <= end)]
+
+
+def _copy_upsert(engine: Engine, df: pd.DataFrame):
+    """Stream a batch through COPY into a staging table and merge it (PostgreSQL)."""
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, date_format="%Y-%m-%d %H:%M:%S.%f")
+    buffer.seek(0)
+
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in _UPSERT_COLUMNS)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS market_data_stage (
+                symbol text, exchange text, timeframe text, timestamp timestamp,
+                open_price float8, high_price float8, low_price float8, close_price float8,
+                volume bigint
+            ) ON COMMIT DELETE ROWS
+            """
+        )
+        cursor.copy_expert(
+            "COPY market_data_stage (symbol, exchange, timeframe, timestamp, open_price, "
+            "high_price, low_price, close_price, volume) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO market_data (symbol, exchange, timeframe, timestamp, open_price,
+                                     high_price, low_price, close_price, volume)
+            SELECT symbol, exchange, timeframe, timestamp, open_price,
+                   high_price, low_price, close_price, volume
+            FROM market_data_stage
+            ON CONFLICT (symbol, timeframe, timestamp) DO UPDATE SET {updates}
+            """
+        )
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def _insert_upsert(engine: Engine, df: pd.DataFrame):
+    """Multi-row INSERT ... ON CONFLICT for databases without COPY."""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    records = df.to_dict("records")
+    with engine.begin() as conn:
+        for lo in range(0, len(records), _INSERT_ROWS_PER_STATEMENT):
+            stmt = insert(MarketData.__table__).values(records[lo:lo + _INSERT_ROWS_PER_STATEMENT])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["symbol", "timeframe", "timestamp"],
+                set_={c: stmt.excluded[c] for c in _UPSERT_COLUMNS},
+            )
+            conn.execute(stmt)
+
+
+def write_bars(
+    engine: Engine,
+    symbol: str,
+    exchange: str,
+    timeframe: str,
+    bars: pd.DataFrame,
+    batch_size: Optional[int] = None,
+) -> int:
+    """Upsert ``bars`` into ``market_data`` in batches; returns the row count."""
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    rows = pd.DataFrame(
+        {
+            "symbol": symbol,
+            "exchange": exchange,
+            "timeframe": timeframe,
+            "timestamp": bars["timestamp"].to_numpy(),
+            "open_price": bars["open"].to_numpy(),
+            "high_price": bars["high"].to_numpy(),
+            "low_price": bars["low"].to_numpy(),
+            "close_price": bars["close"].to_numpy(),
+            "volume": bars["volume"].to_numpy(),
+        }
+    )
+    use_copy = engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+    for lo in range(0, len(rows), batch_size):
+        batch = rows.iloc[lo:lo + batch_size]
+        if use_copy:
+            _copy_upsert(engine, batch)
+        else:
+            _insert_upsert(engine, batch)
+    return len(rows)
+
+
+class IngestionService:
+    def __init__(self, engine: Engine = default_engine, concurrency: Optional[int] = None,
+                 batch_size: Optional[int] = None, store=bar_store):
+        self.engine = engine
+        self.concurrency = concurrency or settings.INGEST_CONCURRENCY
+        self.batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        self.store = store
+
+    async def fetch(self, source: str, symbol: str, exchange: str, timeframe: str,
+                    start: datetime, end: datetime) -> pd.DataFrame:
+        if source == "ib":
+            return await fetch_ib(symbol, exchange, timeframe, start, end)
+        if source == "yfinance":
+            return await asyncio.to_thread(fetch_yfinance, symbol, exchange, timeframe, start, end)
+        raise ValueError(f"Unknown bar source '{source}'")
+
+    async def ingest_symbol(self, source: str, symbol: str, exchange: str, timeframe: str,
+                            start: datetime, end: datetime) -> int:
+        bars = await self.fetch(source, symbol, exchange, timeframe, start, end)
+        if bars.empty:
+            logger.info(f"No {timeframe} bars for {symbol} from {source}")
+            return 0
+        count = await asyncio.to_thread(
+            write_bars, self.engine, symbol, exchange, timeframe, bars, self.batch_size
+        )
+        if self.store is not None:
+            await asyncio.to_thread(self.store.append_frame, symbol, timeframe, bars, exchange)
+        await response_cache.invalidate(f"market_data:{symbol}")
+        logger.info(f"Ingested {count} {timeframe} bars for {symbol} from {source}")
+        return count
+
+    async def backfill(self, symbols: List[str], exchange: str, timeframe: str,
+                       start: datetime, end: Optional[datetime] = None,
+                       source: str = "yfinance") -> Dict[str, int]:
+        """Fetch and load bars for every symbol, at most ``concurrency`` at a time.
+
+        ``start`` and ``end`` may be naive UTC or time zone aware.
+        """
+        start, end = _utc_naive(start), _utc_naive(end)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(symbol: str):
+            async with semaphore:
+                try:
+                    return await self.ingest_symbol(source, symbol, exchange, timeframe, start, end)
+                except Exception as e:
+                    logger.exception(f"Failed to ingest {symbol}: {e}")
+                    return -1
+
+        counts = await asyncio.gather(*(run(s) for s in symbols))
+        return dict(zip(symbols, counts))
+
+
+# Global ingestion service instance
+ingestion_service = IngestionService()
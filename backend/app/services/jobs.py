@@ -0,0 +1,62 @@
+"""State of background jobs (backfills, optimizations), shared by every API worker.
+
+A job runs in the worker that accepted it, but its status polls can land
+on any worker. Each save therefore writes the whole job to Redis under
+``jobs:<kind>:<id>`` for ``JOB_TTL`` seconds, and reads go to Redis. A
+local copy is kept as well, so a single-process deployment keeps working
+while Redis is unreachable.
+"""
+
+import logging
+from typing import Dict, Optional
+
+import orjson
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.core.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class JobStore:
+    def __init__(self, url: Optional[str] = None, ttl: Optional[float] = None, prefix: str = "jobs"):
+        self.ttl = int(ttl or settings.JOB_TTL)
+        self.prefix = prefix
+        self.redis = redis.Redis.from_url(
+            url or settings.REDIS_URL,
+            socket_timeout=settings.CACHE_TIMEOUT,
+            socket_connect_timeout=settings.CACHE_TIMEOUT,
+        )
+        self._local: Dict[str, bytes] = {}
+
+    def _key(self, kind: str, job_id: str) -> str:
+        return f"{self.prefix}:{kind}:{job_id}"
+
+    async def save(self, kind: str, job: Dict):
+        """Store the current state of ``job`` (a dict with an ``id``)."""
+        key = self._key(kind, job["id"])
+        body = dumps(job)
+        self._local[key] = body
+        try:
+            await self.redis.set(key, body, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Failed to save job {key} to Redis: {e}")
+
+    async def get(self, kind: str, job_id: str) -> Optional[Dict]:
+        key = self._key(kind, job_id)
+        try:
+            body = await self.redis.get(key)
+        except Exception as e:
+            logger.warning(f"Failed to read job {key} from Redis: {e}")
+            body = None
+        if body is None:
+            body = self._local.get(key)
+        return None if body is None else orjson.loads(body)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+# Global job store instance
+job_store = JobStore()
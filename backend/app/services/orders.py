@@ -0,0 +1,250 @@
+"""Order pipeline: batched submission, status tracking and fill recording.
+
+Orders are put on an internal queue; a worker drains whatever has queued
+up (up to ``ORDER_BATCH_SIZE``) and hands it to IB as one batch, so many
+concurrent submissions, or one rebalance, cost a single contract
+qualification round trip. Orders are risk-checked before queueing (see
+``app.services.risk``). Order status and executions arrive through the
+IB client's order events; status changes are pushed on the ``orders``
+WebSocket topic. Each fill is held until its commission report arrives
+(or ``FILL_COMMISSION_WAIT`` passes) and then written to ``Trade``
+together with the other pending fills in one bulk insert.
+"""
+
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone
+import logging
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.brokers.interactive_brokers import ib_client
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.trading import Trade
+from app.services.broadcaster import broadcaster
+from app.services.cache import response_cache
+from app.services.risk import risk_engine
+
+logger = logging.getLogger(__name__)
+
+
+# IB execution sides
+SIDES = {"BOT": "BUY", "SLD": "SELL"}
+
+# Orders kept in memory for status lookups
+ORDER_HISTORY = 10000
+
+
+class _Order:
+    __slots__ = ("order_id", "symbol", "exchange", "side", "quantity", "order_type", "limit_price",
+                 "strategy", "signal_strength", "status", "filled", "avg_fill_price", "submitted_at")
+
+    def __init__(self, order_id: int, request: Dict):
+        self.order_id = order_id
+        self.symbol = request["symbol"]
+        self.exchange = request["exchange"]
+        self.side = request["action"]
+        self.quantity = request["quantity"]
+        self.order_type = request.get("order_type", "MKT")
+        self.limit_price = request.get("limit_price")
+        self.strategy = request.get("strategy") or ""
+        self.signal_strength = request.get("signal_strength") or 0.0
+        self.status = "Submitted"
+        self.filled = 0.0
+        self.avg_fill_price = 0.0
+        self.submitted_at = datetime.utcnow()
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _utc_naive(value) -> datetime:
+    if value is None:
+        return datetime.utcnow()
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class OrderService:
+    def __init__(self, client=ib_client, session_factory=AsyncSessionLocal, risk=risk_engine,
+                 hub=broadcaster, batch_size: Optional[int] = None, portfolio_id: int = 1):
+        self.client = client
+        self.risk = risk
+        self.hub = hub
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.ORDER_BATCH_SIZE
+        self.portfolio_id = portfolio_id
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._orders: "OrderedDict[int, _Order]" = OrderedDict()
+        # execId -> [received at, Trade row, has commission]
+        self._fills: Dict[str, list] = {}
+        # Recently recorded execIds; IB repeats executions after a reconnect
+        self._recorded: "OrderedDict[str, None]" = OrderedDict()
+        self.batches = 0
+        self.fills_written = 0
+        client.add_order_listener(self)
+
+    async def submit(self, orders: List[Dict]) -> List[Optional[int]]:
+        """Queue orders (``place_order`` arguments plus optional ``strategy`` and
+        ``signal_strength``) and return their IB order ids, None where placement failed.
+
+        Every order is checked by the risk engine first; a refused order gets
+        None and the reason under ``rejected`` in its dict.
+        """
+        if self.risk is not None:
+            await asyncio.gather(*(self.risk.ensure_price(order) for order in orders))
+        accepted = []
+        for order in orders:
+            reason = self.risk.check(order) if self.risk is not None else None
+            if reason is not None:
+                order["rejected"] = reason
+                logger.warning(f"Order rejected: {order['symbol']} {order['action']} {order['quantity']}: {reason}")
+            else:
+                accepted.append(order)
+        if not accepted:
+            return [None] * len(orders)
+
+        if self._queue is None:
+            order_ids = await self._place(accepted)
+        else:
+            loop = asyncio.get_event_loop()
+            futures = []
+            for order in accepted:
+                future = loop.create_future()
+                self._queue.put_nowait((order, future))
+                futures.append(future)
+            order_ids = await asyncio.gather(*futures)
+        placed = {id(order): order_id for order, order_id in zip(accepted, order_ids)}
+        return [placed.get(id(order)) for order in orders]
+
+    async def _place(self, orders: List[Dict]) -> List[Optional[int]]:
+        try:
+            order_ids = await self.client.place_orders(orders)
+        except Exception as e:
+            logger.error(f"Failed to place order batch: {e}")
+            order_ids = [None] * len(orders)
+        self.batches += 1
+        for request, order_id in zip(orders, order_ids):
+            if self.risk is not None:
+                self.risk.placed(request, order_id)
+            if order_id is not None:
+                self._orders[order_id] = _Order(order_id, request)
+                if len(self._orders) > ORDER_HISTORY:
+                    self._orders.popitem(last=False)
+        return order_ids
+
+    async def _drain_forever(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            order_ids = await self._place([order for order, _ in batch])
+            for (_, future), order_id in zip(batch, order_ids):
+                if not future.done():
+                    future.set_result(order_id)
+
+    def get(self, order_id: int) -> Optional[Dict]:
+        order = self._orders.get(order_id)
+        return order.as_dict() if order else None
+
+    def on_order_status(self, trade):
+        order = self._orders.get(trade.order.orderId)
+        if order is None:
+            return
+        status = trade.orderStatus
+        order.status = status.status
+        order.filled = status.filled
+        order.avg_fill_price = status.avgFillPrice
+        self.hub.publish("orders", order.as_dict(), key=order.order_id)
+
+    def on_execution(self, trade, fill):
+        execution = fill.execution
+        if execution.execId in self._fills or execution.execId in self._recorded:
+            return
+        order = self._orders.get(execution.orderId)
+        self._fills[execution.execId] = [
+            time.monotonic(),
+            {
+                "portfolio_id": self.portfolio_id,
+                "symbol": fill.contract.symbol,
+                "exchange": order.exchange if order else fill.contract.exchange,
+                "side": SIDES.get(execution.side, execution.side),
+                "quantity": execution.shares,
+                "price": execution.price,
+                "commission": 0.0,
+                "strategy": order.strategy if order else "",
+                "signal_strength": order.signal_strength if order else 0.0,
+                "executed_at": _utc_naive(execution.time),
+            },
+            False,
+        ]
+
+    def on_commission(self, trade, fill, report):
+        entry = self._fills.get(report.execId)
+        if entry is not None:
+            entry[1]["commission"] = report.commission
+            entry[2] = True
+
+    async def flush(self, force: bool = False) -> int:
+        """Bulk-insert fills whose commission is known or has been waited on long enough."""
+        cutoff = time.monotonic() - settings.FILL_COMMISSION_WAIT
+        ready = [
+            exec_id for exec_id, (received, _, has_commission) in self._fills.items()
+            if force or has_commission or received < cutoff
+        ]
+        if not ready:
+            return 0
+        entries = {exec_id: self._fills.pop(exec_id) for exec_id in ready}
+        try:
+            async with self.session_factory() as db:
+                await db.execute(insert(Trade), [entry[1] for entry in entries.values()])
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to record {len(entries)} fills: {e}")
+            # Keep them for the next flush
+            self._fills.update(entries)
+            return 0
+        for exec_id in entries:
+            self._recorded[exec_id] = None
+        while len(self._recorded) > ORDER_HISTORY:
+            self._recorded.popitem(last=False)
+        self.fills_written += len(entries)
+        await response_cache.invalidate("trades")
+        return len(entries)
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(settings.FILL_FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        loop = asyncio.get_event_loop()
+        self._tasks = [loop.create_task(self._drain_forever()), loop.create_task(self._flush_forever())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._queue = None
+        await self.flush(force=True)
+
+    def info(self) -> Dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "tracked_orders": len(self._orders),
+            "pending_fills": len(self._fills),
+            "batches": self.batches,
+            "fills_written": self.fills_written,
+        }
+
+
+# Global order service instance
+order_service = OrderService()
@@ -0,0 +1,104 @@
+"""Sampling profiler for the live process.
+
+While running, a background thread records the Python stack of every other
+thread every ``PROFILER_INTERVAL`` seconds. Sampling only reads frames, so
+the profiled code runs unmodified; the cost is one pass over the stacks
+per interval, held under the GIL. The report is in the folded format
+(``frame;frame;frame count`` per line, root first) read by flamegraph.pl,
+speedscope and similar tools. A profiler left running stops itself after
+``PROFILER_MAX_DURATION`` seconds.
+"""
+
+from collections import Counter
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.interval = settings.PROFILER_INTERVAL
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._deadline = 0.0
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: Optional[float] = None, duration: Optional[float] = None) -> Dict:
+        """Start sampling from scratch, discarding earlier samples."""
+        self.stop()
+        self.interval = interval or settings.PROFILER_INTERVAL
+        duration = min(duration or settings.PROFILER_MAX_DURATION, settings.PROFILER_MAX_DURATION)
+        self.samples = Counter()
+        self.sample_count = 0
+        self.started_at = time.time()
+        self.stopped_at = None
+        self._deadline = time.monotonic() + duration
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Profiler started: every {self.interval * 1000:g} ms for up to {duration:g} s")
+        return self.info()
+
+    def stop(self) -> Dict:
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+        return self.info()
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stopping.wait(self.interval):
+            if time.monotonic() >= self._deadline:
+                break
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if ident not in names:
+                    names.update((t.ident, t.name) for t in threading.enumerate())
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+        self.stopped_at = time.time()
+
+    def report(self, limit: Optional[int] = None) -> str:
+        """Folded stacks, most sampled first; ``limit`` keeps only the top ones."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common(limit))
+
+    def info(self) -> Dict:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": self.sample_count,
+            "stacks": len(self.samples),
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+        }
+
+
+# Global profiler instance
+profiler = SamplingProfiler()
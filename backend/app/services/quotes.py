@@ -0,0 +1,204 @@
+"""Conflated real-time quotes over the WebSocket.
+
+IB ticker updates only mark their symbol dirty; every
+``QUOTE_PUSH_INTERVAL`` seconds the dirty symbols are read once and a
+msgpack-encoded binary frame carrying just the fields that changed since
+the last push is published on ``quotes:{exchange}:{symbol}``. However many
+ticks arrive in between, a symbol costs at most one frame per interval.
+
+Frames are maps with short keys: ``s`` symbol, ``x`` exchange, ``t`` tick
+time (ms since epoch), ``b``/``a``/``l`` bid/ask/last, ``bs``/``as``/``ls``
+their sizes and ``v`` volume. Missing values are sent as nil. New
+subscribers get a full frame (``f`` true) straight away, and every
+subscriber gets one every ``QUOTE_SNAPSHOT_INTERVAL`` seconds so a client
+that dropped deltas catches up.
+
+The first subscriber to a quote topic opens the IB market data
+subscription and the last one to leave releases it.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, Hashable, Optional, Set, Tuple
+
+import msgpack
+
+from app.brokers.interactive_brokers import ib_client
+from app.core.config import settings
+from app.services.broadcaster import broadcaster
+
+logger = logging.getLogger(__name__)
+
+
+TOPIC_PREFIX = "quotes:"
+
+# Frame key -> Ticker attribute
+FIELDS = {
+    "b": "bid",
+    "a": "ask",
+    "l": "last",
+    "bs": "bidSize",
+    "as": "askSize",
+    "ls": "lastSize",
+    "v": "volume",
+}
+
+
+def quote_topic(symbol: str, exchange: str) -> str:
+    return f"{TOPIC_PREFIX}{exchange}:{symbol}"
+
+
+def parse_topic(topic: str) -> Optional[Tuple[str, str]]:
+    """(symbol, exchange) for a quote topic, or None."""
+    if not topic.startswith(TOPIC_PREFIX):
+        return None
+    exchange, _, symbol = topic[len(TOPIC_PREFIX):].partition(":")
+    if not exchange or not symbol:
+        return None
+    return symbol, exchange
+
+
+def _clean(value):
+    # ib_insync reports missing prices and sizes as NaN
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+def quote_fields(ticker) -> Dict:
+    fields = {key: _clean(getattr(ticker, attr, None)) for key, attr in FIELDS.items()}
+    tick_time = getattr(ticker, "time", None)
+    fields["t"] = int(tick_time.timestamp() * 1000) if tick_time is not None else None
+    return fields
+
+
+def encode(symbol: str, exchange: str, fields: Dict, full: bool = False) -> bytes:
+    frame = {"s": symbol, "x": exchange, **fields}
+    if full:
+        frame["f"] = True
+    return msgpack.packb(frame)
+
+
+class QuoteStream:
+    def __init__(self, client=ib_client, hub=broadcaster, interval: Optional[float] = None,
+                 snapshot_interval: Optional[float] = None):
+        self.client = client
+        self.hub = hub
+        self.interval = interval or settings.QUOTE_PUSH_INTERVAL
+        self.snapshot_interval = snapshot_interval or settings.QUOTE_SNAPSHOT_INTERVAL
+        self._dirty: Dict[Hashable, object] = {}
+        self._tickers: Dict[Hashable, object] = {}
+        self._sent: Dict[Hashable, Dict] = {}
+        self._wanted: Set[Tuple[str, str]] = set()
+        self._held: Set[Tuple[str, str]] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._last_snapshot = time.monotonic()
+        self.frames = 0
+        client.subscriptions.add_listener(self.on_ticker)
+        hub.add_topic_listener(self.on_topic)
+        hub.add_subscribe_listener(self.on_subscribe)
+
+    def on_ticker(self, key: Hashable, ticker):
+        """SubscriptionManager listener; called on every tick, so it only records the ticker."""
+        self._dirty[key] = ticker
+
+    def flush(self, snapshot: bool = False) -> int:
+        """Publish one frame per dirty symbol (or per known symbol for a snapshot)."""
+        pending = self._tickers if snapshot else self._dirty
+        self._tickers.update(self._dirty)
+        self._dirty = {}
+        published = 0
+        for key, ticker in list(pending.items()):
+            symbol, exchange = key
+            topic = quote_topic(symbol, exchange)
+            if not self.hub.has_subscribers(topic):
+                # Nobody to diff for; the next subscriber gets a full frame
+                self._sent.pop(key, None)
+                continue
+            fields = quote_fields(ticker)
+            sent = self._sent.get(key)
+            if snapshot or sent is None:
+                delta, full = fields, True
+            else:
+                delta = {k: v for k, v in fields.items() if sent.get(k) != v}
+                full = False
+                if not delta:
+                    continue
+            self._sent[key] = fields
+            self.hub.publish_payload(topic, encode(symbol, exchange, delta, full))
+            published += 1
+        self.frames += published
+        return published
+
+    def snapshot(self, topic: str) -> Optional[bytes]:
+        """Full frame with the current quote for a quote topic, if one has arrived."""
+        key = parse_topic(topic)
+        if key is None:
+            return None
+        ticker = self._dirty.get(key, self._tickers.get(key))
+        return encode(*key, quote_fields(ticker), full=True) if ticker is not None else None
+
+    def on_subscribe(self, websocket, topic: str):
+        """Send a newly subscribed client the full current quote."""
+        frame = self.snapshot(topic)
+        if frame is not None:
+            self.hub.send_payload(websocket, frame)
+
+    def on_topic(self, topic: str, active: bool):
+        key = parse_topic(topic)
+        if key is None or self._task is None:
+            # Only a running stream holds market data; API workers behind a gateway never start one
+            return
+        if active:
+            self._wanted.add(key)
+            if key not in self._held:
+                asyncio.get_event_loop().create_task(self._hold(key))
+        else:
+            self._wanted.discard(key)
+            self._release(key)
+
+    async def _hold(self, key: Tuple[str, str]):
+        if not await self.client.stream_market_data(*key):
+            return
+        if key in self._held or key not in self._wanted:
+            # Held by an earlier request, or the last subscriber left while this one was pending
+            self.client.stop_market_data(*key)
+            return
+        self._held.add(key)
+        ticker = self.client.subscriptions.latest(key)
+        if ticker is not None:
+            self._dirty[key] = ticker
+
+    def _release(self, key: Tuple[str, str]):
+        if key in self._held:
+            self._held.discard(key)
+            self.client.stop_market_data(*key)
+        self._tickers.pop(key, None)
+        self._sent.pop(key, None)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            snapshot = now - self._last_snapshot >= self.snapshot_interval
+            if snapshot:
+                self._last_snapshot = now
+            try:
+                self.flush(snapshot)
+            except Exception as e:
+                logger.error(f"Quote flush failed: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# Global quote stream instance
+quote_stream = QuoteStream()
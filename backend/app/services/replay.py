@@ -0,0 +1,170 @@
+"""Historical market replay through the simulated broker.
+
+Stored bars for any number of symbols are merged into one timestamp-ordered
+stream (a k-way merge over the per-symbol bar store columns) and fed to
+``SimulatedIB.on_bar``. From there they reach the rest of the system as
+live data would: ticker updates to market data subscribers (quotes over
+/ws, valuation), completed 1 minute bars to ``stream_bars`` consumers
+(aggregation, live strategies), and fills of resting orders. Bars of
+another ``timeframe`` only move quotes and fill orders: the bar streams
+carry 1 minute bars, and hourly or daily ones would be taken for those.
+
+``speed`` is market time per wall-clock time: 1 replays in real time, 100
+a hundred times faster, 0 as fast as possible. Bars sharing a timestamp
+are published together, so an opening burst across many symbols arrives
+as one. Requires ``BROKER=simulated``.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+import heapq
+import logging
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.brokers.interactive_brokers import ib_client
+from app.brokers.simulated import SimulatedIB
+from app.core.config import settings
+from app.services.bar_store import bar_store
+
+logger = logging.getLogger(__name__)
+
+
+# Bars converted from the store's columns at a time, per symbol
+CHUNK_SIZE = 4096
+
+
+class ReplayEngine:
+    def __init__(self, client=ib_client, store=bar_store):
+        self.client = client
+        self.store = store
+        self.status = "idle"
+        self.error: Optional[str] = None
+        self.symbols: List[str] = []
+        self.timeframe = settings.BASE_TIMEFRAME
+        self.speed = settings.REPLAY_SPEED
+        self.total = 0
+        self.published = 0
+        self.market_time: Optional[datetime] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _bars(self, index: int, symbol: str, start: Optional[datetime],
+              end: Optional[datetime]) -> Iterator[Tuple]:
+        bars = self.store.read(symbol, self.timeframe, start, end)
+        for lo in range(0, len(bars), CHUNK_SIZE):
+            chunk = bars[lo:lo + CHUNK_SIZE]
+            yield from zip(chunk.timestamp.tolist(), [index] * len(chunk), chunk.open.tolist(),
+                           chunk.high.tolist(), chunk.low.tolist(), chunk.close.tolist(),
+                           chunk.volume.tolist())
+
+    def merged(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[Tuple]:
+        """(timestamp ns, symbol index, open, high, low, close, volume) for every bar, oldest first."""
+        return heapq.merge(*(self._bars(i, symbol, start, end) for i, symbol in enumerate(self.symbols)))
+
+    async def start(self, symbols: List[str], start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    speed: Optional[float] = None, timeframe: Optional[str] = None) -> Dict:
+        """Replay ``symbols`` between ``start`` and ``end`` in the background, replacing any running replay."""
+        await self.stop()
+        self.symbols = list(dict.fromkeys(symbols))
+        self.timeframe = timeframe or settings.BASE_TIMEFRAME
+        self.speed = settings.REPLAY_SPEED if speed is None else speed
+        self.published = 0
+        self.market_time = None
+        self.started_at = self.finished_at = None
+        self.error = None
+
+        broker = self.client.ib
+        if not isinstance(broker, SimulatedIB):
+            return self._fail("Replay needs the simulated broker (BROKER=simulated)")
+        if self.speed < 0:
+            return self._fail("Speed must be positive, or 0 for as fast as possible")
+        try:
+            self.total = sum(len(self.store.read(s, self.timeframe, start, end)) for s in self.symbols)
+        except Exception as e:
+            return self._fail(f"Cannot read stored bars: {e}")
+        if not self.total:
+            return self._fail(f"No stored {self.timeframe} bars for {', '.join(self.symbols)} in that range")
+
+        if not self.client.connected:
+            await self.client.connect()
+        self.status = "running"
+        self.started_at = time.time()
+        self._task = asyncio.get_event_loop().create_task(self._run(broker, start, end))
+        logger.info(f"Replaying {self.total} bars for {len(self.symbols)} symbols at speed {self.speed or 'max'}")
+        return self.info()
+
+    def _fail(self, error: str) -> Dict:
+        logger.error(f"Cannot start replay: {error}")
+        self.status = "failed"
+        self.error = error
+        return self.info()
+
+    async def _run(self, broker: SimulatedIB, start: Optional[datetime], end: Optional[datetime]):
+        loop = asyncio.get_event_loop()
+        symbols = self.symbols
+        stream = self.timeframe == settings.BASE_TIMEFRAME
+        first = current = None
+        began = loop.time()
+        unyielded = 0
+        try:
+            for ts, index, o, h, l, c, v in self.merged(start, end):
+                if ts != current:
+                    # Everything at the previous timestamp is out; wait for this one's turn
+                    current = ts
+                    if first is None:
+                        first = ts
+                    if self.speed:
+                        delay = began + (ts - first) / 1e9 / self.speed - loop.time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                            unyielded = 0
+                    if unyielded >= settings.REPLAY_YIELD_EVERY:
+                        # Let consumers and the order events the bars caused run
+                        await asyncio.sleep(0)
+                        unyielded = 0
+                    self.market_time = datetime.fromtimestamp(ts / 1e9, timezone.utc)
+                broker.on_bar(symbols[index], self.market_time, o, h, l, c, v, stream)
+                self.published += 1
+                unyielded += 1
+        except asyncio.CancelledError:
+            self.status = "stopped"
+            raise
+        except Exception as e:
+            logger.error(f"Replay failed: {e}")
+            self.status = "failed"
+            self.error = str(e)
+        else:
+            self.status = "completed"
+        finally:
+            self.finished_at = time.time()
+            logger.info(f"Replay {self.status} after {self.published} bars")
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def info(self) -> Dict:
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else None
+        return {
+            "status": self.status,
+            "error": self.error,
+            "symbols": len(self.symbols),
+            "timeframe": self.timeframe,
+            "speed": self.speed,
+            "bars": self.total,
+            "published": self.published,
+            "market_time": self.market_time,
+            "elapsed": elapsed,
+            "bars_per_second": self.published / elapsed if elapsed else None,
+        }
+
+
+# Global replay engine instance
+replay_engine = ReplayEngine()
@@ -0,0 +1,244 @@
+"""In-memory pre-trade risk checks.
+
+Cash, positions and marks come from the in-memory book kept by
+``valuation_service``, so equity and intraday P&L are O(1) and no check
+touches the database. Every order is checked against the limits before it
+reaches IB:
+
+* ``MAX_POSITION_SIZE``: the position after the order, including
+  quantities still working in open orders, may not exceed this fraction
+  of equity.
+* ``MAX_DAILY_LOSS``: once equity falls this fraction below the start of
+  the trading day, trading halts until the next day or a manual resume.
+
+While halted only orders that reduce an existing position are accepted.
+A market order for a symbol no quote subscription has priced yet gets a
+snapshot quote through the IB client's subscriptions before it is sized.
+"""
+
+from collections import OrderedDict
+from datetime import date, datetime
+import logging
+import math
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo
+
+from app.brokers.interactive_brokers import ib_client
+from app.core.config import settings
+from app.services.valuation import SEEN_EXECUTIONS, signed_quantity, valuation_service
+
+logger = logging.getLogger(__name__)
+
+
+# Order statuses after which nothing more will fill
+DONE_STATUSES = {"Filled", "Cancelled", "ApiCancelled", "Inactive"}
+
+
+def _reduces(current: float, target: float) -> bool:
+    return abs(target) < abs(current) and current * target >= 0
+
+
+class RiskEngine:
+    def __init__(self, client=ib_client, book=valuation_service,
+                 max_daily_loss: Optional[float] = None, max_position_size: Optional[float] = None):
+        self.client = client
+        self.book = book
+        self.max_daily_loss = settings.MAX_DAILY_LOSS if max_daily_loss is None else max_daily_loss
+        self.max_position_size = settings.MAX_POSITION_SIZE if max_position_size is None else max_position_size
+        self.start_equity = 0.0
+        self.start_realized = 0.0
+        # Signed quantity still working per symbol, and per order id
+        self.open_quantity: Dict[str, float] = {}
+        self._open_orders: Dict[int, tuple] = {}
+        self._reserved: Dict[int, tuple] = {}
+        self.day: Optional[date] = None
+        self.halted = False
+        self.halt_reason = ""
+        self.rejections = 0
+        self._seen: "OrderedDict[tuple, None]" = OrderedDict()
+        self._tz = ZoneInfo(settings.SESSION_TIMEZONE)
+        client.add_order_listener(self)
+        book.add_listener(self._check_loss)
+
+    @property
+    def equity(self) -> float:
+        return self.book.total_value
+
+    @property
+    def daily_pnl(self) -> float:
+        return self.equity - self.start_equity
+
+    @property
+    def realized_pnl(self) -> float:
+        return self.book.realized_pnl - self.start_realized
+
+    def start(self):
+        """Begin the trading day from the loaded book; halts if it could not be loaded."""
+        if not self.book.loaded:
+            self.halt("portfolio unavailable")
+            return
+        if self.halt_reason == "portfolio unavailable":
+            self.resume()
+        self._roll_day(force=True)
+        logger.info(f"Risk engine started: equity {self.equity:.2f}")
+
+    def _roll_day(self, force: bool = False):
+        today = datetime.now(self._tz).date()
+        if force or today != self.day:
+            self.day = today
+            self.start_equity = self.equity
+            self.start_realized = self.book.realized_pnl
+            if self.halted and self.halt_reason == "daily loss limit":
+                self.resume()
+
+    def _check_loss(self):
+        self._roll_day()
+        if not self.halted and self.start_equity > 0 and -self.daily_pnl >= self.max_daily_loss * self.start_equity:
+            self.halt("daily loss limit")
+
+    def halt(self, reason: str = "manual"):
+        self.halted = True
+        self.halt_reason = reason
+        logger.warning(f"Trading halted: {reason}")
+
+    def resume(self):
+        self.halted = False
+        self.halt_reason = ""
+        logger.info("Trading resumed")
+
+    def exposure(self, symbol: str) -> float:
+        """Signed position in ``symbol`` once every working order fills."""
+        position = self.book.holdings.get(symbol)
+        return (position.quantity if position else 0.0) + self.open_quantity.get(symbol, 0.0)
+
+    def _price(self, order: Dict) -> float:
+        """Price to size ``order`` at, 0 if none is known."""
+        symbol = order["symbol"]
+        position = self.book.holdings.get(symbol)
+        price = order.get("limit_price") or self.book.prices.get(symbol) or (position.price if position else 0.0)
+        return 0.0 if not price or math.isnan(price) else price
+
+    async def ensure_price(self, order: Dict):
+        """Fetch a quote for an order that opens or adds to a position nothing has priced yet."""
+        current = self.exposure(order["symbol"])
+        target = current + signed_quantity(order["action"], order["quantity"])
+        if self.halted or _reduces(current, target) or self._price(order):
+            return
+        quote = await self.client.get_market_data(order["symbol"], order["exchange"])
+        if quote is None or self._price(order):
+            # Failed, or the subscription's first tick already marked the book
+            return
+        price = quote["last"]
+        if not price or math.isnan(price):
+            price = (quote["bid"] + quote["ask"]) / 2
+        if price and not math.isnan(price):
+            self.book.prices[order["symbol"]] = price
+
+    def check(self, order: Dict) -> Optional[str]:
+        """Reason to reject ``order`` (``place_order`` arguments), or None.
+
+        An accepted order's quantity counts against its symbol until
+        ``placed`` reports the outcome and fills or cancellation settle it.
+        """
+        self._roll_day()
+        symbol = order["symbol"]
+        delta = signed_quantity(order["action"], order["quantity"])
+        current = self.exposure(symbol)
+        target = current + delta
+        reduces = _reduces(current, target)
+
+        reason = None
+        if self.halted and not reduces:
+            reason = f"Trading halted ({self.halt_reason})"
+        elif not reduces:
+            price = self._price(order)
+            if not price:
+                reason = f"No price for {symbol} to size the order"
+            elif self.equity <= 0 or abs(target) * price > self.max_position_size * self.equity:
+                reason = f"{symbol} position would exceed {self.max_position_size:.0%} of equity"
+        if reason is not None:
+            self.rejections += 1
+            return reason
+
+        self.open_quantity[symbol] = self.open_quantity.get(symbol, 0.0) + delta
+        self._reserved[id(order)] = (symbol, delta)
+        return None
+
+    def placed(self, order: Dict, order_id: Optional[int]):
+        """Bind an accepted order's reservation to its IB order id, or drop it if placement failed."""
+        reservation = self._reserved.pop(id(order), None)
+        if reservation is None:
+            return
+        if order_id is None:
+            self._release(*reservation)
+        else:
+            self._open_orders[order_id] = reservation
+
+    def _release(self, symbol: str, delta: float):
+        remaining = self.open_quantity.get(symbol, 0.0) - delta
+        if abs(remaining) < 1e-9:
+            self.open_quantity.pop(symbol, None)
+        else:
+            self.open_quantity[symbol] = remaining
+
+    def on_order_status(self, trade):
+        if trade.orderStatus.status not in DONE_STATUSES:
+            return
+        reservation = self._open_orders.pop(trade.order.orderId, None)
+        if reservation is not None:
+            # Whatever filled was already moved into the position by on_execution
+            self._release(*reservation)
+
+    def _first_time(self, key: tuple) -> bool:
+        if key in self._seen:
+            return False
+        self._seen[key] = None
+        if len(self._seen) > SEEN_EXECUTIONS:
+            self._seen.popitem(last=False)
+        return True
+
+    def on_execution(self, trade, fill):
+        # The book applies the fill itself; only the order's reservation shrinks here
+        execution = fill.execution
+        if not self._first_time(("execution", execution.execId)):
+            return
+        reservation = self._open_orders.get(execution.orderId)
+        if reservation is not None:
+            symbol, remaining = reservation
+            delta = signed_quantity(execution.side, execution.shares)
+            self._open_orders[execution.orderId] = (symbol, remaining - delta)
+            self._release(symbol, delta)
+
+    def on_commission(self, trade, fill, report):
+        pass
+
+    def state(self) -> Dict:
+        return {
+            "halted": self.halted,
+            "halt_reason": self.halt_reason,
+            "day": self.day,
+            "cash": self.book.cash,
+            "market_value": self.book.market_value,
+            "equity": self.equity,
+            "start_equity": self.start_equity,
+            "daily_pnl": self.daily_pnl,
+            "realized_pnl": self.realized_pnl,
+            "max_daily_loss": self.max_daily_loss,
+            "max_position_size": self.max_position_size,
+            "rejections": self.rejections,
+            "positions": {
+                symbol: {
+                    "quantity": p.quantity,
+                    "avg_price": p.avg_price,
+                    "price": p.price,
+                    "open_quantity": self.open_quantity.get(symbol, 0.0),
+                    "weight": p.quantity * p.price / self.equity if self.equity else None,
+                }
+                for symbol, p in self.book.holdings.items()
+            },
+            "open_quantity": dict(self.open_quantity),
+        }
+
+
+# Global risk engine instance
+risk_engine = RiskEngine()
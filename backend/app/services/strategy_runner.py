@@ -0,0 +1,273 @@
+"""Run active strategies against live bars.
+
+Completed 1 minute bars are streamed from IB for every symbol an active
+strategy trades. Each one is dispatched as a base bar close and folded into
+``aggregation_service``, whose derived bar closes are dispatched the same
+way. A bar close is routed only to the strategies trading that symbol on
+that timeframe, and evaluated with their streaming ``on_bar`` path on a
+small pool of single-threaded workers. Bars for a given symbol always land
+on the same worker, so each strategy sees them in order, and the event
+loop only awaits the result and places orders.
+
+Live settings are read from the strategy parameters (see
+``RUNTIME_PARAMETERS``): ``symbols`` (defaults to ``TRADING_UNIVERSE``),
+``exchange`` for those symbols (``US`` by default), ``timeframe`` (``1d``)
+and order ``quantity`` (1). An order is queued on ``order_service`` when a
+symbol's signal flips to BUY or SELL, and only while ``TRADING_ENABLED`` is
+set; otherwise the signal is just logged. A SELL only closes what is held
+(counting working orders), so the runner never opens a short.
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from app.brokers.contracts import universe_pairs
+from app.brokers.interactive_brokers import ib_client
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import STRATEGY_EVALUATION
+from app.models.trading import Strategy
+from app.services.aggregation import aggregation_service, read_resampled
+from app.services.bar_store import bar_store
+from app.services.orders import order_service
+from app.services.risk import risk_engine
+from app.strategies.registry import build_strategy
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """Rolling latency samples in milliseconds."""
+
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, ms: float):
+        self.samples.append(ms)
+        self.count += 1
+
+    def summary(self) -> Dict:
+        if not self.samples:
+            return {"count": self.count}
+        values = np.fromiter(self.samples, dtype=np.float64)
+        return {
+            "count": self.count,
+            "mean_ms": float(values.mean()),
+            "p50_ms": float(np.percentile(values, 50)),
+            "p99_ms": float(np.percentile(values, 99)),
+            "max_ms": float(values.max()),
+        }
+
+
+class _LiveStrategy:
+    def __init__(self, record: Strategy):
+        params = json.loads(record.parameters) if record.parameters else {}
+        self.id = record.id
+        self.name = record.name
+        self.parameters = record.parameters
+        self.instance = build_strategy(record.name, record.parameters)
+        self.timeframe = params.get("timeframe", "1d")
+        self.quantity = params.get("quantity", 1)
+        if params.get("symbols"):
+            exchange = params.get("exchange", "US")
+            self.pairs = [(symbol, exchange) for symbol in params["symbols"]]
+        else:
+            self.pairs = universe_pairs(settings.TRADING_UNIVERSE)
+        self.exchanges = dict(self.pairs)
+        self.last_signal: Dict[str, str] = {}
+
+
+class StrategyRunner:
+    def __init__(self, client=ib_client, aggregator=aggregation_service, store=bar_store,
+                 orders=order_service, risk=risk_engine, workers: Optional[int] = None):
+        self.client = client
+        self.orders = orders
+        self.risk = risk
+        self.aggregator = aggregator
+        self.store = store
+        self.workers = workers or settings.STRATEGY_WORKERS
+        self._shards = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"strategy-{i}")
+            for i in range(self.workers)
+        ]
+        self._strategies: Dict[int, _LiveStrategy] = {}
+        self._routes: Dict[Tuple[str, str], List[_LiveStrategy]] = {}
+        self._streams: Set[Tuple[str, str]] = set()
+        self._lock = asyncio.Lock()
+        self.running = False
+        self.bars = 0
+        self.orders_placed = 0
+        self.latency = {"evaluate": LatencyStats(), "order": LatencyStats()}
+        aggregator.subscribe(self.on_bar_close)
+
+    def _shard(self, symbol: str) -> ThreadPoolExecutor:
+        return self._shards[hash(symbol) % len(self._shards)]
+
+    async def start(self):
+        self.running = True
+        await self.reload()
+
+    async def stop(self):
+        self.running = False
+        for symbol, exchange in self._streams:
+            self.client.stop_bars(symbol, exchange)
+        self._streams.clear()
+        self._strategies.clear()
+        self._routes.clear()
+
+    async def reload(self):
+        """Sync the running set with the active strategies in the database."""
+        if not self.running:
+            return
+        async with self._lock:
+            try:
+                async with AsyncSessionLocal() as db:
+                    records = (
+                        await db.execute(select(Strategy).where(Strategy.is_active.is_(True)))
+                    ).scalars().all()
+            except Exception as e:
+                logger.error(f"Failed to load active strategies: {e}")
+                return
+
+            strategies = {}
+            for record in records:
+                live = self._strategies.get(record.id)
+                if live is not None and live.name == record.name and live.parameters == record.parameters:
+                    strategies[record.id] = live
+                    continue
+                try:
+                    live = _LiveStrategy(record)
+                except Exception as e:
+                    logger.error(f"Cannot run strategy {record.name}: {e}")
+                    continue
+                await asyncio.gather(*(self._warm_up(live, *pair) for pair in live.pairs))
+                strategies[record.id] = live
+
+            routes: Dict[Tuple[str, str], List[_LiveStrategy]] = {}
+            for live in strategies.values():
+                for symbol, _ in live.pairs:
+                    routes.setdefault((symbol, live.timeframe), []).append(live)
+            self._strategies = strategies
+            self._routes = routes
+
+            wanted = {pair for live in strategies.values() for pair in live.pairs}
+            for symbol, exchange in self._streams - wanted:
+                self.client.stop_bars(symbol, exchange)
+            for symbol, exchange in wanted - self._streams:
+                if await self.client.stream_bars(symbol, exchange, partial(self._on_base_bar, symbol, exchange)):
+                    self._streams.add((symbol, exchange))
+            self._streams &= wanted
+            logger.info(f"Running {len(strategies)} strategies on {len(wanted)} symbols")
+
+    async def _warm_up(self, live: _LiveStrategy, symbol: str, exchange: str):
+        """Replay the stored history a strategy needs before its first live bar."""
+
+        def warm():
+            limit = live.instance.warmup
+            if self.store.last_timestamp(symbol, live.timeframe) is not None:
+                bars = self.store.read(symbol, live.timeframe, limit=limit)
+            else:
+                bars = read_resampled(self.store, symbol, exchange, live.timeframe, limit=limit)
+            for close, volume in zip(bars.close.tolist(), bars.volume.tolist()):
+                live.instance.on_bar(symbol, close, volume)
+
+        await asyncio.wrap_future(self._shard(symbol).submit(warm))
+
+    def _on_base_bar(self, symbol: str, exchange: str, bar):
+        timestamp = pd.Timestamp(bar.date)
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.tz_convert(None)
+        self.on_bar_close(
+            {
+                "symbol": symbol,
+                "timeframe": settings.BASE_TIMEFRAME,
+                "timestamp": timestamp,
+                "close": bar.close,
+                "volume": max(bar.volume, 0),
+            }
+        )
+        self.aggregator.on_bar(
+            symbol, exchange, timestamp, bar.open, bar.high, bar.low, bar.close, max(bar.volume, 0)
+        )
+
+    def on_bar_close(self, bar: Dict):
+        strategies = self._routes.get((bar["symbol"], bar["timeframe"]))
+        if not strategies:
+            return
+        received = time.perf_counter()
+        future = self._shard(bar["symbol"]).submit(_evaluate, strategies, bar)
+        asyncio.get_event_loop().create_task(self._route(asyncio.wrap_future(future), bar, received))
+
+    async def _route(self, future, bar: Dict, received: float):
+        try:
+            results = await future
+        except Exception as e:
+            logger.error(f"Strategy evaluation failed for {bar['symbol']}: {e}")
+            return
+        self.bars += 1
+        self.latency["evaluate"].add((time.perf_counter() - received) * 1000)
+
+        symbol = bar["symbol"]
+        for live, result in results:
+            signal = result["signal"]
+            if signal == "HOLD" or live.last_signal.get(symbol) == signal:
+                continue
+            live.last_signal[symbol] = signal
+            if not settings.TRADING_ENABLED:
+                logger.info(f"{live.name}: {signal} {symbol} ({result.get('reason', '')}); trading disabled")
+                continue
+            quantity = live.quantity
+            if signal == "SELL":
+                quantity = min(quantity, self.risk.exposure(symbol))
+                if quantity <= 0:
+                    logger.info(f"{live.name}: SELL {symbol} with no position to close")
+                    continue
+            [order_id] = await self.orders.submit([{
+                "symbol": symbol,
+                "exchange": live.exchanges[symbol],
+                "action": signal,
+                "quantity": quantity,
+                "strategy": live.name,
+                "signal_strength": result["strength"],
+            }])
+            if order_id is not None:
+                self.orders_placed += 1
+                self.latency["order"].add((time.perf_counter() - received) * 1000)
+
+    def info(self) -> Dict:
+        return {
+            "running": self.running,
+            "strategies": [
+                {"id": live.id, "name": live.name, "timeframe": live.timeframe,
+                 "symbols": [symbol for symbol, _ in live.pairs]}
+                for live in self._strategies.values()
+            ],
+            "streams": len(self._streams),
+            "bars": self.bars,
+            "orders_placed": self.orders_placed,
+            "latency": {name: stats.summary() for name, stats in self.latency.items()},
+        }
+
+
+def _evaluate(strategies: List[_LiveStrategy], bar: Dict):
+    """Fold one bar into every strategy routed to it (runs on a worker thread)."""
+    symbol = bar["symbol"]
+    started = time.perf_counter()
+    results = [(live, live.instance.on_bar(symbol, bar["close"], bar["volume"])) for live in strategies]
+    STRATEGY_EVALUATION.labels(symbol).observe(time.perf_counter() - started)
+    return results
+
+
+# Global strategy runner instance
+strategy_runner = StrategyRunner()
@@ -0,0 +1,364 @@
+"""Real-time portfolio valuation.
+
+Cash and positions are loaded from ``Portfolio``/``Position`` once; after
+that each quote tick re-marks its position and adjusts the running market
+value and cost basis by the difference, and each IB execution or
+commission moves cash and the position, so totals are O(1) per event.
+While the service runs it holds a market data subscription for every
+open position, taken when positions load or a fill opens one and released
+when the position goes flat, so marks move whether or not anyone watches
+the quote.
+Summary and position requests are answered from memory. Changed positions
+and the portfolio row are written back in one transaction every
+``VALUATION_FLUSH_INTERVAL`` seconds, and the totals are pushed on the
+``portfolio`` WebSocket topic at most every ``PORTFOLIO_PUSH_INTERVAL``.
+"""
+
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+import logging
+import math
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, select, update
+
+from app.brokers.interactive_brokers import ib_client
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.trading import Portfolio, Position
+from app.services.broadcaster import broadcaster
+
+logger = logging.getLogger(__name__)
+
+
+# Execution ids remembered so executions repeated after a reconnect are not applied twice
+SEEN_EXECUTIONS = 10000
+
+
+def signed_quantity(side: str, quantity: float) -> float:
+    """Positive for buys (``BUY``/``BOT``), negative for sells."""
+    return quantity if side in ("BUY", "BOT") else -quantity
+
+
+class Holding:
+    __slots__ = ("id", "symbol", "exchange", "quantity", "avg_price", "price")
+
+    def __init__(self, symbol: str, exchange: str, quantity: float = 0.0, avg_price: float = 0.0,
+                 price: float = 0.0, id: Optional[int] = None):
+        self.id = id
+        self.symbol = symbol
+        self.exchange = exchange
+        self.quantity = quantity
+        self.avg_price = avg_price
+        self.price = price
+
+    @property
+    def market_value(self) -> float:
+        return self.quantity * self.price
+
+    @property
+    def unrealized_pnl(self) -> float:
+        return self.quantity * (self.price - self.avg_price)
+
+    def as_dict(self) -> Dict:
+        cost = self.avg_price * self.quantity
+        return {
+            "id": self.id,
+            "symbol": self.symbol,
+            "exchange": self.exchange,
+            "quantity": self.quantity,
+            "avg_price": self.avg_price,
+            "current_price": self.price,
+            "market_value": self.market_value,
+            "unrealized_pnl": self.unrealized_pnl,
+            "pnl_percentage": (self.unrealized_pnl / cost) * 100 if self.quantity > 0 and cost else 0,
+        }
+
+
+class ValuationService:
+    def __init__(self, client=ib_client, session_factory=AsyncSessionLocal, hub=broadcaster):
+        self.client = client
+        self.session_factory = session_factory
+        self.hub = hub
+        self.portfolio_id: Optional[int] = None
+        self.cash = 0.0
+        self.market_value = 0.0
+        self.cost_basis = 0.0
+        self.realized_pnl = 0.0
+        self.holdings: Dict[str, Holding] = {}
+        # Last traded/mid price per symbol from subscribed quotes, held or not
+        self.prices: Dict[str, float] = {}
+        self.updated_at = datetime.utcnow()
+        self.loaded = False
+        self._dirty: set = set()
+        self._closed: List[int] = []
+        self._portfolio_dirty = False
+        self._pushed = True
+        self._seen: "OrderedDict[tuple, None]" = OrderedDict()
+        self._listeners: List[Callable[[], None]] = []
+        self._tasks: List[asyncio.Task] = []
+        self._wanted: Set[Tuple[str, str]] = set()
+        self._held: Set[Tuple[str, str]] = set()
+        client.add_order_listener(self)
+        client.subscriptions.add_listener(self.on_ticker)
+
+    @property
+    def total_value(self) -> float:
+        return self.cash + self.market_value
+
+    @property
+    def unrealized_pnl(self) -> float:
+        return self.market_value - self.cost_basis
+
+    def add_listener(self, callback: Callable[[], None]):
+        """Call ``callback()`` after every change to cash or marks."""
+        self._listeners.append(callback)
+
+    def _changed(self):
+        self.updated_at = datetime.utcnow()
+        self._pushed = False
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Valuation listener failed: {e}")
+
+    async def load(self) -> bool:
+        """Load cash and positions from the database, creating the default portfolio if needed."""
+        try:
+            async with self.session_factory() as db:
+                portfolio = (await db.execute(select(Portfolio).limit(1))).scalar_one_or_none()
+                if portfolio is None:
+                    portfolio = Portfolio(name="Main Portfolio", cash_balance=100000.0)
+                    db.add(portfolio)
+                    await db.commit()
+                    await db.refresh(portfolio)
+                positions = (
+                    await db.execute(select(Position).where(Position.portfolio_id == portfolio.id))
+                ).scalars().all()
+        except Exception as e:
+            logger.error(f"Failed to load portfolio: {e}")
+            return False
+
+        self.portfolio_id = portfolio.id
+        self.cash = portfolio.cash_balance
+        self.holdings = {
+            p.symbol: Holding(p.symbol, p.exchange, p.quantity, p.avg_price,
+                              p.current_price or p.avg_price, id=p.id)
+            for p in positions
+        }
+        self.market_value = sum(h.market_value for h in self.holdings.values())
+        self.cost_basis = sum(h.quantity * h.avg_price for h in self.holdings.values())
+        self.updated_at = portfolio.updated_at or datetime.utcnow()
+        self.loaded = True
+        if self._tasks:
+            self._watch_all()
+        logger.info(f"Loaded portfolio: value {self.total_value:.2f}, {len(self.holdings)} positions")
+        return True
+
+    def _watch(self, holding: Holding):
+        key = (holding.symbol, holding.exchange)
+        self._wanted.add(key)
+        if key not in self._held:
+            asyncio.get_event_loop().create_task(self._hold(key))
+
+    def _watch_all(self):
+        for key in self._wanted - {(h.symbol, h.exchange) for h in self.holdings.values()}:
+            self._unwatch(key)
+        for holding in self.holdings.values():
+            self._watch(holding)
+
+    async def _hold(self, key: Tuple[str, str]):
+        if not await self.client.stream_market_data(*key):
+            logger.warning(f"No market data for held position {key[0]}; its mark will not move")
+            return
+        if key in self._held or key not in self._wanted:
+            # Held by an earlier request, or the position closed while this one was pending
+            self.client.stop_market_data(*key)
+            return
+        self._held.add(key)
+
+    def _unwatch(self, key: Tuple[str, str]):
+        self._wanted.discard(key)
+        if key in self._held:
+            self._held.discard(key)
+            self.client.stop_market_data(*key)
+
+    def _mark(self, holding: Holding, price: float):
+        self.market_value += holding.quantity * (price - holding.price)
+        holding.price = price
+        self._dirty.add(holding.symbol)
+
+    def on_ticker(self, key, ticker):
+        price = ticker.marketPrice()
+        if not price or math.isnan(price):
+            return
+        symbol = key[0]
+        self.prices[symbol] = price
+        holding = self.holdings.get(symbol)
+        if holding is not None and price != holding.price:
+            self._mark(holding, price)
+            self._changed()
+
+    def _first_time(self, key: tuple) -> bool:
+        if key in self._seen:
+            return False
+        self._seen[key] = None
+        if len(self._seen) > SEEN_EXECUTIONS:
+            self._seen.popitem(last=False)
+        return True
+
+    def on_order_status(self, trade):
+        pass
+
+    def on_execution(self, trade, fill):
+        execution = fill.execution
+        if not self._first_time(("execution", execution.execId)):
+            return
+        symbol = fill.contract.symbol
+        delta = signed_quantity(execution.side, execution.shares)
+        price = execution.price
+
+        holding = self.holdings.get(symbol)
+        if holding is None:
+            exchange = fill.contract.primaryExchange or fill.contract.exchange
+            holding = self.holdings[symbol] = Holding(symbol, exchange, price=price)
+            if self._tasks:
+                self._watch(holding)
+        self._mark(holding, price)
+
+        old = holding.quantity
+        new = old + delta
+        old_cost = old * holding.avg_price
+        if old * delta < 0:
+            # Closing (part of) the position realizes P&L on the closed quantity
+            closed = min(abs(delta), abs(old))
+            self.realized_pnl += closed * (price - holding.avg_price) * (1 if old > 0 else -1)
+        if new == 0:
+            holding.avg_price = 0.0
+        elif old * new <= 0:
+            holding.avg_price = price
+        elif abs(new) > abs(old):
+            holding.avg_price = (old_cost + price * delta) / new
+        holding.quantity = new
+
+        self.cost_basis += new * holding.avg_price - old_cost
+        self.market_value += delta * price
+        self.cash -= delta * price
+        self._portfolio_dirty = True
+        if new == 0:
+            del self.holdings[symbol]
+            self._dirty.discard(symbol)
+            self._unwatch((symbol, holding.exchange))
+            if holding.id is not None:
+                self._closed.append(holding.id)
+        self._changed()
+
+    def on_commission(self, trade, fill, report):
+        if not self._first_time(("commission", report.execId)):
+            return
+        self.cash -= report.commission
+        self.realized_pnl -= report.commission
+        self._portfolio_dirty = True
+        self._changed()
+
+    def summary(self) -> Dict:
+        return {
+            "portfolio_id": self.portfolio_id,
+            "total_value": self.total_value,
+            "cash_balance": self.cash,
+            "market_value": self.market_value,
+            "unrealized_pnl": self.unrealized_pnl,
+            "positions_count": len(self.holdings),
+            "updated_at": self.updated_at,
+        }
+
+    def positions(self) -> List[Dict]:
+        return [holding.as_dict() for holding in self.holdings.values()]
+
+    async def flush(self) -> int:
+        """Write changed positions and the portfolio totals in one transaction."""
+        if not self.loaded or not (self._dirty or self._closed or self._portfolio_dirty):
+            return 0
+        dirty = [self.holdings[s] for s in self._dirty if s in self.holdings]
+        closed = self._closed
+        self._dirty, self._closed, self._portfolio_dirty = set(), [], False
+        now = datetime.utcnow()
+
+        def row(h: Holding) -> Dict:
+            return {
+                "quantity": h.quantity,
+                "avg_price": h.avg_price,
+                "current_price": h.price,
+                "market_value": h.market_value,
+                "unrealized_pnl": h.unrealized_pnl,
+                "updated_at": now,
+            }
+
+        try:
+            async with self.session_factory() as db:
+                existing = [{"id": h.id, **row(h)} for h in dirty if h.id is not None]
+                if existing:
+                    await db.execute(update(Position), existing)
+                new = [h for h in dirty if h.id is None]
+                records = [
+                    Position(portfolio_id=self.portfolio_id, symbol=h.symbol, exchange=h.exchange, **row(h))
+                    for h in new
+                ]
+                db.add_all(records)
+                if closed:
+                    await db.execute(delete(Position).where(Position.id.in_(closed)))
+                await db.execute(
+                    update(Portfolio)
+                    .where(Portfolio.id == self.portfolio_id)
+                    .values(cash_balance=self.cash, total_value=self.total_value, updated_at=now)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to write portfolio snapshot: {e}")
+            # Retry on the next flush
+            self._dirty.update(h.symbol for h in dirty)
+            self._closed.extend(closed)
+            self._portfolio_dirty = True
+            return 0
+        for holding, record in zip(new, records):
+            holding.id = record.id
+        return len(dirty) + len(closed)
+
+    def push(self) -> bool:
+        """Publish the totals on the ``portfolio`` topic if they changed since the last push."""
+        if self._pushed:
+            return False
+        self._pushed = True
+        self.hub.publish("portfolio", self.summary(), key="summary")
+        return True
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(settings.VALUATION_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def _push_forever(self):
+        while True:
+            await asyncio.sleep(settings.PORTFOLIO_PUSH_INTERVAL)
+            self.push()
+
+    def start(self):
+        if self._tasks:
+            return
+        loop = asyncio.get_event_loop()
+        self._tasks = [loop.create_task(self._flush_forever()), loop.create_task(self._push_forever())]
+        self._watch_all()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        for key in list(self._wanted):
+            self._unwatch(key)
+        await self.flush()
+
+
+# Global valuation service instance
+valuation_service = ValuationService()
@@ -1,6 +1,11 @@
 from abc import ABC, abstractmethod
 from typing import Dict
 
+import numpy as np
+import pandas as pd
+
+from app.strategies.vectorized import BarPanel, SIGNAL_NAMES, to_records
+
 
 class BaseStrategy(ABC):
     """Abstract base class for trading strategies."""
@@ -12,3 +17,20 @@ class BaseStrategy(ABC):
     def generate_signal(self, symbol: str, data) -> Dict:
         """Generate a trading signal for a symbol."""
         raise NotImplementedError
+
+    def generate_signals(self, panel: BarPanel) -> np.ndarray:
+        """Generate the latest signal for every symbol in a panel.
+
+        Returns a ``SIGNAL_DTYPE`` record array in panel column order.
+        Strategies with a vectorized implementation override this; the
+        default falls back to one ``generate_signal`` call per symbol.
+        """
+        codes = {name: code for code, name in SIGNAL_NAMES.items()}
+        signal = np.zeros(len(panel.symbols), dtype=np.int8)
+        strength = np.zeros(len(panel.symbols), dtype=np.float32)
+        for i, symbol in enumerate(panel.symbols):
+            df = pd.DataFrame({"close": panel.close[:, i], "volume": panel.volume[:, i]})
+            result = self.generate_signal(symbol, df)
+            signal[i] = codes[result["signal"]]
+            strength[i] = result["strength"]
+        return to_records(signal, strength)
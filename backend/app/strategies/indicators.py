@@ -0,0 +1,210 @@
+"""Streaming technical indicators with constant-time updates.
+
+Each indicator keeps just enough running state (window contents, running
+sums, Welford moments) to fold in one new bar in O(1). The values match the
+pandas ``rolling`` calculations in ``calculate_indicators`` so strategies can
+switch between the full-frame and the streaming path freely.
+"""
+
+from collections import deque
+import math
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+
+NAN = float("nan")
+
+
+class RollingMean:
+    """Simple moving average over a fixed window using a running sum."""
+
+    __slots__ = ("window", "_values", "_sum", "_nonzero")
+
+    def __init__(self, window: int):
+        self.window = window
+        self._values: deque = deque()
+        self._sum = 0.0
+        # Exact count of non-zero values so an all-zero window reports 0.0
+        # instead of floating point residue from the running sum.
+        self._nonzero = 0
+
+    def update(self, value: float) -> float:
+        self._values.append(value)
+        self._sum += value
+        if value != 0:
+            self._nonzero += 1
+        if len(self._values) > self.window:
+            old = self._values.popleft()
+            self._sum -= old
+            if old != 0:
+                self._nonzero -= 1
+        return self.value
+
+    @property
+    def value(self) -> float:
+        if len(self._values) < self.window:
+            return NAN
+        if self._nonzero == 0:
+            return 0.0
+        return self._sum / self.window
+
+
+class RollingStd:
+    """Rolling mean and sample standard deviation using windowed Welford updates."""
+
+    __slots__ = ("window", "_values", "_mean", "_m2")
+
+    def __init__(self, window: int):
+        self.window = window
+        self._values: deque = deque()
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, value: float) -> float:
+        self._values.append(value)
+        n = len(self._values)
+        if n <= self.window:
+            delta = value - self._mean
+            self._mean += delta / n
+            self._m2 += delta * (value - self._mean)
+        else:
+            old = self._values.popleft()
+            old_mean = self._mean
+            self._mean += (value - old) / self.window
+            self._m2 += (value - old) * (value - self._mean + old - old_mean)
+            if self._m2 < 0.0:
+                self._m2 = 0.0
+        return self.value
+
+    @property
+    def mean(self) -> float:
+        if len(self._values) < self.window:
+            return NAN
+        return self._mean
+
+    @property
+    def value(self) -> float:
+        if len(self._values) < self.window or self.window < 2:
+            return NAN
+        return math.sqrt(self._m2 / (self.window - 1))
+
+
+class RollingRSI:
+    """RSI based on simple rolling averages of gains and losses.
+
+    Mirrors ``calculate_indicators``: the first bar has no previous close
+    and contributes a zero gain and loss to the window.
+    """
+
+    __slots__ = ("period", "_prev_close", "_gain", "_loss")
+
+    def __init__(self, period: int):
+        self.period = period
+        self._prev_close: Optional[float] = None
+        self._gain = RollingMean(period)
+        self._loss = RollingMean(period)
+
+    def update(self, close: float) -> float:
+        if self._prev_close is None:
+            delta = 0.0
+        else:
+            delta = close - self._prev_close
+        self._prev_close = close
+        self._gain.update(delta if delta > 0 else 0.0)
+        self._loss.update(-delta if delta < 0 else 0.0)
+        return self.value
+
+    @property
+    def value(self) -> float:
+        gain = self._gain.value
+        loss = self._loss.value
+        if math.isnan(gain) or math.isnan(loss):
+            return NAN
+        if loss == 0.0:
+            return 100.0 if gain > 0.0 else NAN
+        return 100.0 - 100.0 / (1.0 + gain / loss)
+
+
+class IndicatorEngine:
+    """Per-symbol streaming indicator state.
+
+    ``factory`` builds a fresh indicator set for a symbol. The set must expose
+    ``update(close, volume) -> Dict`` returning the indicator snapshot for the
+    bar and a ``warmup`` attribute with the number of trailing bars needed to
+    reproduce the full-history values for the latest two bars.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._states: Dict[str, Any] = {}
+        self._last_key: Dict[str, Any] = {}
+        # First index value of the last positionally indexed frame synced, per symbol
+        self._first_key: Dict[str, Any] = {}
+        self._latest: Dict[str, Dict[str, float]] = {}
+        self._prev: Dict[str, Dict[str, float]] = {}
+
+    def reset(self, symbol: Optional[str] = None):
+        """Drop state for one symbol, or for all symbols."""
+        if symbol is None:
+            self._states.clear()
+            self._last_key.clear()
+            self._first_key.clear()
+            self._latest.clear()
+            self._prev.clear()
+            return
+        for store in (self._states, self._last_key, self._first_key, self._latest, self._prev):
+            store.pop(symbol, None)
+
+    def update(self, symbol: str, close: float, volume: float, key: Any = None) -> Dict[str, float]:
+        """Fold a single new bar into the state for ``symbol``."""
+        state = self._states.get(symbol)
+        if state is None:
+            state = self._states[symbol] = self._factory()
+        snapshot = state.update(float(close), float(volume))
+        self._prev[symbol] = self._latest.get(symbol, {})
+        self._latest[symbol] = snapshot
+        self._last_key[symbol] = key
+        return snapshot
+
+    def snapshot(self, symbol: str) -> Tuple[Dict[str, float], Dict[str, float]]:
+        """Return the ``(latest, previous)`` indicator snapshots for ``symbol``."""
+        return self._latest.get(symbol, {}), self._prev.get(symbol, {})
+
+    def sync(self, symbol: str, df: pd.DataFrame) -> Tuple[Dict[str, float], Dict[str, float]]:
+        """Bring the state for ``symbol`` up to date with ``df``.
+
+        Only bars newer than the last one seen are folded in. Bars are
+        identified by the ``timestamp`` column when present, otherwise by the
+        index, which must be sorted ascending. If the frame does not extend the
+        known history (first call, rewritten or gapped data) the state is
+        rebuilt from the trailing ``warmup`` bars.
+
+        A default ``RangeIndex`` only numbers rows, so it identifies bars
+        only while the frame keeps its first row and grows. A fixed-length
+        window sliding over the feed keeps the same numbers for new bars and
+        is rebuilt on every call.
+        """
+        positional = "timestamp" not in df.columns and isinstance(df.index, pd.RangeIndex)
+        keys = pd.Index(df["timestamp"]) if "timestamp" in df.columns else df.index
+        start = None
+        last_key = self._last_key.get(symbol)
+        if symbol in self._states and last_key is not None and len(keys):
+            pos = int(keys.searchsorted(last_key, side="right"))
+            if pos > 0 and keys[pos - 1] == last_key:
+                start = pos
+            if positional and (keys[0] != self._first_key.get(symbol) or start == len(keys)):
+                start = None
+
+        if start is None:
+            self.reset(symbol)
+            state = self._states[symbol] = self._factory()
+            start = max(0, len(df) - state.warmup)
+
+        closes = df["close"].to_numpy()
+        volumes = df["volume"].to_numpy()
+        for i in range(start, len(df)):
+            self.update(symbol, closes[i], volumes[i], keys[i])
+        if positional and len(keys):
+            self._first_key[symbol] = keys[0]
+        return self.snapshot(symbol)
@@ -2,11 +2,61 @@ import pandas as pd
 import numpy as np
 from typing import Dict, List, Optional
 from app.strategies.base_strategy import BaseStrategy
+from app.strategies.indicators import IndicatorEngine, RollingMean, RollingRSI, RollingStd
+from app.strategies import vectorized as vec
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class MomentumIndicators:
+    """Streaming SMA, RSI and volume MA state for one symbol"""
+
+    def __init__(self, short_window: int, long_window: int, rsi_period: int, volume_window: int = 20):
+        self.sma_short = RollingMean(short_window)
+        self.sma_long = RollingMean(long_window)
+        self.rsi = RollingRSI(rsi_period)
+        self.volume_ma = RollingMean(volume_window)
+        # One extra bar so the previous bar's values are complete as well
+        self.warmup = max(short_window, long_window, rsi_period + 1, volume_window) + 1
+
+    def update(self, close: float, volume: float) -> Dict:
+        return {
+            "close": close,
+            "volume": volume,
+            "sma_short": self.sma_short.update(close),
+            "sma_long": self.sma_long.update(close),
+            "rsi": self.rsi.update(close),
+            "volume_ma": self.volume_ma.update(volume),
+        }
+
+
+class MeanReversionIndicators:
+    """Streaming Bollinger Band and RSI state for one symbol"""
+
+    def __init__(self, bb_period: int, bb_std: float, rsi_period: int):
+        self.bb_std = bb_std
+        self.bands = RollingStd(bb_period)
+        self.rsi = RollingRSI(rsi_period)
+        self.warmup = max(bb_period, rsi_period + 1) + 1
+
+    def update(self, close: float, volume: float) -> Dict:
+        std = self.bands.update(close)
+        middle = self.bands.mean
+        upper = middle + std * self.bb_std
+        lower = middle - std * self.bb_std
+        width = upper - lower
+        return {
+            "close": close,
+            "volume": volume,
+            "bb_middle": middle,
+            "bb_upper": upper,
+            "bb_lower": lower,
+            "rsi": self.rsi.update(close),
+            "bb_position": (close - lower) / width if width != 0 else np.nan,
+        }
+
+
 class MomentumStrategy(BaseStrategy):
     """Simple momentum strategy using moving averages"""
 
@@ -24,6 +74,10 @@ class MomentumStrategy(BaseStrategy):
         self.rsi_period = rsi_period
         self.rsi_oversold = rsi_oversold
         self.rsi_overbought = rsi_overbought
+        self.engine = IndicatorEngine(
+            lambda: MomentumIndicators(short_window, long_window, rsi_period)
+        )
+        self.warmup = max(short_window, long_window, rsi_period + 1, 20) + 1
 
     def calculate_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calculate technical indicators"""
@@ -48,10 +102,19 @@ class MomentumStrategy(BaseStrategy):
         if len(df) < self.long_window:
             return {"signal": "HOLD", "strength": 0.0, "reason": "Insufficient data"}
 
-        df = self.calculate_indicators(df)
-        latest = df.iloc[-1]
-        prev = df.iloc[-2]
+        latest, prev = self.engine.sync(symbol, df)
+        return self.evaluate(symbol, latest, prev)
+
+    def on_bar(self, symbol: str, close: float, volume: float) -> Dict:
+        """Fold one new bar into the streaming state and generate a signal"""
+        self.engine.update(symbol, close, volume)
+        latest, prev = self.engine.snapshot(symbol)
+        if not prev:
+            return {"signal": "HOLD", "strength": 0.0, "reason": "Insufficient data"}
+        return self.evaluate(symbol, latest, prev)
 
+    def evaluate(self, symbol: str, latest: Dict, prev: Dict) -> Dict:
+        """Generate a signal from the latest and previous indicator snapshots"""
         signal = "HOLD"
         strength = 0.0
         reason = ""
@@ -94,10 +157,64 @@ class MomentumStrategy(BaseStrategy):
                 "sma_short": latest["sma_short"],
                 "sma_long": latest["sma_long"],
                 "rsi": latest["rsi"],
-                "volume_ratio": latest["volume"] / latest["volume_ma"],
+                "volume_ratio": (
+                    latest["volume"] / latest["volume_ma"] if latest["volume_ma"] else np.nan
+                ),
             },
         }
 
+    def signal_matrix(
+        self, close: np.ndarray, volume: np.ndarray, cache: Optional[vec.IndicatorCache] = None
+    ):
+        """Vectorized signals for every bar of a (time x symbol) panel.
+
+        Returns ``(signal, strength)`` matrices with the same shape as
+        ``close``; signal codes are ``vectorized.BUY``/``SELL``/``HOLD``.
+        Indicator matrices are reused from ``cache`` when given.
+        """
+        sma_short = vec.cached(cache, ("sma", self.short_window), vec.rolling_mean, close, self.short_window)
+        sma_long = vec.cached(cache, ("sma", self.long_window), vec.rolling_mean, close, self.long_window)
+        rsi = vec.cached(cache, ("rsi", self.rsi_period), vec.rsi, close, self.rsi_period)
+        volume_ma = vec.cached(cache, ("volume_ma", 20), vec.rolling_mean, volume, 20)
+        return self._signals_from(close, volume, sma_short, sma_long, rsi, volume_ma)
+
+    def _signals_from(self, close, volume, sma_short, sma_long, rsi, volume_ma):
+        prev_short = vec.previous(sma_short)
+        prev_long = vec.previous(sma_long)
+        rsi_range = self.rsi_overbought - self.rsi_oversold
+
+        buy = (
+            (sma_short > sma_long)
+            & (prev_short <= prev_long)
+            & (rsi < self.rsi_overbought)
+            & (volume > volume_ma * 1.2)
+        )
+        sell = (
+            ~buy
+            & (sma_short < sma_long)
+            & (prev_short >= prev_long)
+            & (rsi > self.rsi_oversold)
+        )
+
+        signal = np.zeros(close.shape, dtype=np.int8)
+        signal[buy] = vec.BUY
+        signal[sell] = vec.SELL
+        strength = np.zeros(close.shape, dtype=np.float32)
+        strength[buy] = np.minimum(0.8, (rsi[buy] - self.rsi_oversold) / rsi_range)
+        strength[sell] = np.minimum(0.8, (self.rsi_overbought - rsi[sell]) / rsi_range)
+        return signal, strength
+
+    def generate_signals(self, panel: vec.BarPanel) -> np.ndarray:
+        """Latest signal for every symbol in the panel, computed at once"""
+        if len(panel) < self.long_window:
+            return vec.to_records(
+                np.zeros(len(panel.symbols), dtype=np.int8),
+                np.zeros(len(panel.symbols), dtype=np.float32),
+            )
+        tail = panel.tail(self.warmup)
+        signal, strength = self.signal_matrix(tail.close, tail.volume)
+        return vec.to_records(signal[-1], strength[-1])
+
 
 class MeanReversionStrategy(BaseStrategy):
     """Mean reversion strategy using Bollinger Bands"""
@@ -107,6 +224,10 @@ class MeanReversionStrategy(BaseStrategy):
         self.bb_period = bb_period
         self.bb_std = bb_std
         self.rsi_period = rsi_period
+        self.engine = IndicatorEngine(
+            lambda: MeanReversionIndicators(bb_period, bb_std, rsi_period)
+        )
+        self.warmup = max(bb_period, rsi_period + 1) + 1
 
     def calculate_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calculate Bollinger Bands and RSI"""
@@ -133,9 +254,16 @@ class MeanReversionStrategy(BaseStrategy):
         if len(df) < self.bb_period:
             return {"signal": "HOLD", "strength": 0.0, "reason": "Insufficient data"}
 
-        df = self.calculate_indicators(df)
-        latest = df.iloc[-1]
+        latest, _ = self.engine.sync(symbol, df)
+        return self.evaluate(symbol, latest)
+
+    def on_bar(self, symbol: str, close: float, volume: float) -> Dict:
+        """Fold one new bar into the streaming state and generate a signal"""
+        latest = self.engine.update(symbol, close, volume)
+        return self.evaluate(symbol, latest)
 
+    def evaluate(self, symbol: str, latest: Dict) -> Dict:
+        """Generate a signal from the latest indicator snapshot"""
         signal = "HOLD"
         strength = 0.0
         reason = ""
@@ -179,3 +307,45 @@ class MeanReversionStrategy(BaseStrategy):
                 "bb_lower": latest["bb_lower"],
             },
         }
+
+    def signal_matrix(
+        self, close: np.ndarray, volume: np.ndarray, cache: Optional[vec.IndicatorCache] = None
+    ):
+        """Vectorized signals for every bar of a (time x symbol) panel.
+
+        Returns ``(signal, strength)`` matrices with the same shape as
+        ``close``; signal codes are ``vectorized.BUY``/``SELL``/``HOLD``.
+        Indicator matrices are reused from ``cache`` when given.
+        """
+        middle = vec.cached(cache, ("sma", self.bb_period), vec.rolling_mean, close, self.bb_period)
+        std = vec.cached(cache, ("std", self.bb_period), vec.rolling_std, close, self.bb_period)
+        rsi = vec.cached(cache, ("rsi", self.rsi_period), vec.rsi, close, self.rsi_period)
+        return self._signals_from(close, middle, std, rsi)
+
+    def _signals_from(self, close, middle, std, rsi):
+        upper = middle + std * self.bb_std
+        lower = middle - std * self.bb_std
+        with np.errstate(divide="ignore", invalid="ignore"):
+            position = (close - lower) / (upper - lower)
+
+        buy = (close <= lower) & (rsi <= 30) & (position <= 0.1)
+        sell = ~buy & (close >= upper) & (rsi >= 70) & (position >= 0.9)
+
+        signal = np.zeros(close.shape, dtype=np.int8)
+        signal[buy] = vec.BUY
+        signal[sell] = vec.SELL
+        strength = np.zeros(close.shape, dtype=np.float32)
+        strength[buy] = np.minimum(0.9, (30 - rsi[buy]) / 30 + (0.1 - position[buy]))
+        strength[sell] = np.minimum(0.9, (rsi[sell] - 70) / 30 + (position[sell] - 0.9))
+        return signal, strength
+
+    def generate_signals(self, panel: vec.BarPanel) -> np.ndarray:
+        """Latest signal for every symbol in the panel, computed at once"""
+        if len(panel) < self.bb_period:
+            return vec.to_records(
+                np.zeros(len(panel.symbols), dtype=np.int8),
+                np.zeros(len(panel.symbols), dtype=np.float32),
+            )
+        tail = panel.tail(self.warmup)
+        signal, strength = self.signal_matrix(tail.close, tail.volume)
+        return vec.to_records(signal[-1], strength[-1])
@@ -0,0 +1,37 @@
+"""Build strategy instances from stored ``Strategy`` records."""
+
+import json
+from typing import Dict, Optional, Type
+
+from app.strategies.base_strategy import BaseStrategy
+from app.strategies.momentum_strategy import MeanReversionStrategy, MomentumStrategy
+
+
+STRATEGY_TYPES: Dict[str, Type[BaseStrategy]] = {
+    "momentum": MomentumStrategy,
+    "mean_reversion": MeanReversionStrategy,
+}
+
+# Parameters that configure how a strategy is run live rather than the strategy itself
+RUNTIME_PARAMETERS = ("symbols", "exchange", "timeframe", "quantity")
+
+
+def strategy_type(name: str, parameters: Optional[Dict] = None) -> str:
+    """Resolve the strategy type from an explicit ``type`` parameter or the name."""
+    if parameters and parameters.get("type") in STRATEGY_TYPES:
+        return parameters["type"]
+    lowered = name.lower()
+    if "momentum" in lowered:
+        return "momentum"
+    if "reversion" in lowered or "bollinger" in lowered:
+        return "mean_reversion"
+    raise ValueError(f"Unknown strategy type for '{name}'")
+
+
+def build_strategy(name: str, parameters: Optional[str] = None) -> BaseStrategy:
+    """Instantiate a strategy from its name and JSON parameter string."""
+    params = json.loads(parameters) if parameters else {}
+    cls = STRATEGY_TYPES[strategy_type(name, params)]
+    for key in ("type",) + RUNTIME_PARAMETERS:
+        params.pop(key, None)
+    return cls(**params)
@@ -0,0 +1,192 @@
+"""Vectorized indicator kernels over (time x symbol) matrices.
+
+All functions operate along axis 0 so one call covers every symbol in a
+panel. Results match the pandas ``rolling`` calculations used by the
+strategies' ``calculate_indicators``: NaN until a window holds
+``min_periods`` (by default ``window``) valid values, recovering once a gap
+has left the window.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+HOLD = 0
+BUY = 1
+SELL = -1
+
+SIGNAL_NAMES = {HOLD: "HOLD", BUY: "BUY", SELL: "SELL"}
+
+# One record per symbol, in panel column order
+SIGNAL_DTYPE = np.dtype([("signal", "i1"), ("strength", "f4")])
+
+
+@dataclass
+class BarPanel:
+    """Aligned close/volume matrices with one column per symbol."""
+
+    symbols: List[str]
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __post_init__(self):
+        self.close = np.asarray(self.close, dtype=np.float64)
+        self.volume = np.asarray(self.volume, dtype=np.float64)
+        if self.close.ndim != 2 or self.close.shape != self.volume.shape:
+            raise ValueError("close and volume must be 2-D matrices of the same shape")
+        if self.close.shape[1] != len(self.symbols):
+            raise ValueError("Panel has one column per symbol")
+
+    @classmethod
+    def from_frames(cls, frames: Dict[str, pd.DataFrame]) -> "BarPanel":
+        """Align per-symbol OHLCV frames on their index into a panel."""
+        symbols = list(frames)
+        close = pd.concat([frames[s]["close"] for s in symbols], axis=1, keys=symbols)
+        volume = pd.concat([frames[s]["volume"] for s in symbols], axis=1, keys=symbols)
+        return cls(symbols, close.to_numpy(), volume.to_numpy())
+
+    def tail(self, rows: int) -> "BarPanel":
+        return BarPanel(self.symbols, self.close[-rows:], self.volume[-rows:])
+
+    def __len__(self) -> int:
+        return self.close.shape[0]
+
+
+def _windowed(x: np.ndarray, window: int):
+    """Sums of the non-NaN values over the trailing ``window`` rows, and their counts.
+
+    NaNs are summed as zero and left out of the count, so a gap only
+    affects the windows that contain it.
+    """
+    valid = ~np.isnan(x)
+    sums = np.cumsum(np.where(valid, x, 0.0), axis=0)
+    counts = np.cumsum(valid, axis=0, dtype=np.float64)
+    if window > 0:
+        sums[window:] -= sums[:-window].copy()
+        counts[window:] -= counts[:-window].copy()
+    return sums, counts
+
+
+def _windowed_sum(x: np.ndarray, window: int, min_periods: Optional[int] = None) -> np.ndarray:
+    """Sum over the trailing ``window`` rows, NaN where fewer than
+    ``min_periods`` (default ``window``) of them are valid."""
+    if window <= 0:
+        return np.full(x.shape, np.nan)
+    sums, counts = _windowed(x, window)
+    sums[counts < (window if min_periods is None else min_periods)] = np.nan
+    return sums
+
+
+def rolling_mean(x: np.ndarray, window: int, min_periods: Optional[int] = None) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float64)
+    if x.shape[0] == 0:
+        return x.copy()
+    if window <= 0:
+        return np.full(x.shape, np.nan)
+    # Shift by the first row to keep cumulative sums small on long histories
+    ref = np.nan_to_num(x[0])
+    sums, counts = _windowed(x - ref, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = sums / counts + ref
+    out[counts < (window if min_periods is None else min_periods)] = np.nan
+    return out
+
+
+def rolling_std(x: np.ndarray, window: int, min_periods: Optional[int] = None) -> np.ndarray:
+    """Rolling sample standard deviation (ddof=1)."""
+    x = np.asarray(x, dtype=np.float64)
+    if x.shape[0] == 0 or window < 2:
+        return np.full(x.shape, np.nan)
+    y = x - np.nan_to_num(x[0])
+    s1, counts = _windowed(y, window)
+    s2, _ = _windowed(y * y, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = (s2 - s1 * s1 / counts) / (counts - 1)
+    out = np.sqrt(np.maximum(var, 0.0))
+    out[counts < max(2, window if min_periods is None else min_periods)] = np.nan
+    return out
+
+
+def rsi(close: np.ndarray, period: int) -> np.ndarray:
+    """RSI from simple rolling averages of gains and losses.
+
+    As in ``calculate_indicators`` the first row has no previous close and
+    contributes a zero gain and loss.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    delta = np.zeros_like(close)
+    delta[1:] = close[1:] - close[:-1]
+    gains = np.where(delta > 0, delta, 0.0)
+    losses = np.where(delta < 0, -delta, 0.0)
+
+    gain = _windowed_sum(gains, period) / period
+    loss = _windowed_sum(losses, period) / period
+    # Windows without any move are exactly zero, not cumsum residue
+    gain[_windowed_sum((gains > 0).astype(np.float64), period) == 0] = 0.0
+    loss[_windowed_sum((losses > 0).astype(np.float64), period) == 0] = 0.0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 100.0 - 100.0 / (1.0 + gain / loss)
+
+
+def previous(x: np.ndarray) -> np.ndarray:
+    """Values shifted down one row, NaN in the first row."""
+    out = np.empty_like(x)
+    out[0] = np.nan
+    out[1:] = x[:-1]
+    return out
+
+
+class IndicatorCache:
+    """Small LRU of indicator matrices computed from one fixed panel.
+
+    Lets evaluations that share a window (e.g. parameter sweeps) reuse the
+    rolling computation. Keys must identify the input series and window;
+    the cache must not be shared across different panels. Bounded by entry
+    count and, with ``max_bytes``, by the total size of the matrices held; a
+    matrix larger than ``max_bytes`` on its own is returned but not kept.
+    """
+
+    def __init__(self, max_items: int = 32, max_bytes: Optional[int] = None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = compute()
+        if self.max_bytes is not None and value.nbytes > self.max_bytes:
+            return value
+        self._items[key] = value
+        self.nbytes += value.nbytes
+        while len(self._items) > self.max_items or (self.max_bytes is not None and self.nbytes > self.max_bytes):
+            _, evicted = self._items.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        return value
+
+
+def cached(cache: Optional[IndicatorCache], key: Hashable, fn: Callable, *args) -> np.ndarray:
+    """Compute ``fn(*args)`` through ``cache`` when one is given."""
+    if cache is None:
+        return fn(*args)
+    return cache.get(key, lambda: fn(*args))
+
+
+def to_records(signal: np.ndarray, strength: np.ndarray) -> np.ndarray:
+    """Pack per-symbol signal codes and strengths into a ``SIGNAL_DTYPE`` array."""
+    out = np.empty(signal.shape, dtype=SIGNAL_DTYPE)
+    out["signal"] = signal
+    out["strength"] = strength
+    return out
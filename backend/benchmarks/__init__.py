@@ -0,0 +1,23 @@
+"""Performance benchmarks with stored baselines.
+
+Run from ``backend/``::
+
+    python -m benchmarks                 # run everything, compare with baselines.json
+    python -m benchmarks -k strategies   # only cases whose name contains "strategies"
+    python -m benchmarks --update        # record the results as the new baselines
+
+Every case runs against synthetic data generated from a fixed seed (see
+``benchmarks.data``), so runs are comparable from one commit to the next
+on the same machine. Each case reports its best, median and p95 per-call
+time. A case regresses when its best time is more than its threshold
+above the recorded best. The threshold is ``default_threshold`` in the
+baseline file unless the case sets its own. The best time is used because
+noise from other work on the machine only ever adds time. Any regression
+makes the run exit with status 1. Baselines depend on the machine, so
+record them on the machine that checks them. On a quiet dedicated machine,
+tighten the thresholds.
+
+Endpoint cases use a SQLite file by default. Set ``BENCH_DATABASE_URL``
+to an async SQLAlchemy URL to use a scratch Postgres database instead.
+Its tables are dropped and recreated.
+"""
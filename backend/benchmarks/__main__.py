@@ -0,0 +1,47 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+# Keep the benchmarks off the real bar store and Redis; must happen before the app is imported
+os.environ["BAR_STORE_PATH"] = tempfile.mkdtemp(prefix="bench-bars-")
+os.environ["CACHE_ENABLED"] = "false"
+
+from benchmarks import bench_broadcast, bench_endpoints, bench_strategies  # noqa: E402
+from benchmarks.runner import BASELINE_PATH, Suite, compare, load_baselines, save_baselines  # noqa: E402
+
+MODULES = (bench_strategies, bench_endpoints, bench_broadcast)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Run the performance benchmarks.")
+    parser.add_argument("-k", "--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, help="override every case's repetition count")
+    parser.add_argument("--baselines", default=BASELINE_PATH, help="baseline file (default: %(default)s)")
+    parser.add_argument("--update", action="store_true", help="store the results as the new baselines")
+    args = parser.parse_args()
+
+    suite = Suite(args.filter, args.repeat)
+    for module in MODULES:
+        print(module.__name__)
+        asyncio.run(module.main(suite))
+    if not suite.results:
+        print("No benchmark matched")
+        return 1
+
+    if args.update:
+        save_baselines(suite.results, args.baselines)
+        print(f"Recorded {len(suite.results)} baselines in {args.baselines}")
+        return 0
+
+    print("Against baselines")
+    regressions = compare(suite.results, load_baselines(args.baselines))
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
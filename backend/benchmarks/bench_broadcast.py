@@ -0,0 +1,69 @@
+"""WebSocket fan-out: time from ``Broadcaster.publish`` until every client has been sent the message.
+
+Clients are in-process stand-ins whose ``send_text`` returns immediately,
+so this measures the broadcaster's own queueing and writer scheduling.
+"""
+
+import asyncio
+import time
+
+from app.services.broadcaster import Broadcaster
+
+from benchmarks.runner import Suite
+
+CLIENT_COUNTS = (10, 100, 1000, 5000)
+TOPIC = "quotes:US:SYM0000"
+QUOTE = {"symbol": "SYM0000", "bid": 100.01, "ask": 100.03, "last": 100.02, "volume": 123456}
+
+
+class _Socket:
+    def __init__(self, delivered):
+        self.delivered = delivered
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload):
+        self.delivered()
+
+    async def send_bytes(self, payload):
+        self.delivered()
+
+    async def close(self):
+        pass
+
+
+async def main(suite: Suite):
+    for clients in CLIENT_COUNTS:
+        name = f"broadcast.fanout[clients={clients}]"
+        if not suite.wants(name):
+            continue
+        hub = Broadcaster(queue_size=256)
+        remaining = 0
+        done = asyncio.Event()
+
+        def delivered():
+            nonlocal remaining
+            remaining -= 1
+            if remaining == 0:
+                done.set()
+
+        sockets = [_Socket(delivered) for _ in range(clients)]
+        for socket in sockets:
+            await hub.connect(socket, [TOPIC])
+        await asyncio.sleep(0)
+
+        samples = []
+        for i in range(suite.repeat or 30):
+            remaining = clients
+            done.clear()
+            started = time.perf_counter()
+            hub.publish(TOPIC, QUOTE, key="SYM0000")
+            await done.wait()
+            samples.append(time.perf_counter() - started)
+        suite.record(name, samples[2:], ops=clients)
+
+        writers = [client.writer for client in hub._clients.values()]
+        for socket in sockets:
+            hub.disconnect(socket)
+        await asyncio.gather(*writers, return_exceptions=True)
@@ -0,0 +1,118 @@
+"""HTTP throughput of ``/market-data/{symbol}`` and ``/portfolio/*``.
+
+Requests go straight into an app with the API routes mounted as in
+``app.main`` (without the static frontend, which needs a build), with no
+server or HTTP client in between, so the timings cover routing,
+dependencies, queries and encoding. The response cache is disabled, so
+every request does the full work. The database is a SQLite file unless
+``BENCH_DATABASE_URL`` names a scratch database.
+"""
+
+import asyncio
+import os
+import tempfile
+
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.api import api_router
+from app.core.config import settings
+from app.core.database import get_async_db
+from app.services.bar_store import bar_store
+from app.services.cache import response_cache
+from app.services.valuation import valuation_service
+
+from benchmarks import data
+from benchmarks.runner import Suite
+
+DB_SYMBOLS = 20
+DB_BARS = 5000  # hourly bars per symbol in the database
+STORE_SYMBOL = "STORE0000"
+STORE_BARS = 100000  # 1 minute bars in the bar store
+POSITIONS = 200
+TRADES = 20000
+CONCURRENCY = 20
+PREFIX = settings.API_V1_STR
+
+app = FastAPI()
+app.include_router(api_router, prefix=PREFIX)
+
+
+async def get(path: str, query: str = "") -> bytes:
+    """Serve a GET request through the ASGI app and return the body; fails on a non-200 status."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query.encode(), "headers": [(b"host", b"bench")],
+        "server": ("bench", 80), "client": ("127.0.0.1", 50000),
+    }
+    status, body = None, []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    if status != 200:
+        raise RuntimeError(f"GET {path}?{query} returned {status}: {b''.join(body)[:200]}")
+    return b"".join(body)
+
+
+async def main(suite: Suite):
+    if not any(suite.wants(f"{group}.") for group in ("market_data", "portfolio")):
+        return
+    directory = tempfile.mkdtemp(prefix="bench-db-")
+    url = os.getenv("BENCH_DATABASE_URL") or f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+    engine = create_async_engine(url)
+    session_factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    print(f"  populating {engine.url.render_as_string(hide_password=True)} ...")
+    db_frames = data.universe(DB_SYMBOLS, DB_BARS, freq="1h")
+    await data.populate(engine, session_factory, db_frames, POSITIONS, TRADES)
+    bar_store.append_frame(STORE_SYMBOL, "1m", data.random_walk(STORE_BARS))
+
+    async def override():
+        async with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db] = override
+    response_cache.enabled = False
+    valuation_service.session_factory = session_factory
+    valuation_service.loaded = False
+
+    symbol = next(iter(db_frames))
+    cases = [
+        ("market_data.db[limit=100]", f"/market-data/{symbol}", "timeframe=1h&limit=100"),
+        ("market_data.db[limit=1000]", f"/market-data/{symbol}", "timeframe=1h&limit=1000"),
+        ("market_data.db.columns[limit=1000]", f"/market-data/{symbol}", "timeframe=1h&limit=1000&format=columns"),
+        ("market_data.store[limit=1000]", f"/market-data/{STORE_SYMBOL}", "timeframe=1m&limit=1000"),
+        ("market_data.store[limit=100000]", f"/market-data/{STORE_SYMBOL}", "timeframe=1m&limit=100000"),
+        ("market_data.store.columns[limit=100000]", f"/market-data/{STORE_SYMBOL}",
+         "timeframe=1m&limit=100000&format=columns"),
+        ("market_data.resampled[timeframe=1h,limit=1000]", f"/market-data/{STORE_SYMBOL}",
+         "timeframe=1h&limit=1000&exchange=US"),
+        ("portfolio.summary", "/portfolio/summary", ""),
+        (f"portfolio.positions[positions={POSITIONS}]", "/portfolio/positions", ""),
+        ("portfolio.trades[limit=50]", "/portfolio/trades", "limit=50"),
+        ("portfolio.trades[limit=1000]", "/portfolio/trades", "limit=1000"),
+    ]
+    try:
+        for name, path, query in cases:
+            await suite.measure(name, lambda: get(PREFIX + path, query))
+
+        # Throughput with requests competing for the connection pool
+        name = f"market_data.db[limit=100,concurrency={CONCURRENCY}]"
+        path = f"{PREFIX}/market-data/{symbol}"
+        await suite.measure(
+            name,
+            lambda: asyncio.gather(*(get(path, "timeframe=1h&limit=100") for _ in range(CONCURRENCY))),
+            ops=CONCURRENCY,
+        )
+    finally:
+        await engine.dispose()
@@ -0,0 +1,44 @@
+"""Signal generation: ``generate_signal`` over history lengths and symbol counts.
+
+``cold`` is the first call for each symbol, which builds the indicator
+state from the history. ``next_bar`` is the live case: the same frames
+grown by one bar, which only folds in the new bar.
+"""
+
+from app.strategies.momentum_strategy import MeanReversionStrategy, MomentumStrategy
+
+from benchmarks import data
+from benchmarks.runner import Suite
+
+STRATEGIES = {"momentum": MomentumStrategy, "mean_reversion": MeanReversionStrategy}
+HISTORY_LENGTHS = (100, 1000, 10000)
+SYMBOL_COUNTS = (1, 10, 100)
+# Bars the frames grow by across the next_bar repetitions
+EXTRA_BARS = 4096
+
+
+async def main(suite: Suite):
+    for symbol_count in SYMBOL_COUNTS:
+        frames = data.universe(symbol_count, max(HISTORY_LENGTHS) + EXTRA_BARS)
+        for length in HISTORY_LENGTHS:
+            for kind, cls in STRATEGIES.items():
+                name = f"strategies.{kind}.generate_signal[history={length},symbols={symbol_count}]"
+
+                def cold():
+                    strategy = cls()
+                    for symbol, df in frames.items():
+                        strategy.generate_signal(symbol, df.iloc[:length])
+
+                await suite.measure(f"{name}.cold", cold, ops=symbol_count)
+
+                strategy = cls()
+                for symbol, df in frames.items():
+                    strategy.generate_signal(symbol, df.iloc[:length])
+                grown = iter(range(length + 1, length + EXTRA_BARS + 1))
+
+                def next_bar():
+                    end = next(grown)
+                    for symbol, df in frames.items():
+                        strategy.generate_signal(symbol, df.iloc[:end])
+
+                await suite.measure(f"{name}.next_bar", next_bar, ops=symbol_count, calls=EXTRA_BARS)
@@ -0,0 +1,87 @@
+"""Seeded synthetic market data, portfolios and trades."""
+
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from app.models.trading import Base, MarketData, Portfolio, Position, Trade
+
+SEED = 20240102
+START = datetime(2024, 1, 2, 14, 30)
+
+
+def symbols(count: int) -> List[str]:
+    return [f"SYM{i:04d}" for i in range(count)]
+
+
+def random_walk(length: int, seed: int = SEED, start: datetime = START, freq: str = "1min") -> pd.DataFrame:
+    """OHLCV bars following a geometric random walk, indexed by bar start time."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, length)))
+    open_ = np.concatenate(([100.0], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.0005, length)) * close
+    return pd.DataFrame(
+        {
+            "open": open_,
+            "high": np.maximum(open_, close) + spread,
+            "low": np.minimum(open_, close) - spread,
+            "close": close,
+            "volume": rng.integers(100, 10000, length).astype(np.float64),
+        },
+        index=pd.date_range(start, periods=length, freq=freq, name="timestamp"),
+    )
+
+
+def universe(count: int, length: int, freq: str = "1min") -> Dict[str, pd.DataFrame]:
+    """A random walk per symbol, each from its own seed."""
+    return {symbol: random_walk(length, SEED + i, freq=freq) for i, symbol in enumerate(symbols(count))}
+
+
+async def populate(engine, session_factory, bar_symbols: Dict[str, pd.DataFrame], positions: int, trades: int):
+    """Recreate the schema and fill it with ``bar_symbols``' bars, a portfolio, positions and trades."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    rng = np.random.default_rng(SEED)
+    async with session_factory() as db:
+        for symbol, df in bar_symbols.items():
+            await db.execute(
+                MarketData.__table__.insert(),
+                [
+                    {
+                        "symbol": symbol, "exchange": "US", "timeframe": "1h", "timestamp": timestamp,
+                        "open_price": o, "high_price": h, "low_price": l, "close_price": c, "volume": int(v),
+                    }
+                    for timestamp, o, h, l, c, v in zip(
+                        df.index.to_pydatetime(), df.open.tolist(), df.high.tolist(),
+                        df.low.tolist(), df.close.tolist(), df.volume.tolist(),
+                    )
+                ],
+            )
+
+        portfolio = Portfolio(name="Main Portfolio", cash_balance=1_000_000.0)
+        db.add(portfolio)
+        await db.flush()
+        held = symbols(positions)
+        prices = 50 + rng.random(positions) * 100
+        db.add_all(
+            Position(portfolio_id=portfolio.id, symbol=symbol, exchange="US", quantity=100.0,
+                     avg_price=float(price), current_price=float(price) * 1.01)
+            for symbol, price in zip(held, prices)
+        )
+        await db.execute(
+            Trade.__table__.insert(),
+            [
+                {
+                    "portfolio_id": portfolio.id, "symbol": held[i % positions] if positions else "SYM0000",
+                    "exchange": "US", "side": "BUY" if i % 2 else "SELL", "quantity": 10.0,
+                    "price": float(50 + i % 100), "commission": 1.0, "strategy": "momentum",
+                    "signal_strength": 0.5, "executed_at": START + timedelta(seconds=i),
+                }
+                for i in range(trades)
+            ],
+        )
+        await db.commit()
@@ -0,0 +1,135 @@
+"""Timing, result collection and baseline comparison."""
+
+import gc
+import inspect
+import json
+import math
+import os
+import platform
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_THRESHOLD = 0.5
+# Shortest batch of calls timed as one sample, in seconds
+MIN_SAMPLE = 0.01
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Suite:
+    """Collects timings for named cases, skipping those the filter excludes."""
+
+    def __init__(self, pattern: str = "", repeat: Optional[int] = None):
+        self.pattern = pattern
+        self.repeat = repeat
+        self.results: Dict[str, Dict] = {}
+
+    def wants(self, name: str) -> bool:
+        return self.pattern in name
+
+    def _record(self, name: str, samples: List[float], ops: int):
+        median = statistics.median(samples)
+        self.results[name] = {
+            "best_ms": min(samples) * 1000,
+            "median_ms": median * 1000,
+            "p95_ms": _percentile(samples, 0.95) * 1000,
+            "ops_per_s": ops / median if median else None,
+            "samples": len(samples),
+        }
+        result = self.results[name]
+        print(f"  {name:<76} best {result['best_ms']:>10.3f} ms  median {result['median_ms']:>10.3f} ms  "
+              f"p95 {result['p95_ms']:>10.3f} ms")
+
+    async def measure(self, name: str, fn: Callable[[], Any], repeat: int = 15, ops: int = 1,
+                      warmup: int = 2, calls: Optional[int] = None):
+        """Time ``fn()``, awaiting what it returns if that is awaitable.
+
+        Calls are timed in batches long enough (``MIN_SAMPLE``) to rise above
+        timer and scheduling noise; each batch gives one per-call sample.
+        ``ops`` is the number of operations one call performs; ``calls`` caps
+        the total number of calls for cases whose calls use up their data.
+        """
+        if not self.wants(name):
+            return
+
+        async def batch(number: int) -> float:
+            gc.disable()
+            try:
+                started = time.perf_counter()
+                for _ in range(number):
+                    result = fn()
+                    if inspect.isawaitable(result):
+                        await result
+                return time.perf_counter() - started
+            finally:
+                gc.enable()
+
+        budget = calls or math.inf
+        repeat = self.repeat or repeat
+        await batch(warmup)
+        budget -= warmup
+        number = 1
+        while True:
+            elapsed = await batch(number)
+            budget -= number
+            if elapsed >= MIN_SAMPLE or number * 2 * (repeat + 1) > budget:
+                break
+            number *= 2
+        self._record(name, [await batch(number) / number for _ in range(repeat)], ops)
+
+    def record(self, name: str, samples: List[float], ops: int = 1):
+        """Add a case timed by the caller (samples in seconds)."""
+        if self.wants(name) and samples:
+            self._record(name, samples, ops)
+
+
+def load_baselines(path: str = BASELINE_PATH) -> Dict:
+    if not os.path.exists(path):
+        return {"default_threshold": DEFAULT_THRESHOLD, "results": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(results: Dict[str, Dict], path: str = BASELINE_PATH) -> Dict:
+    """Record ``results`` as the baselines, keeping per-case thresholds and other cases."""
+    baselines = load_baselines(path)
+    stored = baselines.setdefault("results", {})
+    for name, result in results.items():
+        entry = {key: round(result[key], 4) for key in ("best_ms", "median_ms", "p95_ms")}
+        if "threshold" in stored.get(name, {}):
+            entry["threshold"] = stored[name]["threshold"]
+        stored[name] = entry
+    baselines["machine"] = f"{platform.machine()} {platform.processor() or platform.system()}, Python {platform.python_version()}"
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return baselines
+
+
+def compare(results: Dict[str, Dict], baselines: Dict) -> List[str]:
+    """Print each case against its baseline; returns the names of the cases that regressed."""
+    default = baselines.get("default_threshold", DEFAULT_THRESHOLD)
+    stored = baselines.get("results", {})
+    regressions = []
+    for name, result in results.items():
+        baseline = stored.get(name)
+        if baseline is None:
+            print(f"  {name:<76} new")
+            continue
+        threshold = baseline.get("threshold", default)
+        change = result["best_ms"] / baseline["best_ms"] - 1
+        if change > threshold:
+            verdict = f"REGRESSION (limit +{threshold:.0%})"
+            regressions.append(name)
+        elif change < -threshold:
+            verdict = "faster"
+        else:
+            verdict = "ok"
+        print(f"  {name:<76} {change:>+8.1%}  {verdict}")
+    return regressions
@@ -0,0 +1,101 @@
+"""Initial schema
+
+Revision ID: 0000
+Revises:
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0000"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "portfolios",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String()),
+        sa.Column("total_value", sa.Float()),
+        sa.Column("cash_balance", sa.Float()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+    op.create_index("ix_portfolios_id", "portfolios", ["id"])
+
+    op.create_table(
+        "positions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("portfolio_id", sa.Integer(), sa.ForeignKey("portfolios.id")),
+        sa.Column("symbol", sa.String()),
+        sa.Column("exchange", sa.String()),
+        sa.Column("quantity", sa.Float()),
+        sa.Column("avg_price", sa.Float()),
+        sa.Column("current_price", sa.Float()),
+        sa.Column("market_value", sa.Float()),
+        sa.Column("unrealized_pnl", sa.Float()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+    op.create_index("ix_positions_id", "positions", ["id"])
+    op.create_index("ix_positions_symbol", "positions", ["symbol"])
+
+    op.create_table(
+        "trades",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("portfolio_id", sa.Integer(), sa.ForeignKey("portfolios.id")),
+        sa.Column("symbol", sa.String()),
+        sa.Column("exchange", sa.String()),
+        sa.Column("side", sa.String()),
+        sa.Column("quantity", sa.Float()),
+        sa.Column("price", sa.Float()),
+        sa.Column("commission", sa.Float()),
+        sa.Column("strategy", sa.String()),
+        sa.Column("signal_strength", sa.Float()),
+        sa.Column("executed_at", sa.DateTime()),
+    )
+    op.create_index("ix_trades_id", "trades", ["id"])
+    op.create_index("ix_trades_symbol", "trades", ["symbol"])
+
+    op.create_table(
+        "strategies",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String()),
+        sa.Column("description", sa.Text()),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("parameters", sa.Text()),
+        sa.Column("performance_metrics", sa.Text()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+    op.create_index("ix_strategies_id", "strategies", ["id"])
+    op.create_index("ix_strategies_name", "strategies", ["name"], unique=True)
+
+    # As it was before 0001 added the exchange column and the composite key
+    op.create_table(
+        "market_data",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("symbol", sa.String()),
+        sa.Column("timestamp", sa.DateTime()),
+        sa.Column("open_price", sa.Float()),
+        sa.Column("high_price", sa.Float()),
+        sa.Column("low_price", sa.Float()),
+        sa.Column("close_price", sa.Float()),
+        sa.Column("volume", sa.Integer()),
+        sa.Column("timeframe", sa.String()),
+    )
+    op.create_index("ix_market_data_id", "market_data", ["id"])
+    op.create_index("ix_market_data_symbol", "market_data", ["symbol"])
+    op.create_index("ix_market_data_timestamp", "market_data", ["timestamp"])
+
+
+def downgrade():
+    op.drop_table("market_data")
+    op.drop_table("strategies")
+    op.drop_table("trades")
+    op.drop_table("positions")
+    op.drop_table("portfolios")
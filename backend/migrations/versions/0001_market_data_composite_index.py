@@ -0,0 +1,44 @@
+"""Composite (symbol, timeframe, timestamp) key and exchange column for market_data
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = "0000"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("market_data", sa.Column("exchange", sa.String(), nullable=True))
+
+    # Keep the most recently inserted row for any duplicated bar
+    op.execute(
+        """
+        DELETE FROM market_data a
+        USING market_data b
+        WHERE a.id < b.id
+          AND a.symbol = b.symbol
+          AND a.timeframe = b.timeframe
+          AND a.timestamp = b.timestamp
+        """
+    )
+    op.create_unique_constraint(
+        "uq_market_data_symbol_timeframe_timestamp",
+        "market_data",
+        ["symbol", "timeframe", "timestamp"],
+    )
+    # Covered by the leading column of the composite key
+    op.drop_index("ix_market_data_symbol", table_name="market_data")
+
+
+def downgrade():
+    op.create_index("ix_market_data_symbol", "market_data", ["symbol"])
+    op.drop_constraint("uq_market_data_symbol_timeframe_timestamp", "market_data", type_="unique")
+    op.drop_column("market_data", "exchange")
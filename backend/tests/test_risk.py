@@ -0,0 +1,99 @@
+"""RiskEngine's daily-loss halt driven by the valuation book's quote marks.
+
+Run from ``backend/`` with ``python -m pytest``.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from app.services.risk import RiskEngine
+from app.services.valuation import Holding, ValuationService
+
+
+class FakeSubscriptions:
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def tick(self, key, price):
+        ticker = SimpleNamespace(marketPrice=lambda: price)
+        for callback in self.listeners:
+            callback(key, ticker)
+
+
+class FakeClient:
+    def __init__(self):
+        self.subscriptions = FakeSubscriptions()
+        self.streaming = []
+
+    def add_order_listener(self, listener):
+        pass
+
+    async def stream_market_data(self, symbol, exchange):
+        self.streaming.append((symbol, exchange))
+        return True
+
+    def stop_market_data(self, symbol, exchange):
+        self.streaming.remove((symbol, exchange))
+
+
+def fill(symbol, side, shares, price, exec_id):
+    return SimpleNamespace(
+        contract=SimpleNamespace(symbol=symbol, primaryExchange="NASDAQ", exchange="SMART"),
+        execution=SimpleNamespace(execId=exec_id, side=side, shares=shares, price=price),
+    )
+
+
+def book_with(client, cash, holdings):
+    book = ValuationService(client=client, hub=None)
+    book.cash = cash
+    book.holdings = {h.symbol: h for h in holdings}
+    book.market_value = sum(h.market_value for h in holdings)
+    book.cost_basis = sum(h.quantity * h.avg_price for h in holdings)
+    book.loaded = True
+    return book
+
+
+def test_held_positions_are_subscribed_until_flat():
+    async def main():
+        client = FakeClient()
+        book = book_with(client, 10000.0, [Holding("AAPL", "NASDAQ", 10, 100.0, 100.0)])
+        book.start()
+        await asyncio.sleep(0)
+        loaded = list(client.streaming)
+        book.on_execution(None, fill("MSFT", "BOT", 5, 50.0, "e1"))
+        await asyncio.sleep(0)
+        opened = sorted(client.streaming)
+        book.on_execution(None, fill("AAPL", "SLD", 10, 101.0, "e2"))
+        closed = list(client.streaming)
+        await book.stop()
+        return loaded, opened, closed, client.streaming
+
+    loaded, opened, closed, stopped = asyncio.run(main())
+    assert loaded == [("AAPL", "NASDAQ")]
+    assert opened == [("AAPL", "NASDAQ"), ("MSFT", "NASDAQ")]
+    assert closed == [("MSFT", "NASDAQ")]
+    assert stopped == []
+
+
+def test_price_move_on_a_holding_halts_trading():
+    async def main():
+        client = FakeClient()
+        book = book_with(client, 0.0, [Holding("AAPL", "NASDAQ", 100, 100.0, 100.0)])
+        risk = RiskEngine(client=client, book=book, max_daily_loss=0.03)
+        book.start()
+        risk.start()
+        await asyncio.sleep(0)
+        client.subscriptions.tick(("AAPL", "NASDAQ"), 98.0)
+        before = risk.halted
+        client.subscriptions.tick(("AAPL", "NASDAQ"), 96.5)
+        await book.stop()
+        return before, risk
+
+    before, risk = asyncio.run(main())
+    assert before is False
+    assert risk.halted
+    assert risk.halt_reason == "daily loss limit"
+    assert risk.daily_pnl == -350.0
@@ -0,0 +1,179 @@
+"""RequestScheduler and SubscriptionManager against a stand-in for IB.
+
+Run from ``backend/`` with ``python -m pytest``.
+"""
+
+import asyncio
+import itertools
+import time
+from types import SimpleNamespace
+
+from eventkit import Event
+import pytest
+
+from app.brokers.scheduler import RequestScheduler
+from app.brokers.subscriptions import SubscriptionManager
+
+PACING_MESSAGE = "Historical Market Data Service error message:Historical data request pacing violation"
+
+
+class FakeBars(list):
+    """ib_insync's BarDataList: a list that knows its request id."""
+
+    reqId = 0
+
+
+class FakeIB:
+    def __init__(self, paced=()):
+        self.errorEvent = Event("errorEvent")
+        self.sent = []
+        self.cancelled = []
+        # Requests answered with one pacing violation each
+        self.paced = set(paced)
+        self._req_ids = itertools.count(1)
+
+    async def reqHistoricalDataAsync(self, name):
+        self.sent.append(name)
+        bars = FakeBars()
+        bars.reqId = next(self._req_ids)
+        await asyncio.sleep(0.01)
+        if name in self.paced:
+            self.paced.discard(name)
+            # Like ib_insync: the error is an event and the request ends empty
+            self.errorEvent.emit(bars.reqId, 162, PACING_MESSAGE, None)
+            return bars
+        bars.append(name)
+        return bars
+
+    def placeOrder(self, name):
+        self.sent.append(name)
+        return name
+
+    def reqMktData(self, contract):
+        self.sent.append(contract)
+        return SimpleNamespace(updateEvent=Event("updateEvent"))
+
+    def cancelMktData(self, contract):
+        self.cancelled.append(contract)
+
+
+def scheduler(ib, **kwargs) -> RequestScheduler:
+    kwargs.setdefault("limits", {})
+    kwargs.setdefault("message_rate", 0)
+    kwargs.setdefault("backoff", 0.01)
+    sched = RequestScheduler(**kwargs)
+    sched.watch(ib)
+    return sched
+
+
+def test_waiting_orders_go_before_waiting_historical_requests():
+    async def main():
+        ib = FakeIB()
+        sched = scheduler(ib, message_rate=100)
+        history = [
+            asyncio.ensure_future(sched.run("historical_data", ib.reqHistoricalDataAsync, f"h{i}"))
+            for i in range(150)
+        ]
+        await asyncio.sleep(0.05)
+        orders = [asyncio.ensure_future(sched.run("order", ib.placeOrder, f"o{i}")) for i in range(3)]
+        await asyncio.gather(*history, *orders)
+        return ib.sent
+
+    sent = asyncio.run(main())
+    first_order = sent.index("o0")
+    assert sent[first_order:first_order + 3] == ["o0", "o1", "o2"]
+    # The burst of 100 went out at once; the rest of the backlog was still waiting
+    assert len(sent) - first_order - 3 > 30
+    # Within a type requests keep their order
+    assert [name for name in sent if name.startswith("h")] == [f"h{i}" for i in range(150)]
+
+
+def test_identical_requests_in_flight_are_coalesced():
+    async def main():
+        ib = FakeIB()
+        sched = scheduler(ib)
+        results = await asyncio.gather(
+            *(sched.run("historical_data", ib.reqHistoricalDataAsync, "h", key="h") for _ in range(5)),
+            sched.run("historical_data", ib.reqHistoricalDataAsync, "other", key="other"),
+        )
+        return ib.sent, results, sched.coalesced
+
+    sent, results, coalesced = asyncio.run(main())
+    assert sorted(sent) == ["h", "other"]
+    assert results[:5] == [["h"]] * 5
+    assert coalesced == 4
+
+
+def test_bucket_spaces_requests_at_its_rate():
+    async def main():
+        ib = FakeIB()
+        sched = scheduler(ib, limits={"historical_data": (20.0, 1)})
+        started = time.monotonic()
+        await asyncio.gather(*(sched.run("historical_data", ib.reqHistoricalDataAsync, i) for i in range(4)))
+        return time.monotonic() - started
+
+    # A burst of 1, then one every 50 ms
+    assert asyncio.run(main()) >= 0.14
+
+
+def test_only_the_paced_request_is_retried():
+    async def main():
+        ib = FakeIB(paced={"a"})
+        sched = scheduler(ib, retries=2)
+        results = await asyncio.gather(
+            sched.run("historical_data", ib.reqHistoricalDataAsync, "a"),
+            sched.run("historical_data", ib.reqHistoricalDataAsync, "b"),
+        )
+        return ib.sent, results, sched.violations
+
+    sent, results, violations = asyncio.run(main())
+    assert results == [["a"], ["b"]]
+    assert sorted(sent) == ["a", "a", "b"]
+    assert violations == 1
+
+
+def test_retries_stop_after_the_limit():
+    async def main():
+        ib = FakeIB()
+        sched = scheduler(ib, retries=1)
+        ib.paced = {"a"}
+        original = ib.reqHistoricalDataAsync
+
+        async def always_paced(name):
+            ib.paced.add(name)
+            return await original(name)
+
+        result = await sched.run("historical_data", always_paced, "a")
+        return ib.sent, result
+
+    sent, result = asyncio.run(main())
+    assert sent == ["a", "a"]
+    assert result == []
+
+
+def test_concurrent_subscriptions_stay_within_the_line_limit():
+    async def main():
+        ib = FakeIB()
+        # One request every 10 ms, so the later subscriptions wait for their turn
+        manager = SubscriptionManager(ib, max_lines=2, scheduler=scheduler(ib, limits={"market_data": (100.0, 1)}))
+        results = await asyncio.gather(
+            *(manager.acquire(symbol, symbol) for symbol in ("A", "B", "C")), return_exceptions=True
+        )
+        return ib, manager, results
+
+    ib, manager, results = asyncio.run(main())
+    assert len(manager) == 2
+    assert [isinstance(r, RuntimeError) for r in results] == [False, False, True]
+    assert ib.cancelled == ["C"]
+
+
+@pytest.mark.parametrize("code,message,paced", [
+    (162, PACING_MESSAGE, True),
+    (162, "Historical Market Data Service error message:HMDS query returned no data", False),
+    (100, "Max rate of messages per second has been exceeded", True),
+    (200, "No security definition has been found for the request", False),
+])
+def test_pacing_errors_are_told_apart(code, message, paced):
+    sched = scheduler(FakeIB())
+    sched.on_error(1, code, message)
+    assert (sched.violations == 1) is paced
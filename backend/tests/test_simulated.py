@@ -0,0 +1,108 @@
+"""SimulatedIB order matching: price-time priority, partial fills and market crossing.
+
+Run from ``backend/`` with ``python -m pytest``.
+"""
+
+import asyncio
+from datetime import datetime
+import tempfile
+
+from ib_insync import Contract, LimitOrder, MarketOrder
+
+from app.brokers.simulated import SimulatedIB
+from app.services.bar_store import BarStore
+
+
+def broker(price=None) -> SimulatedIB:
+    # An empty store of its own, so nothing is seeded from stored closes
+    sim = SimulatedIB(store=BarStore(tempfile.mkdtemp()), cash=100000.0, spread_bps=0)
+    if price is not None:
+        sim.on_quote("AAPL", price)
+    return sim
+
+
+def place(sim, order):
+    return sim.placeOrder(Contract(symbol="AAPL", exchange="SMART", currency="USD"), order)
+
+
+def fills(trade):
+    return [(fill.execution.shares, fill.execution.price) for fill in trade.fills]
+
+
+def test_bar_range_fills_resting_orders_it_trades_through():
+    async def main():
+        sim = broker(100.0)
+        bid = place(sim, LimitOrder("BUY", 10, 99.0))
+        deep_bid = place(sim, LimitOrder("BUY", 10, 97.0))
+        ask = place(sim, LimitOrder("SELL", 10, 101.0))
+        resting = (bid.orderStatus.status, ask.orderStatus.status)
+        sim.on_bar("AAPL", datetime(2024, 3, 4, 15, 0), 100.0, 101.5, 98.5, 100.0, 1000)
+        await asyncio.sleep(0)
+        return resting, bid, deep_bid, ask
+
+    resting, bid, deep_bid, ask = asyncio.run(main())
+    assert resting == ("Submitted", "Submitted")
+    # Filled at their own limits, not at the bar's extremes
+    assert fills(bid) == [(10, 99.0)]
+    assert fills(ask) == [(10, 101.0)]
+    assert bid.orderStatus.status == ask.orderStatus.status == "Filled"
+    assert deep_bid.fills == []
+    assert deep_bid.orderStatus.status == "Submitted"
+
+
+def test_orders_at_one_price_fill_oldest_first():
+    async def main():
+        sim = broker(100.0)
+        first = place(sim, LimitOrder("SELL", 5, 101.0))
+        second = place(sim, LimitOrder("SELL", 5, 101.0))
+        better = place(sim, LimitOrder("SELL", 3, 100.5))
+        taker = place(sim, LimitOrder("BUY", 10, 101.0))
+        await asyncio.sleep(0)
+        return first, second, better, taker
+
+    first, second, better, taker = asyncio.run(main())
+    # Best price first, then time priority within the 101 level
+    assert fills(taker) == [(3, 100.5), (5, 101.0), (2, 101.0)]
+    assert fills(better) == [(3, 100.5)]
+    assert fills(first) == [(5, 101.0)]
+    assert fills(second) == [(2, 101.0)]
+    assert second.orderStatus.remaining == 3
+    assert second.orderStatus.status == "Submitted"
+
+
+def test_partial_fill_rests_until_the_market_reaches_it():
+    async def main():
+        sim = broker(100.0)
+        bid = place(sim, LimitOrder("BUY", 10, 99.0))
+        offer = place(sim, LimitOrder("SELL", 4, 99.0))
+        partial = (bid.orderStatus.filled, bid.orderStatus.remaining, bid.orderStatus.status)
+        statuses = []
+        sim.orderStatusEvent += lambda trade: statuses.append((trade.order.orderId, trade.orderStatus.status))
+        await asyncio.sleep(0)
+        sim.on_bar("AAPL", datetime(2024, 3, 4, 15, 1), 99.5, 99.5, 98.0, 98.5, 500)
+        await asyncio.sleep(0)
+        return partial, bid, offer, statuses
+
+    partial, bid, offer, statuses = asyncio.run(main())
+    assert partial == (4, 6, "Submitted")
+    assert fills(offer) == [(4, 99.0)]
+    assert fills(bid) == [(4, 99.0), (6, 99.0)]
+    assert bid.orderStatus.status == "Filled"
+    assert bid.orderStatus.avgFillPrice == 99.0
+    assert (bid.order.orderId, "Filled") in statuses
+
+
+def test_market_order_without_a_price_is_rejected():
+    async def main():
+        sim = broker()
+        statuses = []
+        sim.orderStatusEvent += lambda trade: statuses.append(trade.orderStatus.status)
+        trade = place(sim, MarketOrder("BUY", 10))
+        await asyncio.sleep(0)
+        return sim, trade, statuses
+
+    sim, trade, statuses = asyncio.run(main())
+    assert trade.orderStatus.status == "Inactive"
+    assert trade.fills == []
+    assert statuses == ["Inactive"]
+    assert sim.cash == 100000.0